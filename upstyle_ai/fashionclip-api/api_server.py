@@ -1,14 +1,25 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, Form, Header, Query, Request, UploadFile, HTTPException
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 import numpy as np
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import uuid
-import io
 import os
-from PIL import Image
+import hmac
+import json
+from typing import List, Optional
 import logging
+import time
 
 from inference import AttributePredictor
+from preprocessing import decode_image, image_to_tensor, PREPROCESS_VERSION
+from batching import MicroBatcher
+from result_cache import ResultCache, QueryEmbeddingCache
+from vector_index import IndexStore
+import vocabulary
+import metrics
+import upload_stream
 import config
 
 # Setup logging
@@ -32,49 +43,332 @@ app.add_middleware(
 
 # Global model (loaded once at startup)
 predictor = None
+batcher = None
+result_cache = None
+wardrobe = None
+query_cache = None
+
+# Hot-reloadable vocabulary (VOCAB_FILE watcher and /admin/vocabulary)
+vocab_lock = None
+vocab_watcher = None
+vocab_file_mtime = None
+
+# Publishes this worker's /metrics snapshot when METRICS_DIR is set (serve.py)
+metrics_flusher = None
+
+# CPU-bound work never runs on the event loop (ONNX Runtime and PIL release the GIL)
+preprocess_pool = ThreadPoolExecutor(max_workers=config.PREPROCESS_THREADS, thread_name_prefix="preprocess")
+inference_pool = ThreadPoolExecutor(max_workers=config.INFERENCE_THREADS, thread_name_prefix="inference")
+
+def init_predictor():
+    """Loads the model + vocabulary into the module-level predictor."""
+    global predictor
+    logger.info("🚀 Loading FashionCLIP model...")
+    start = time.perf_counter()
+    predictor = AttributePredictor(
+        config.ONNX_MODEL_PATH, config.HF_MODEL_ID,
+        vision_model_path=config.VISION_MODEL_PATH,
+        text_model_path=config.TEXT_MODEL_PATH,
+        intra_op_threads=config.ORT_INTRA_OP_THREADS,
+        optimized_model_dir=config.ORT_OPTIMIZED_DIR or None,
+        session_preset=config.ORT_PRESET,
+        session_overrides=config.ORT_SESSION_OVERRIDES
+    )
+    vocab_start = time.perf_counter()
+    # Runs while the vision session is still being created on its loader thread
+    predictor.precompute_all_attributes(initial_vocabulary(), cache_path=config.VOCAB_CACHE_PATH)
+    vocab_s = time.perf_counter() - vocab_start
+    # Fully loaded before serving (and before serve.py forks workers)
+    predictor.wait_until_loaded()
+    if config.PRELOAD_TEXT_MODEL:
+        # /search text tower: loaded once here, shared by the workers after fork
+        _ = predictor.text_session, predictor.tokenizer
+    total_s = time.perf_counter() - start
+    metrics.MODEL_LOAD_SECONDS.set(vocab_s, "vocabulary")
+    metrics.MODEL_LOAD_SECONDS.set(total_s, "total")
+    logger.info(
+        f"✅ Model loaded successfully in {total_s:.2f}s "
+        f"(vocabulary {vocab_s:.2f}s, results version {predictor.result_version})"
+    )
+
+def initial_vocabulary():
+    """VOCAB_FILE if set and present (last hot-reloaded definition), else config.ATTRIBUTE_CANDIDATES."""
+    global vocab_file_mtime
+    if config.VOCAB_FILE and os.path.exists(config.VOCAB_FILE):
+        vocab_file_mtime = os.stat(config.VOCAB_FILE).st_mtime_ns
+        return vocabulary.load_attribute_file(config.VOCAB_FILE)
+    return config.ATTRIBUTE_CANDIDATES
 
 @app.on_event("startup")
 async def load_model():
     """Load model once when server starts - avoids 27s per request"""
-    global predictor
-    logger.info("🚀 Loading FashionCLIP model...")
+    global batcher, result_cache, wardrobe, query_cache, vocab_lock, vocab_watcher, metrics_flusher
+    # serve.py loads the model once in the parent and forks workers that share it
+    if predictor is None:
+        try:
+            init_predictor()
+        except Exception as e:
+            logger.error(f"❌ Failed to load model: {e}")
+            raise
+    
+    batcher = MicroBatcher(
+        run_inference_batch, config.MAX_BATCH_SIZE, config.MAX_BATCH_WAIT_MS,
+        executor=inference_pool, max_concurrency=config.INFERENCE_THREADS
+    )
+    batcher.start()
+    
+    # Per process: SQLite connections must not cross serve.py's fork
+    if config.RESULT_CACHE_SIZE > 0:
+        result_cache = ResultCache(
+            config.RESULT_CACHE_SIZE, config.RESULT_CACHE_TTL_S, config.RESULT_CACHE_DB or None,
+            sqlite_max_items=config.RESULT_CACHE_DB_MAX_ITEMS
+        )
+    wardrobe = IndexStore(
+        config.INDEX_DIR, max_users=config.INDEX_CACHE_USERS,
+        ivf_threshold=config.INDEX_IVF_THRESHOLD, nprobe=config.INDEX_NPROBE
+    )
+    query_cache = QueryEmbeddingCache(config.QUERY_CACHE_SIZE)
+    vocab_lock = asyncio.Lock()
+    if config.VOCAB_FILE:
+        # Every serve.py worker watches the file, so one admin call reaches them all
+        vocab_watcher = asyncio.create_task(watch_vocabulary_file())
+    if config.METRICS_DIR:
+        metrics.REGISTRY.share(config.METRICS_DIR)
+        metrics_flusher = asyncio.create_task(flush_metrics())
+    logger.info(f"📦 Micro-batching: up to {config.MAX_BATCH_SIZE} images / {config.MAX_BATCH_WAIT_MS}ms")
+    logger.info(
+        f"🧵 Threads: {config.PREPROCESS_THREADS} preprocess, "
+        f"{config.INFERENCE_THREADS} inference x {config.ORT_INTRA_OP_THREADS} ORT ({config.CPU_COUNT} cores, "
+        f"ORT preset {config.ORT_PRESET})"
+    )
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    if vocab_watcher is not None:
+        vocab_watcher.cancel()
+    if metrics_flusher is not None:
+        metrics_flusher.cancel()
+    if batcher is not None:
+        await batcher.stop()
+    preprocess_pool.shutdown(wait=False)
+    inference_pool.shutdown(wait=False)
+
+def process_memory():
+    """RSS/PSS/USS of this process in MB. PSS splits pages shared with other workers."""
     try:
-        predictor = AttributePredictor(config.ONNX_MODEL_PATH, config.HF_MODEL_ID)
-        predictor.precompute_all_attributes(config.ATTRIBUTE_CANDIDATES)
-        logger.info("✅ Model loaded successfully!")
-    except Exception as e:
-        logger.error(f"❌ Failed to load model: {e}")
-        raise
+        import psutil
+        mem = psutil.Process().memory_full_info()
+    except Exception:
+        return None
+    return {
+        "pid": os.getpid(),
+        "rss_mb": round(mem.rss / 1e6, 1),
+        "pss_mb": round(getattr(mem, "pss", 0) / 1e6, 1),
+        "uss_mb": round(getattr(mem, "uss", 0) / 1e6, 1)
+    }
 
-def preprocess_image(image_bytes: bytes) -> np.ndarray:
+def run_inference_batch(images):
     """
-    Convert uploaded image to model-ready numpy array.
-    Replaces your data_pipeline.py logic.
+    One model call for a list of preprocessed (1, 3, 224, 224) images.
+    Returns [(embedding, {attribute: (label, confidence)}), ...] in input order.
     """
-    # Open image
-    img = Image.open(io.BytesIO(image_bytes))
-    
-    # Convert to RGB
-    if img.mode != 'RGB':
-        img = img.convert('RGB')
-    
-    # Resize and crop
-    img = img.resize((config.INPUT_SIZE, config.INPUT_SIZE), Image.BILINEAR)
-    
-    # To numpy
-    img_np = np.array(img, dtype=np.float32)
-    
-    # Normalize (same as your pipeline)
-    img_np = img_np / 255.0
-    img_np = (img_np - np.array(config.CLIP_MEAN)) / np.array(config.CLIP_STD)
+    metrics.BATCH_SIZE.observe(len(images))
+    metrics.BATCHES_IN_FLIGHT.inc()
+    try:
+        with metrics.STAGE_SECONDS.time("embedding"):
+            embeds = predictor.get_image_embeddings(np.concatenate(images, axis=0))
+        with metrics.STAGE_SECONDS.time("classify"):
+            attributes = predictor.classify_batch(embeds)
+    finally:
+        metrics.BATCHES_IN_FLIGHT.dec()
+    return list(zip(embeds, attributes))
+
+def results_version():
+    """Result cache key prefix; changes with the model, vocabulary or preprocessing."""
+    return f"{predictor.result_version}/p{PREPROCESS_VERSION}"
+
+def format_result(filename, raw_attributes, cached=False, item_id=None):
+    """Builds the /analyze response body for one image."""
+    response = {
+        "id": item_id or str(uuid.uuid4()),
+        "filename": filename,
+        "status": "success",
+        "cached": cached
+    }
     
-    # HWC to CHW
-    img_np = np.transpose(img_np, (2, 0, 1))
+    # Add attributes with confidence scores
+    for key, (label, confidence) in raw_attributes.items():
+        response[key] = {
+            "value": label,
+            "confidence": float(confidence)
+        }
+    return response
+
+async def read_uploads(files):
+    """Reads every upload, enforcing MAX_UPLOAD_FILES / MAX_UPLOAD_BYTES for the request."""
+    if len(files) > config.MAX_UPLOAD_FILES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many files: {len(files)} (max {config.MAX_UPLOAD_FILES})"
+        )
     
-    # Add batch dimension
-    img_np = np.expand_dims(img_np, axis=0)
+    payloads = []
+    total = 0
+    for file in files:
+        with metrics.STAGE_SECONDS.time("read"):
+            data = await file.read()
+        total += len(data)
+        if total > config.MAX_UPLOAD_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Upload too large (max {config.MAX_UPLOAD_BYTES // (1024 * 1024)} MB in total)"
+            )
+        payloads.append(data)
+    return payloads
+
+def validate_upload(file):
+    if not (file.content_type or "").startswith('image/'):
+        raise ValueError(f"Invalid file type: {file.content_type}")
+
+def preprocess_timed(image_bytes):
+    """preprocessing.preprocess_image, recording the decode and resize/normalize stages."""
+    t0 = time.perf_counter()
+    img = decode_image(image_bytes)
+    t1 = time.perf_counter()
+    image_np = image_to_tensor(img)
+    metrics.STAGE_SECONDS.observe(t1 - t0, "decode")
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - t1, "preprocess")
+    return image_np
+
+async def decode_upload(file, image_bytes):
+    """Validates and preprocesses one upload on the preprocess pool."""
+    validate_upload(file)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(preprocess_pool, preprocess_timed, image_bytes)
+
+async def cache_lookup(image_bytes):
+    """Returns (key, cached value or None); (None, None) when caching is off."""
+    if result_cache is None:
+        return None, None
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(preprocess_pool, result_cache.lookup, image_bytes, results_version())
+
+def cache_store(key, embedding, raw_attributes):
+    """Stores a result in the background; the response never waits for it."""
+    if key is not None:
+        future = asyncio.get_running_loop().run_in_executor(
+            preprocess_pool, result_cache.put, key, embedding, raw_attributes
+        )
+        future.add_done_callback(log_cache_store_error)
+
+def log_cache_store_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"❌ Result cache store failed: {future.exception()!r}")
+
+async def analyze_upload(file, image_bytes):
+    """
+    Per-image path shared by the endpoints: cache lookup, decode, micro-batched
+    inference, cache store. Returns (embedding, raw_attributes, cached).
+    """
+    validate_upload(file)
+    key, hit = await cache_lookup(image_bytes)
+    if hit is not None:
+        metrics.IMAGES.inc("cached")
+        return hit["embedding"], hit["attributes"], True
     
-    return img_np.astype(np.float32)
+    image_np = await decode_upload(file, image_bytes)
+    embedding, raw_attributes = await batcher.submit(image_np)
+    metrics.IMAGES.inc("inferred")
+    cache_store(key, embedding, raw_attributes)
+    return embedding, raw_attributes, False
+
+async def index_item(user_id, result, embedding, raw_attributes):
+    """Adds an analyzed image to the user's wardrobe index, keyed by the response 'id'."""
+    if not user_id:
+        return
+    meta = {
+        "filename": result["filename"],
+        "attributes": {name: label for name, (label, _) in raw_attributes.items()}
+    }
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(preprocess_pool, wardrobe.add, user_id, result["id"], embedding, meta)
+
+async def index_entry(user_id, result, embedding, raw_attributes):
+    """
+    index_item for one entry of a multi-image response: a failure is recorded on
+    that entry ('index_error') instead of failing the image or the request.
+    """
+    try:
+        await index_item(user_id, result, embedding, raw_attributes)
+    except Exception as e:
+        logger.error(f"❌ Wardrobe index error ({result['filename']}): {e!r}")
+        result["index_error"] = str(e)
+
+def encode_query(text):
+    """Runs the text tower on one query (inference pool). Returns (embedding, encode_ms)."""
+    t = time.perf_counter()
+    embedding = predictor.encode_prompts([text])[text]
+    return embedding, (time.perf_counter() - t) * 1000.0
+
+async def reload_vocabulary(attribute_dict):
+    """
+    Builds the new vocabulary on the inference pool (encoding only new prompts) and
+    swaps it in. Requests already running finish on the old one; results get a new
+    results_version, so the result cache never mixes the two.
+    """
+    async with vocab_lock:
+        old_version = predictor.vocab_version
+        loop = asyncio.get_running_loop()
+        encoded = await loop.run_in_executor(
+            inference_pool, predictor.precompute_all_attributes, attribute_dict, config.VOCAB_CACHE_PATH
+        )
+        logger.info(f"🔄 Vocabulary {old_version} -> {predictor.vocab_version} ({encoded} new prompts encoded)")
+        return encoded
+
+def write_vocabulary_file(attribute_dict):
+    """Atomically replaces VOCAB_FILE; returns its new mtime."""
+    tmp_path = config.VOCAB_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(attribute_dict, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, config.VOCAB_FILE)
+    return os.stat(config.VOCAB_FILE).st_mtime_ns
+
+async def watch_vocabulary_file():
+    global vocab_file_mtime
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(config.VOCAB_WATCH_INTERVAL)
+        try:
+            mtime = await loop.run_in_executor(None, lambda: os.stat(config.VOCAB_FILE).st_mtime_ns)
+            if mtime == vocab_file_mtime:
+                continue
+            vocab_file_mtime = mtime
+            attribute_dict = await loop.run_in_executor(None, vocabulary.load_attribute_file, config.VOCAB_FILE)
+            await reload_vocabulary(attribute_dict)
+        except FileNotFoundError:
+            continue
+        except Exception as e:
+            logger.error(f"❌ Vocabulary reload from {config.VOCAB_FILE} failed: {e}")
+
+async def flush_metrics():
+    """Publishes this worker's metrics to METRICS_DIR for scrapes answered by another worker."""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, metrics.REGISTRY.flush)
+        except Exception as e:
+            logger.error(f"❌ Metrics flush to {config.METRICS_DIR} failed: {e}")
+        await asyncio.sleep(config.METRICS_FLUSH_INTERVAL)
+
+def vocabulary_info():
+    vocab = predictor.vocab
+    return {
+        "version": vocab.version,
+        "attributes": len(vocab),
+        "labels": len(vocab.labels),
+        "results_version": results_version(),
+        "file": config.VOCAB_FILE or None
+    }
 
 @app.get("/")
 async def root():
@@ -87,19 +381,55 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Detailed health check"""
+    """Detailed health check. Never blocks the event loop: probes must stay fast under load."""
     if predictor is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
-    return {"status": "healthy", "model": "ready"}
+    # psutil reads /proc/<pid>/smaps; default executor so it does not queue behind image work
+    memory = await asyncio.get_running_loop().run_in_executor(None, process_memory)
+    return {
+        "status": "healthy",
+        "model": "ready",
+        "vocabulary": vocabulary_info(),
+        "batching": batcher.stats(),
+        "threads": {
+            "cpu_count": config.CPU_COUNT,
+            "preprocess": config.PREPROCESS_THREADS,
+            "inference": config.INFERENCE_THREADS,
+            "ort_intra_op": config.ORT_INTRA_OP_THREADS
+        },
+        "ort_session": predictor.session_settings,
+        "memory": memory,
+        "result_cache": result_cache.stats() if result_cache else None,
+        "wardrobe_index": wardrobe.stats(),
+        "query_cache": query_cache.stats()
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Prometheus scrape endpoint: per-stage latency histograms, request/image counters, gauges.
+    Series are labelled by worker pid; with METRICS_DIR (set by serve.py) one scrape
+    returns every worker's series, otherwise only those of the worker that answered.
+    """
+    if batcher is not None:
+        metrics.BATCH_QUEUE.set(batcher.stats()["queued"])
+    content = await asyncio.get_running_loop().run_in_executor(None, metrics.REGISTRY.render)
+    return Response(content=content, media_type=metrics.CONTENT_TYPE)
 
 @app.post("/analyze")
-async def analyze_fashion_image(file: UploadFile = File(...)):
+async def analyze_fashion_image(
+    file: UploadFile = File(...),
+    user_id: Optional[str] = Form(None),
+    item_id: Optional[str] = Form(None)
+):
     """
     Main endpoint: Upload image, get fashion attributes JSON
     
     Usage from mobile:
     POST https://your-api-url.com/analyze
     Body: multipart/form-data with 'file' field
+    With a 'user_id' field the item is also added to that user's wardrobe index
+    (under 'item_id' if given, else the returned 'id') for /similar.
     """
     if predictor is None:
         raise HTTPException(status_code=503, detail="Model not initialized")
@@ -113,37 +443,332 @@ async def analyze_fashion_image(file: UploadFile = File(...)):
     
     try:
         # Read image
-        image_bytes = await file.read()
+        with metrics.STAGE_SECONDS.time("read"):
+            image_bytes = await file.read()
         logger.info(f"📸 Processing: {file.filename} ({len(image_bytes)} bytes)")
         
-        # Preprocess
-        image_np = preprocess_image(image_bytes)
+        # Cache lookup, then decode + micro-batched inference off the event loop
+        img_vector, raw_attributes, cached = await analyze_upload(file, image_bytes)
         
-        # Run inference (same as your main.py)
-        img_vector = predictor.get_image_embedding(image_np)
-        raw_attributes = predictor.classify_all(img_vector)
+        # Format response (the wardrobe update is not part of the serialize stage)
+        t = time.perf_counter()
+        response = format_result(file.filename, raw_attributes, cached, item_id)
+        serialize_s = time.perf_counter() - t
+        await index_item(user_id, response, img_vector, raw_attributes)
         
-        # Format response
-        response = {
-            "id": str(uuid.uuid4()),
-            "filename": file.filename,
-            "status": "success"
-        }
-        
-        # Add attributes with confidence scores
-        for key, (label, confidence) in raw_attributes.items():
-            response[key] = {
-                "value": label,
-                "confidence": float(confidence)
-            }
-        
-        logger.info(f"✅ Done: {response['category']['value']}")
-        return JSONResponse(content=response)
+        logger.info(f"✅ Done: {response.get('category', {}).get('value')}")
+        t = time.perf_counter()
+        json_response = JSONResponse(content=response)
+        metrics.STAGE_SECONDS.observe(serialize_s + time.perf_counter() - t, "serialize")
+        return json_response
         
     except Exception as e:
+        metrics.IMAGES.inc("error")
         logger.error(f"❌ Error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/analyze/batch")
+async def analyze_fashion_batch(files: List[UploadFile] = File(...), user_id: Optional[str] = Form(None)):
+    """
+    Analyze many images in one request.
+    
+    Body: multipart/form-data with a repeated 'files' field.
+    Cached images are answered directly; the rest are decoded in parallel and
+    go through the shared micro-batcher, so a large upload is split into
+    MAX_BATCH_SIZE model calls and queues fairly with concurrent /analyze calls.
+    Every file gets its own entry in 'results' (same order as uploaded);
+    a file that cannot be decoded only fails its own entry.
+    With 'user_id', successful items are added to that user's wardrobe index; an
+    entry that could not be indexed keeps its result and gets an 'index_error'.
+    """
+    if predictor is None:
+        raise HTTPException(status_code=503, detail="Model not initialized")
+    
+    payloads = await read_uploads(files)
+    logger.info(f"📸 Batch: {len(files)} files ({sum(map(len, payloads))} bytes)")
+    
+    results = [None] * len(files)
+    valid = []
+    for i, file in enumerate(files):
+        try:
+            validate_upload(file)  # Before the cache: a non-image never gets hashed or answered
+            valid.append(i)
+        except ValueError as e:
+            metrics.IMAGES.inc("error")
+            results[i] = {"index": i, "filename": file.filename, "status": "error", "error": str(e)}
+    
+    lookups = await asyncio.gather(*(cache_lookup(payloads[i]) for i in valid))
+    keys = {}
+    misses = []
+    for i, (key, hit) in zip(valid, lookups):
+        keys[i] = key
+        if hit is not None:
+            metrics.IMAGES.inc("cached")
+            results[i] = {"index": i, **format_result(files[i].filename, hit["attributes"], cached=True)}
+            await index_entry(user_id, results[i], hit["embedding"], hit["attributes"])
+        else:
+            misses.append(i)
+    
+    decoded = await asyncio.gather(
+        *(decode_upload(files[i], payloads[i]) for i in misses),
+        return_exceptions=True
+    )
+    
+    ok, images = [], []
+    for i, item in zip(misses, decoded):
+        if isinstance(item, Exception):
+            metrics.IMAGES.inc("error")
+            results[i] = {"index": i, "filename": files[i].filename, "status": "error", "error": str(item)}
+        else:
+            ok.append(i)
+            images.append(item)
+    
+    outputs = await asyncio.gather(*(batcher.submit(image) for image in images), return_exceptions=True)
+    for i, output in zip(ok, outputs):
+        if isinstance(output, Exception):
+            logger.error(f"❌ Batch inference error ({files[i].filename}): {str(output)}")
+            metrics.IMAGES.inc("error")
+            results[i] = {"index": i, "filename": files[i].filename, "status": "error", "error": str(output)}
+            continue
+        embedding, raw_attributes = output
+        metrics.IMAGES.inc("inferred")
+        cache_store(keys[i], embedding, raw_attributes)
+        results[i] = {"index": i, **format_result(files[i].filename, raw_attributes)}
+        await index_entry(user_id, results[i], embedding, raw_attributes)
+    
+    succeeded = len([r for r in results if r["status"] == "success"])
+    logger.info(f"✅ Batch done: {succeeded}/{len(files)} succeeded")
+    with metrics.STAGE_SECONDS.time("serialize"):
+        return JSONResponse(content={
+            "count": len(files),
+            "succeeded": succeeded,
+            "failed": len(files) - succeeded,
+            "results": results
+        })
+
+@app.post("/analyze/stream")
+async def analyze_fashion_stream(request: Request, user_id: Optional[str] = Query(None)):
+    """
+    Streaming variant of /analyze/batch for large imports (100+ photos).
+    
+    Body: multipart/form-data with repeated 'files' parts, as /analyze/batch.
+    Parts are read as they arrive and dispatched right away: at most a few
+    batches' worth of images are held in memory, and the body is not read
+    further while they are all in flight. Limits are STREAM_MAX_FILES /
+    STREAM_MAX_MB, not the /analyze/batch ones.
+    
+    Returns application/x-ndjson: one JSON line per image, written as soon as
+    that image is done (completion order, not upload order). Every line carries
+    the upload 'index'. Images go through the shared micro-batcher, so a slow
+    image never holds back the others. 'user_id' (query parameter, or a form
+    field) works as in /analyze/batch; images finished before a 'user_id' field
+    arrives are indexed once it does. A body that breaks a limit or cannot be
+    parsed ends the stream with a line {"status": "error", "error": ...}
+    without 'index'.
+    """
+    if predictor is None:
+        raise HTTPException(status_code=503, detail="Model not initialized")
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith("multipart/form-data"):
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data")
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > config.STREAM_MAX_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Upload too large (max {config.STREAM_MAX_BYTES // (1024 * 1024)} MB in total)"
+        )
+    
+    # Enough images in flight to keep every batch full, without decoding all at once
+    in_flight = asyncio.Semaphore(2 * max(config.MAX_BATCH_SIZE * config.INFERENCE_THREADS, config.PREPROCESS_THREADS))
+    lines = asyncio.Queue()
+    end_of_body = object()
+    owner = {"user_id": user_id, "unindexed": []}
+    tasks = set()
+    
+    async def analyze_one(index, part):
+        try:
+            try:
+                image_bytes, part.data = bytes(part.data), None  # Release the buffer early
+                embedding, raw_attributes, cached = await analyze_upload(part, image_bytes)
+            except Exception as e:
+                metrics.IMAGES.inc("error")
+                await lines.put({"index": index, "filename": part.filename, "status": "error", "error": str(e)})
+                return
+            result = {"index": index, **format_result(part.filename, raw_attributes, cached)}
+            if owner["user_id"]:
+                await index_entry(owner["user_id"], result, embedding, raw_attributes)
+            else:
+                owner["unindexed"].append((result, embedding, raw_attributes))
+            await lines.put(result)
+        finally:
+            in_flight.release()
+    
+    async def read_body():
+        """Dispatches file parts as they complete; returns the number of files."""
+        count = 0
+        try:
+            parts = upload_stream.iter_parts(
+                content_type, request.stream(), config.STREAM_MAX_FILES, config.STREAM_MAX_BYTES
+            )
+            async for part in parts:
+                if not part.is_file:
+                    if part.name == "user_id" and not owner["user_id"] and part.text():
+                        owner["user_id"] = part.text()
+                        for result, embedding, raw_attributes in owner["unindexed"]:
+                            await index_entry(owner["user_id"], result, embedding, raw_attributes)
+                        owner["unindexed"].clear()
+                    continue
+                await in_flight.acquire()  # Backpressure: the rest of the body waits
+                tasks.add(asyncio.create_task(analyze_one(count, part)))
+                count += 1
+        except Exception as e:  # UploadError, ClientDisconnect
+            logger.error(f"❌ Stream upload stopped after {count} files: {e}")
+            await lines.put({"status": "error", "error": str(e)})
+        finally:
+            await lines.put((end_of_body, count))
+    
+    async def ndjson_lines():
+        reader = asyncio.create_task(read_body())
+        emitted, total = 0, None
+        try:
+            while total is None or emitted < total:
+                item = await lines.get()
+                if isinstance(item, tuple) and item[0] is end_of_body:
+                    total = item[1]
+                    continue
+                emitted += "index" in item
+                with metrics.STAGE_SECONDS.time("serialize"):
+                    line = json.dumps(item) + "\n"
+                yield line
+            logger.info(f"✅ Stream done: {total} files")
+        finally:
+            # Client disconnected: stop work that nobody will read
+            reader.cancel()
+            for task in tasks:
+                task.cancel()
+    
+    return upload_stream.BodyStreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+@app.get("/similar")
+async def similar_items(user_id: str, item_id: str, k: int = Query(10, ge=1, le=100)):
+    """
+    The k wardrobe items most similar to item_id (cosine similarity of image embeddings).
+    
+    Usage: GET /similar?user_id=u1&item_id=<id from /analyze>&k=5
+    """
+    def search():
+        # Off the event loop: may load the index from disk or (re)build the IVF cells
+        index = wardrobe.get(user_id)
+        if index is None or item_id not in index:
+            return None
+        return index.search(index.vector(item_id), k, exclude=item_id)
+    
+    hits = await asyncio.get_running_loop().run_in_executor(preprocess_pool, search)
+    if hits is None:
+        raise HTTPException(status_code=404, detail=f"Unknown item: {item_id}")
+    return {
+        "user_id": user_id,
+        "item_id": item_id,
+        "results": [
+            {"item_id": hit_id, "score": round(score, 4), **meta}
+            for hit_id, score, meta in hits
+        ]
+    }
+
+@app.get("/search")
+async def search_wardrobe(
+    request: Request,
+    user_id: str,
+    q: str = Query(..., min_length=1, max_length=200),
+    k: int = Query(10, ge=1, le=100)
+):
+    """
+    Free-text wardrobe search: ranks the user's items by similarity between the
+    query's text embedding and each item's image embedding.
+    
+    Usage: GET /search?user_id=u1&q=black leather jacket&category=jacket
+    Any other query parameter named after an attribute (category, primary_color, ...)
+    keeps only items classified with that label.
+    """
+    if predictor is None:
+        raise HTTPException(status_code=503, detail="Model not initialized")
+    
+    filters = {}
+    for name, label in request.query_params.items():
+        if name in ("user_id", "q", "k"):
+            continue
+        vocab = predictor.vocab
+        if name not in vocab.names or label not in vocab.candidates(name):
+            raise HTTPException(status_code=400, detail=f"Unknown filter: {name}={label}")
+        filters[name] = label
+    
+    t0 = time.perf_counter()
+    text = query_cache.normalize(q)
+    embedding = query_cache.get(text)
+    cached = embedding is not None
+    loop = asyncio.get_running_loop()
+    if not cached:
+        # Same pool as image inference: the text tower shares the ORT thread budget
+        embedding, encode_ms = await loop.run_in_executor(inference_pool, encode_query, text)
+        query_cache.put(text, embedding, encode_ms)
+    t1 = time.perf_counter()
+    
+    def search():
+        index = wardrobe.get(user_id)
+        return [] if index is None else index.search(embedding, k, filters=filters)
+    
+    hits = await loop.run_in_executor(preprocess_pool, search)
+    t2 = time.perf_counter()
+    
+    timing = {"encode_ms": round((t1 - t0) * 1000.0, 2), "search_ms": round((t2 - t1) * 1000.0, 2)}
+    logger.info(f"🔎 Search '{text}' ({'cached' if cached else 'cold'}): {timing}")
+    return {
+        "user_id": user_id,
+        "query": text,
+        "filters": filters,
+        "query_cached": cached,
+        "timing": timing,
+        "results": [
+            {"item_id": hit_id, "score": round(score, 4), **meta}
+            for hit_id, score, meta in hits
+        ]
+    }
+
+@app.post("/admin/vocabulary")
+async def update_vocabulary(request: Request, x_admin_token: Optional[str] = Header(None)):
+    """
+    Replaces the attribute vocabulary without a restart.
+    
+    Body: JSON in ATTRIBUTE_CANDIDATES form, {"category": ["t-shirt", ...], ...}
+    Header: X-Admin-Token: <ADMIN_TOKEN>
+    With VOCAB_FILE set the definition is also written there: the other serve.py
+    workers pick it up within VOCAB_WATCH_INTERVAL and it survives restarts.
+    """
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin API disabled (set ADMIN_TOKEN)")
+    if not hmac.compare_digest(x_admin_token or "", config.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    if predictor is None:
+        raise HTTPException(status_code=503, detail="Model not initialized")
+    
+    try:
+        attribute_dict = vocabulary.parse_attribute_dict(await request.json())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    global vocab_file_mtime
+    if config.VOCAB_FILE:
+        # Our own watcher can skip the file we just wrote
+        vocab_file_mtime = await asyncio.get_running_loop().run_in_executor(
+            None, write_vocabulary_file, attribute_dict
+        )
+    
+    encoded = await reload_vocabulary(attribute_dict)
+    return {"encoded_prompts": encoded, "vocabulary": vocabulary_info()}
+
+# Added last so every route above is a known endpoint label
+app.add_middleware(metrics.RequestMetricsMiddleware, endpoints=[route.path for route in app.routes])
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8080))
@@ -0,0 +1,124 @@
+# batching.py
+"""
+Dynamic micro-batching for the API.
+Concurrent requests are queued and grouped into one batched model call: a batch is
+dispatched as soon as max_batch_size items are waiting, or max_wait_ms after the
+first item arrived, whichever comes first. Each caller gets back its own result.
+Batches run on an executor so the event loop stays free; at most max_concurrency
+batches are in flight and the next batch keeps filling up while they run.
+"""
+import asyncio
+from collections import deque
+
+
+class MicroBatcher:
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=5.0, executor=None, max_concurrency=1):
+        """
+        run_batch: callable(list of items) -> list of results, same length and order.
+        executor: concurrent.futures executor for run_batch (None = loop default).
+        """
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.executor = executor
+        self.max_concurrency = max(1, int(max_concurrency))
+
+        self._pending = deque()
+        self._has_items = None
+        self._full = None
+        self._slots = None
+        self._task = None
+        self._inflight = set()
+
+        # --- Stats ---
+        self.batches = 0
+        self.items = 0
+
+    def start(self):
+        """Starts the dispatch loop. Must be called from the running event loop."""
+        self._has_items = asyncio.Event()
+        self._full = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._task = asyncio.get_running_loop().create_task(self._dispatch_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        while self._pending:
+            _, fut = self._pending.popleft()
+            if not fut.done():
+                fut.set_exception(RuntimeError("Batcher stopped"))
+
+    async def submit(self, item):
+        """Queues one item and waits for its result."""
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((item, fut))
+        self._has_items.set()
+        if len(self._pending) >= self.max_batch_size:
+            self._full.set()
+        return await fut
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_concurrency": self.max_concurrency,
+            "queued": len(self._pending),
+            "batches": self.batches,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
+
+    async def _dispatch_loop(self):
+        while True:
+            await self._has_items.wait()
+            # Wait for a free slot first, so the batch keeps growing meanwhile
+            await self._slots.acquire()
+
+            # Give concurrent requests a short window to join the batch
+            if len(self._pending) < self.max_batch_size and self.max_wait > 0:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.max_wait)
+                except asyncio.TimeoutError:
+                    pass
+
+            n = min(len(self._pending), self.max_batch_size)
+            batch = [self._pending.popleft() for _ in range(n)]
+            if not self._pending:
+                self._has_items.clear()
+            if len(self._pending) < self.max_batch_size:
+                self._full.clear()
+
+            # Skip callers that went away while waiting
+            batch = [(item, fut) for item, fut in batch if not fut.done()]
+            if not batch:
+                self._slots.release()
+                continue
+
+            task = asyncio.get_running_loop().create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, self.run_batch, [item for item, _ in batch])
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+
+        self.batches += 1
+        self.items += len(batch)
+        for (_, fut), result in zip(batch, results):
+            if not fut.done():
+                fut.set_result(result)
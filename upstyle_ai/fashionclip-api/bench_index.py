@@ -0,0 +1,89 @@
+# bench_index.py
+"""
+Latency / recall benchmark for vector_index.py: exact search vs IVF at several
+nprobe settings. Vectors are synthetic clustered unit vectors (clothes form
+clusters in CLIP space; uniform random vectors would make IVF look worse than
+it is), or real embeddings from --embeddings (an (N, 512) .npy, tiled as needed).
+
+    python bench_index.py                        # 1k, 100k, 1M
+    python bench_index.py --sizes 1000 100000 --nprobe 4 8 16
+
+1M x 512 float32 is 2 GB; the IVF index keeps a second, cell-ordered copy.
+"""
+import argparse
+import time
+import numpy as np
+from vector_index import ExactIndex, IVFIndex
+
+
+def synthetic(n, dim=512, n_clusters=2000, spread=0.6, seed=0, chunk=100000):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    out = np.empty((n, dim), dtype=np.float32)
+    for lo in range(0, n, chunk):
+        hi = min(lo + chunk, n)
+        x = centers[rng.integers(0, n_clusters, hi - lo)]
+        x = x + rng.standard_normal(x.shape).astype(np.float32) * (spread / np.sqrt(dim))
+        out[lo:hi] = x / np.linalg.norm(x, axis=1, keepdims=True)
+    return out
+
+
+def from_file(path, n, seed=0):
+    base = np.load(path).astype(np.float32)
+    reps = -(-n // len(base))
+    # Tiled copies get a little noise so they are not exact duplicates
+    rng = np.random.default_rng(seed)
+    x = np.tile(base, (reps, 1))[:n]
+    x[len(base):] += rng.standard_normal(x[len(base):].shape).astype(np.float32) * 0.01
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def timed(fn, queries):
+    """Mean ms per query and the list of results."""
+    fn(queries[0])  # Warm-up
+    t = time.perf_counter()
+    results = [fn(q) for q in queries]
+    return (time.perf_counter() - t) / len(queries) * 1000.0, results
+
+
+def bench(vectors, queries, k, nprobes):
+    n = len(vectors)
+    exact = ExactIndex(vectors.shape[1])
+    exact.add(vectors)
+    exact_ms, truth = timed(lambda q: exact.search(q, k)[0], queries)
+    print(f"\n📦 {n:,} items")
+    print(f"   exact              {exact_ms:8.2f} ms/query   recall@{k} 1.000")
+
+    t = time.perf_counter()
+    ivf = IVFIndex(vectors)
+    build_s = time.perf_counter() - t
+    print(f"   IVF build          {build_s:8.1f} s ({ivf.n_cells} cells)")
+
+    for nprobe in nprobes:
+        ms, found = timed(lambda q: ivf.search(q, k, nprobe)[0], queries)
+        recall = np.mean([len(np.intersect1d(f, ref)) / len(ref) for f, ref in zip(found, truth)])
+        print(f"   IVF nprobe={nprobe:<4}    {ms:8.2f} ms/query   recall@{k} {recall:.3f}   ({exact_ms / ms:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark wardrobe similarity search.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--embeddings", default=None, help="(N, 512) .npy of real image embeddings")
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        vectors = from_file(args.embeddings, n) if args.embeddings else synthetic(n)
+        # Queries are perturbed copies of stored items ("more like this one")
+        rng = np.random.default_rng(1)
+        queries = vectors[rng.choice(n, min(args.queries, n), replace=False)]
+        queries = queries + rng.standard_normal(queries.shape).astype(np.float32) * 0.01
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        bench(vectors, queries, args.k, args.nprobe)
+
+
+if __name__ == "__main__":
+    main()
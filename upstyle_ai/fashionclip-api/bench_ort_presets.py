@@ -0,0 +1,123 @@
+# bench_ort_presets.py
+"""
+Sweeps the ONNX Runtime session presets (inference.SESSION_PRESETS) on this
+machine and recommends one. Each preset runs in a fresh interpreter with
+ORT_PRESET set, so thread counts (config.INFERENCE_THREADS /
+ORT_INTRA_OP_THREADS) follow the preset exactly as in api_server.py:
+
+- latency:    single-image embedding + classify, p50 / p95 ms
+- throughput: INFERENCE_THREADS threads running --batch-size batches, images/s
+- memory:     peak RSS after both
+
+    python bench_ort_presets.py --goal throughput --batch-size 8
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+WORKER = r"""
+import json, resource, sys, time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import config
+from inference import AttributePredictor
+n_single, batch_size, n_batches = int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3])
+t = time.perf_counter()
+predictor = AttributePredictor(
+    config.ONNX_MODEL_PATH, config.HF_MODEL_ID,
+    vision_model_path=config.VISION_MODEL_PATH, text_model_path=config.TEXT_MODEL_PATH,
+    intra_op_threads=config.ORT_INTRA_OP_THREADS, optimized_model_dir=config.ORT_OPTIMIZED_DIR or None,
+    session_preset=config.ORT_PRESET, session_overrides=config.ORT_SESSION_OVERRIDES
+)
+predictor.precompute_all_attributes(config.ATTRIBUTE_CANDIDATES, cache_path=config.VOCAB_CACHE_PATH)
+predictor.wait_until_loaded()
+load_s = time.perf_counter() - t
+
+rng = np.random.default_rng(0)
+single = rng.standard_normal((1, 3, 224, 224)).astype(np.float32)
+batch = rng.standard_normal((batch_size, 3, 224, 224)).astype(np.float32)
+predictor.classify_batch(predictor.get_image_embeddings(single))  # Warm-up
+
+latencies = []
+for _ in range(n_single):
+    t = time.perf_counter()
+    predictor.classify_batch(predictor.get_image_embeddings(single))
+    latencies.append((time.perf_counter() - t) * 1000.0)
+
+def run_batch(_):
+    predictor.classify_batch(predictor.get_image_embeddings(batch))
+
+with ThreadPoolExecutor(max_workers=config.INFERENCE_THREADS) as pool:
+    list(pool.map(run_batch, range(config.INFERENCE_THREADS)))  # Warm-up per thread
+    t = time.perf_counter()
+    list(pool.map(run_batch, range(n_batches)))
+    elapsed = time.perf_counter() - t
+
+print(json.dumps({
+    "settings": predictor.session_settings,
+    "inference_threads": config.INFERENCE_THREADS,
+    "load_s": load_s,
+    "p50_ms": float(np.percentile(latencies, 50)),
+    "p95_ms": float(np.percentile(latencies, 95)),
+    "images_per_s": n_batches * batch_size / elapsed,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+}))
+"""
+
+# goal -> (result key, higher is better)
+GOALS = {"latency": ("p95_ms", False), "throughput": ("images_per_s", True), "memory": ("peak_rss_mb", False)}
+
+
+def measure(preset, args):
+    env = dict(os.environ, ORT_PRESET=preset)
+    out = subprocess.run(
+        [sys.executable, "-c", WORKER, str(args.single), str(args.batch_size), str(args.batches)],
+        check=True, capture_output=True, text=True, env=env,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def best_preset(results, goal):
+    key, higher = GOALS[goal]
+    return (max if higher else min)(results, key=lambda name: results[name][key])
+
+
+def main():
+    from inference import SESSION_PRESETS
+    parser = argparse.ArgumentParser(description="Benchmark the ORT session presets and recommend one.")
+    parser.add_argument("--presets", nargs="+", choices=sorted(SESSION_PRESETS), default=list(SESSION_PRESETS))
+    parser.add_argument("--goal", choices=sorted(GOALS), default="latency",
+                        help="What the recommendation optimizes for")
+    parser.add_argument("--single", type=int, default=50, help="Single-image runs for p50/p95")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--batches", type=int, default=40, help="Batches for the throughput run")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    for preset in args.presets:
+        print(f"⏱️  {preset}...")
+        results[preset] = measure(preset, args)
+
+    print(f"\n{'preset':<12}{'threads':>9}{'load s':>8}{'p50 ms':>9}{'p95 ms':>9}{'img/s':>9}{'RSS MB':>9}")
+    for name, r in results.items():
+        threads = f"{r['inference_threads']}x{r['settings']['intra_op_threads'] or 'all'}"
+        print(f"{name:<12}{threads:>9}{r['load_s']:>8.2f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}"
+              f"{r['images_per_s']:>9.1f}{r['peak_rss_mb']:>9.0f}")
+
+    print()
+    for goal in GOALS:
+        print(f"   best for {goal:<11} {best_preset(results, goal)}")
+    print(f"\n✅ Recommended ({args.goal}): ORT_PRESET={best_preset(results, args.goal)}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"goal": args.goal, "recommended": best_preset(results, args.goal), "results": results},
+                      f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# bench_preprocess.py
+"""
+Benchmarks preprocessing.preprocess_image against the old squash implementation
+and checks both against the MindSpore pipeline in data_pipeline.py (if
+MindSpore is installed). MindSpore's Decode ignores EXIF orientation, so
+rotated phone photos are expected to differ.
+
+    python bench_preprocess.py --images ../clothes_data/imgs
+"""
+import argparse
+import os
+import time
+import numpy as np
+from preprocessing import preprocess_image, preprocess_image_squash
+
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+
+
+def time_fn(fn, payloads, repeat):
+    """Median per-image latency in ms over `repeat` passes."""
+    fn(payloads[0])  # Warm-up
+    runs = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        for data in payloads:
+            fn(data)
+        runs.append((time.perf_counter() - t) / len(payloads) * 1000.0)
+    return float(np.median(runs))
+
+
+def mindspore_reference(paths):
+    try:
+        from data_pipeline import create_batch_pipeline
+    except ImportError as e:
+        print(f"⚠️  MindSpore pipeline unavailable ({e}); skipping parity check")
+        return None
+    iterator = create_batch_pipeline(paths).create_dict_iterator(output_numpy=True)
+    return [batch['image'] for batch in iterator]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API image preprocessing.")
+    parser.add_argument("--images", required=True, help="Folder of test images")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    paths = sorted(
+        os.path.join(args.images, f) for f in os.listdir(args.images)
+        if f.lower().endswith(IMAGE_EXTS)
+    )[:args.limit]
+    if not paths:
+        raise SystemExit(f"❌ No images found in {args.images}")
+    payloads = []
+    for p in paths:
+        with open(p, 'rb') as f:
+            payloads.append(f.read())
+    mb = sum(map(len, payloads)) / len(payloads) / 1e6
+    print(f"📸 {len(paths)} images, avg {mb:.2f} MB encoded")
+
+    squash_ms = time_fn(preprocess_image_squash, payloads, args.repeat)
+    fast_ms = time_fn(preprocess_image, payloads, args.repeat)
+    print("\n⏱️  Latency per image (median of passes)")
+    print(f"   squash (old): {squash_ms:8.2f} ms")
+    print(f"   fast:         {fast_ms:8.2f} ms   ({squash_ms / fast_ms:.1f}x)")
+
+    reference = mindspore_reference(paths)
+    if reference is None:
+        return
+
+    print("\n🔍 Difference vs MindSpore pipeline (normalized pixel units)")
+    for name, fn in [("squash (old)", preprocess_image_squash), ("fast", preprocess_image)]:
+        diffs = [np.abs(fn(data) - ref) for data, ref in zip(payloads, reference)]
+        mean_abs = float(np.mean([d.mean() for d in diffs]))
+        max_abs = float(max(d.max() for d in diffs))
+        print(f"   {name:<13} mean |diff| {mean_abs:.4f}   max |diff| {max_abs:.4f}")
+
+
+if __name__ == "__main__":
+    main()
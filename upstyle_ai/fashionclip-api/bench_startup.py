@@ -0,0 +1,94 @@
+# bench_startup.py
+"""
+Cold-start time of the API model setup, split into phases: module imports,
+ONNX session creation, vocabulary load, and the first inference (one image
+embedding + classify). Each configuration runs in a fresh interpreter:
+
+- baseline:  graphs optimized from scratch, vision session loaded before the vocabulary
+- optimized: saved ORT-optimized graphs (ORT_OPTIMIZED_DIR), still sequential
+- overlap:   optimized graphs, vision session loaded while the vocabulary loads
+
+    python vocabulary.py          # once: text vector cache + optimized graphs
+    python bench_startup.py --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+WORKER = r"""
+import json, sys, time
+base = time.perf_counter()
+import numpy as np
+import config, vocabulary
+from inference import AttributePredictor
+import api_server
+t_import = time.perf_counter()
+optimized_dir, background = sys.argv[1] or None, sys.argv[2] == "1"
+predictor = AttributePredictor(
+    config.ONNX_MODEL_PATH, config.HF_MODEL_ID,
+    vision_model_path=config.VISION_MODEL_PATH, text_model_path=config.TEXT_MODEL_PATH,
+    intra_op_threads=config.ORT_INTRA_OP_THREADS,
+    optimized_model_dir=optimized_dir, background_load=background
+)
+t_session = time.perf_counter()
+predictor.precompute_all_attributes(api_server.initial_vocabulary(), cache_path=config.VOCAB_CACHE_PATH)
+t_vocab = time.perf_counter()
+predictor.wait_until_loaded()
+t_loaded = time.perf_counter()
+embeds = predictor.get_image_embeddings(np.zeros((1, 3, 224, 224), dtype=np.float32))
+predictor.classify_batch(embeds)
+t_first = time.perf_counter()
+print(json.dumps({
+    "import_s": t_import - base, "session_s": t_session - t_import, "vocab_s": t_vocab - t_session,
+    "wait_s": t_loaded - t_vocab, "first_inference_s": t_first - t_loaded, "total_s": t_first - base,
+}))
+"""
+
+PHASES = ("import_s", "session_s", "vocab_s", "wait_s", "first_inference_s", "total_s")
+
+
+def measure(optimized_dir, background, repeat):
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", WORKER, optimized_dir, "1" if background else "0"],
+            check=True, capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    return {phase: statistics.median(r[phase] for r in runs) for phase in PHASES}
+
+
+def main():
+    import config
+    parser = argparse.ArgumentParser(description="Break down API cold-start time.")
+    parser.add_argument("--optimized-dir", default=config.ORT_OPTIMIZED_DIR or "models/ort_cache")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="Also write the medians to this file")
+    args = parser.parse_args()
+
+    # One untimed run so the optimized graphs and digest memos exist
+    measure(args.optimized_dir, False, 1)
+    results = {
+        "baseline": measure("", False, args.repeat),
+        "optimized": measure(args.optimized_dir, False, args.repeat),
+        "overlap": measure(args.optimized_dir, True, args.repeat),
+    }
+
+    # With background loading 'session' is only the thread start; the rest shows up as 'wait'
+    print(f"\nMedian of {args.repeat} cold starts (seconds)")
+    print(f"{'':<12}{'import':>8}{'session':>9}{'vocab':>8}{'wait':>8}{'first inf':>11}{'total':>8}")
+    for name, r in results.items():
+        print(f"{name:<12}{r['import_s']:>8.3f}{r['session_s']:>9.3f}{r['vocab_s']:>8.3f}"
+              f"{r['wait_s']:>8.3f}{r['first_inference_s']:>11.3f}{r['total_s']:>8.3f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
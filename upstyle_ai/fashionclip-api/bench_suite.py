@@ -0,0 +1,235 @@
+# bench_suite.py
+"""
+Offline micro-benchmarks of the hot paths, runnable in CI: no real model, no
+HF download, no image folder. Everything runs against the random-weight
+stand-in from `onnx_tools.py stub` (built on first use, needs `onnx`) and
+images from synthetic_images.py. The stand-in is much cheaper than CLIP, so
+the numbers track our own code around the model (pre/post-processing, ORT
+call overhead, batching, vocabulary build), not the model itself.
+
+Benchmarks: preprocess_image per image kind, data_pipeline.create_batch_pipeline
+(skipped without MindSpore), get_image_embedding / batched embeddings,
+classify_all / classify_batch, precompute_all_attributes (cold and cached).
+
+Every run is appended to --history (JSON lines). The run fails (exit 1) when
+a benchmark's median is more than --threshold slower than the median of the
+last --window runs recorded on the same machine.
+
+    python bench_suite.py                       # run, compare, record
+    python bench_suite.py --only preprocess --no-record
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+import numpy as np
+import onnxruntime as ort
+import config
+import onnx_tools
+from inference import AttributePredictor
+from preprocessing import preprocess_image
+from synthetic_images import make_image
+
+
+def measure(fn, repeat, warmup=2):
+    """Median and min wall time of fn() in ms."""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t) * 1000.0)
+    return {"median_ms": statistics.median(times), "min_ms": min(times)}
+
+
+def load_stub_predictor(stub_dir, threads):
+    combined, vision, text = onnx_tools.stub_paths(stub_dir)
+    if not all(os.path.exists(p) for p in (combined, vision, text)):
+        print(f"🧪 Building stand-in model in {stub_dir}")
+        onnx_tools.build_stub_model(stub_dir)
+    return AttributePredictor(
+        combined, config.HF_MODEL_ID, vision_model_path=vision, text_model_path=text,
+        intra_op_threads=threads, background_load=False
+    )
+
+
+def bench_preprocess(ctx, repeat):
+    results = {}
+    for kind in ("thumb", "photo", "phone", "png"):
+        data, _ = make_image(kind)
+        results[f"preprocess_image[{kind}]"] = measure(lambda: preprocess_image(data), repeat)
+    return results
+
+
+def bench_pipeline(ctx, repeat):
+    try:
+        from data_pipeline import create_batch_pipeline, iter_batches
+    except ImportError:
+        print("   ⏭️  create_batch_pipeline skipped (MindSpore not installed)")
+        return {}
+    paths = []
+    for i in range(32):
+        path = os.path.join(ctx["tmp"], f"img_{i:03d}.jpg")
+        with open(path, "wb") as f:
+            f.write(make_image("photo", seed=i)[0])
+        paths.append(path)
+
+    # MindSpore rejects more workers than CPUs; the count is part of the name so
+    # history is only compared between runs with the same setting
+    workers = min(2, os.cpu_count() or 1)
+
+    def run():
+        dataset = create_batch_pipeline(paths, batch_size=8, num_parallel_workers=workers)
+        for _ in iter_batches(dataset, paths):
+            pass
+    # Whole pass over 32 images, pipeline construction included
+    return {f"create_batch_pipeline[32x photo, {workers}w]": measure(run, max(3, repeat // 10), warmup=1)}
+
+
+def bench_embedding(ctx, repeat):
+    predictor = ctx["predictor"]
+    rng = np.random.default_rng(0)
+    single = rng.standard_normal((1, 3, config.INPUT_SIZE, config.INPUT_SIZE)).astype(np.float32)
+    batch = rng.standard_normal((8, 3, config.INPUT_SIZE, config.INPUT_SIZE)).astype(np.float32)
+    return {
+        "get_image_embedding[1]": measure(lambda: predictor.get_image_embedding(single), repeat),
+        "get_image_embeddings[8]": measure(lambda: predictor.get_image_embeddings(batch), repeat),
+    }
+
+
+def bench_classify(ctx, repeat):
+    predictor = ctx["predictor"]
+    embeds = predictor.get_image_embeddings(
+        np.random.default_rng(1).standard_normal((64, 3, config.INPUT_SIZE, config.INPUT_SIZE)).astype(np.float32)
+    )
+    return {
+        "classify_all[1]": measure(lambda: predictor.classify_all(embeds[:1]), repeat),
+        "classify_batch[64]": measure(lambda: predictor.classify_batch(embeds), repeat),
+    }
+
+
+def bench_vocabulary(ctx, repeat):
+    predictor = ctx["predictor"]
+    cache_path = os.path.join(ctx["tmp"], "text_embeds.npz")
+
+    def cold():
+        predictor.vocab = None  # Nothing to reuse: tokenize + encode every prompt
+        predictor.precompute_all_attributes(config.ATTRIBUTE_CANDIDATES)
+
+    def cached():
+        predictor.vocab = None
+        predictor.precompute_all_attributes(config.ATTRIBUTE_CANDIDATES, cache_path=cache_path)
+
+    n = max(3, repeat // 10)
+    results = {"precompute_all_attributes[cold]": measure(cold, n, warmup=1)}
+    cached()  # Writes the cache
+    results["precompute_all_attributes[cached]"] = measure(cached, n, warmup=1)
+    return results
+
+
+SUITES = {
+    "preprocess": bench_preprocess,
+    "pipeline": bench_pipeline,
+    "embedding": bench_embedding,
+    "classify": bench_classify,
+    "vocabulary": bench_vocabulary,
+}
+
+
+def machine_id(threads):
+    """Results are only compared between runs with the same fingerprint."""
+    return f"{platform.machine()}/{platform.processor() or '?'}/{config.CPU_COUNT}cpu/{threads}t/ort{ort.__version__}"
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path, machine):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    return [run for run in runs if run["machine"] == machine]
+
+
+def find_regressions(results, history, window, threshold):
+    """[(name, baseline_ms, current_ms)] for benchmarks slower than baseline * (1 + threshold)."""
+    regressions = []
+    for name, r in results.items():
+        previous = [run["results"][name]["median_ms"] for run in history[-window:] if name in run["results"]]
+        if not previous:
+            continue
+        baseline = statistics.median(previous)
+        if r["median_ms"] > baseline * (1 + threshold):
+            regressions.append((name, baseline, r["median_ms"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline micro-benchmarks with a stand-in model.")
+    parser.add_argument("--only", nargs="+", choices=sorted(SUITES), help="Run only these suites")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=1, help="ORT intra-op threads (1 = least noisy)")
+    parser.add_argument("--stub-dir", default=onnx_tools.STUB_DIR)
+    parser.add_argument("--history", default="benchmarks/history.jsonl")
+    parser.add_argument("--window", type=int, default=5, help="Baseline = median of the last N runs")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed slowdown (0.15 = 15%%)")
+    parser.add_argument("--no-record", action="store_true", help="Do not append this run to --history")
+    args = parser.parse_args()
+
+    machine = machine_id(args.threads)
+    history = load_history(args.history, machine)
+    suites = args.only or list(SUITES)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        ctx = {"tmp": tmp}
+        if set(suites) & {"embedding", "classify", "vocabulary"}:
+            ctx["predictor"] = load_stub_predictor(args.stub_dir, args.threads)
+            ctx["predictor"].precompute_all_attributes(config.ATTRIBUTE_CANDIDATES)
+        for suite in suites:
+            print(f"⏱️  {suite}...")
+            results.update(SUITES[suite](ctx, args.repeat))
+
+    regressions = find_regressions(results, history, args.window, args.threshold)
+    regressed = {name for name, _, _ in regressions}
+
+    print(f"\n{'benchmark':<40}{'median ms':>11}{'min ms':>9}{'baseline':>10}")
+    for name, r in results.items():
+        previous = [run["results"][name]["median_ms"] for run in history[-args.window:] if name in run["results"]]
+        baseline = f"{statistics.median(previous):.3f}" if previous else "-"
+        flag = "  ❌" if name in regressed else ""
+        print(f"{name:<40}{r['median_ms']:>11.3f}{r['min_ms']:>9.3f}{baseline:>10}{flag}")
+
+    if not args.no_record:
+        os.makedirs(os.path.dirname(args.history) or ".", exist_ok=True)
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps({
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "commit": git_commit(),
+                "machine": machine,
+                "results": results,
+            }) + "\n")
+        print(f"\n💾 Recorded in {args.history} ({len(history) + 1} runs on this machine)")
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} benchmark(s) regressed more than {args.threshold:.0%}:")
+        for name, baseline, current in regressions:
+            print(f"   {name}: {baseline:.3f} -> {current:.3f} ms ({current / baseline - 1:+.1%})")
+        raise SystemExit(1)
+    print("\n✅ No regressions" if history else "\n✅ First run on this machine, nothing to compare")
+
+
+if __name__ == "__main__":
+    main()
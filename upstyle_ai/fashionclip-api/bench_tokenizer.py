@@ -0,0 +1,71 @@
+# bench_tokenizer.py
+"""
+Cold-start cost of the text tokenizer: transformers.CLIPProcessor (before)
+vs the bundled clip_tokenizer.py (after). Each side runs in a fresh
+interpreter and reports import time, load time, time to tokenize every
+vocabulary prompt, and peak RSS.
+
+    python onnx_tools.py tokenizer      # once: writes models/vocab.json + merges.txt
+    python bench_tokenizer.py
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+WORKER = r"""
+import json, resource, sys, time
+import numpy as np
+import config, vocabulary
+base = time.perf_counter()
+kind, tokenizer_dir = sys.argv[1], sys.argv[2]
+if kind == "processor":
+    from transformers import CLIPProcessor
+    t1 = time.perf_counter()
+    processor = CLIPProcessor.from_pretrained(config.HF_MODEL_ID)
+    tokenize = lambda texts: processor(text=texts, return_tensors="np", padding="max_length", max_length=77)
+else:
+    import clip_tokenizer
+    t1 = time.perf_counter()
+    tokenize = clip_tokenizer.CLIPTokenizer.from_dir(tokenizer_dir)
+t2 = time.perf_counter()
+tokenize(vocabulary.unique_prompts(config.ATTRIBUTE_CANDIDATES))
+t3 = time.perf_counter()
+print(json.dumps({
+    "import_s": t1 - base, "load_s": t2 - t1, "tokenize_vocab_s": t3 - t2, "total_s": t3 - base,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+}))
+"""
+
+
+def measure(kind, tokenizer_dir, repeat):
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", WORKER, kind, tokenizer_dir],
+            check=True, capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    # Best run: the least disturbed by the page cache / other processes
+    return min(runs, key=lambda r: r["total_s"])
+
+
+def main():
+    import config
+    parser = argparse.ArgumentParser(description="Compare tokenizer cold-start cost.")
+    parser.add_argument("--tokenizer-dir", default=os.path.dirname(os.path.abspath(config.TEXT_MODEL_PATH_FP32)))
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    results = {"processor (before)": measure("processor", args.tokenizer_dir, args.repeat),
+               "clip_tokenizer (after)": measure("bundled", args.tokenizer_dir, args.repeat)}
+    print(f"\n{'':<24}{'import s':>10}{'load s':>9}{'vocab s':>9}{'total s':>9}{'RSS MB':>9}")
+    for name, r in results.items():
+        print(f"{name:<24}{r['import_s']:>10.3f}{r['load_s']:>9.3f}{r['tokenize_vocab_s']:>9.3f}"
+              f"{r['total_s']:>9.3f}{r['peak_rss_mb']:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# clip_tokenizer.py
+"""
+Minimal CLIP BPE tokenizer (no transformers import, no network).
+
+Reads vocab.json + merges.txt (written next to the model by
+`python onnx_tools.py tokenizer`) and reproduces the input_ids /
+attention_mask of CLIPProcessor(text=..., padding="max_length", max_length=77):
+NFC + whitespace collapse + lowercase, the CLIP pre-tokenizer regex,
+byte-level BPE, <|startoftext|> ... <|endoftext|>, truncation and padding.
+
+The `regex` package provides the exact \\p{L}/\\p{N} classes; without it an
+equivalent `re` pattern is used (differs only for non-decimal numerals like "½").
+"""
+import json
+import os
+import unicodedata
+from functools import lru_cache
+import numpy as np
+
+try:
+    import regex as re
+    _PATTERN = r"""'s|'t|'re|'ve|'m|'ll|'d|[\p{L}]+|[\p{N}]|[^\s\p{L}\p{N}]+"""
+except ImportError:
+    import re
+    _PATTERN = r"""'s|'t|'re|'ve|'m|'ll|'d|[^\W\d_]+|\d|(?:[^\s\w]|_)+"""
+
+TOKENIZER_FILES = ("vocab.json", "merges.txt")
+BOS, EOS = "<|startoftext|>", "<|endoftext|>"
+
+
+def bytes_to_unicode():
+    """GPT-2 byte -> printable unicode character table used by CLIP's byte-level BPE."""
+    bs = list(range(ord("!"), ord("~") + 1)) + list(range(ord("¡"), ord("¬") + 1)) + list(range(ord("®"), ord("ÿ") + 1))
+    cs = bs[:]
+    n = 0
+    for b in range(256):
+        if b not in bs:
+            bs.append(b)
+            cs.append(256 + n)
+            n += 1
+    return dict(zip(bs, map(chr, cs)))
+
+
+def has_tokenizer_files(directory):
+    return all(os.path.exists(os.path.join(directory, f)) for f in TOKENIZER_FILES)
+
+
+class CLIPTokenizer:
+    def __init__(self, vocab, merges, pad_token=EOS, max_length=77):
+        self.encoder = vocab
+        self.bpe_ranks = {pair: i for i, pair in enumerate(merges)}
+        self.byte_encoder = bytes_to_unicode()
+        self.pattern = re.compile(_PATTERN, re.IGNORECASE)
+        self.bos_id = vocab[BOS]
+        self.eos_id = vocab[EOS]
+        self.pad_id = vocab[pad_token]
+        self.max_length = max_length
+        self.bpe = lru_cache(maxsize=65536)(self._bpe)
+
+    @classmethod
+    def from_dir(cls, directory, max_length=77):
+        with open(os.path.join(directory, "vocab.json"), encoding="utf-8") as f:
+            vocab = json.load(f)
+        with open(os.path.join(directory, "merges.txt"), encoding="utf-8") as f:
+            lines = f.read().strip().split("\n")
+        # Same slice as transformers.CLIPTokenizer: skip the header, 49152 - 256 - 2 merges
+        merges = [tuple(line.split()) for line in lines[1:49152 - 256 - 2 + 1]]
+
+        pad_token = EOS
+        special_path = os.path.join(directory, "special_tokens_map.json")
+        if os.path.exists(special_path):
+            with open(special_path, encoding="utf-8") as f:
+                pad = json.load(f).get("pad_token", EOS)
+            pad_token = pad["content"] if isinstance(pad, dict) else pad
+        return cls(vocab, merges, pad_token=pad_token, max_length=max_length)
+
+    def _bpe(self, token):
+        word = tuple(token[:-1]) + (token[-1] + "</w>",)
+        while len(word) > 1:
+            pairs = set(zip(word, word[1:]))
+            best = min(pairs, key=lambda pair: self.bpe_ranks.get(pair, float("inf")))
+            if best not in self.bpe_ranks:
+                break
+            first, second = best
+            merged, i = [], 0
+            while i < len(word):
+                if i < len(word) - 1 and word[i] == first and word[i + 1] == second:
+                    merged.append(first + second)
+                    i += 2
+                else:
+                    merged.append(word[i])
+                    i += 1
+            word = tuple(merged)
+        return word
+
+    def encode(self, text):
+        """Token ids of one text, without special tokens."""
+        text = " ".join(unicodedata.normalize("NFC", text).split()).lower()
+        ids = []
+        for token in self.pattern.findall(text):
+            token = "".join(self.byte_encoder[b] for b in token.encode("utf-8"))
+            ids.extend(self.encoder[piece] for piece in self.bpe(token))
+        return ids
+
+    def __call__(self, texts):
+        """
+        texts -> (input_ids, attention_mask), both (N, max_length) int64, like
+        CLIPProcessor(text=texts, padding="max_length", max_length=max_length, truncation=True).
+        """
+        input_ids = np.full((len(texts), self.max_length), self.pad_id, dtype=np.int64)
+        attention_mask = np.zeros((len(texts), self.max_length), dtype=np.int64)
+        for row, text in enumerate(texts):
+            ids = [self.bos_id] + self.encode(text)[:self.max_length - 2] + [self.eos_id]
+            input_ids[row, :len(ids)] = ids
+            attention_mask[row, :len(ids)] = 1
+        return input_ids, attention_mask
@@ -2,11 +2,132 @@
 from collections import OrderedDict
 import os
 
+# --- Model Variant ---
+# "fp32" (default) or a quantized copy made by `python onnx_tools.py quantize`
+# ("int8", "fp16"). The tag is inserted before the extension of every model path.
+MODEL_VARIANT = os.getenv('MODEL_VARIANT', 'fp32')
+
+def variant_path(path, variant=None):
+    """models/x.onnx -> models/x.int8.onnx (unchanged for fp32)."""
+    variant = variant or MODEL_VARIANT
+    if variant == 'fp32':
+        return path
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{variant}{ext}"
+
 # --- Cloud Run Model Path ---
 # Use a relative path, which works locally and in Docker.
-ONNX_MODEL_PATH = os.getenv('ONNX_MODEL_PATH', 'models/fashionclip.simplified.onnx')
+ONNX_MODEL_PATH_FP32 = os.getenv('ONNX_MODEL_PATH', 'models/fashionclip.simplified.onnx')
+# Optional vision-only / text-only halves (`python onnx_tools.py split`).
+# Used instead of the combined graph whenever both files exist.
+VISION_MODEL_PATH_FP32 = os.getenv('VISION_MODEL_PATH', 'models/fashionclip.simplified.vision.onnx')
+TEXT_MODEL_PATH_FP32 = os.getenv('TEXT_MODEL_PATH', 'models/fashionclip.simplified.text.onnx')
+
+ONNX_MODEL_PATH = variant_path(ONNX_MODEL_PATH_FP32)
+VISION_MODEL_PATH = variant_path(VISION_MODEL_PATH_FP32)
+TEXT_MODEL_PATH = variant_path(TEXT_MODEL_PATH_FP32)
 HF_MODEL_ID = "patrickjohncyh/fashion-clip"
 
+# Prebuilt attribute text vectors (see vocabulary.py), one file per variant.
+# Rebuilt automatically if stale.
+VOCAB_CACHE_PATH = variant_path(os.getenv('VOCAB_CACHE_PATH', 'models/text_embeds.npz'))
+
+# --- Cold start ---
+# ORT-optimized copies of the graphs are written here once (e.g. by `RUN python vocabulary.py`
+# in the Dockerfile) and loaded on later starts, skipping graph optimization. '' disables.
+ORT_OPTIMIZED_DIR = os.getenv('ORT_OPTIMIZED_DIR', 'models/ort_cache')
+
+# --- Micro-batching (api_server.py) ---
+# Concurrent /analyze requests arriving within MAX_BATCH_WAIT_MS are run as one batch.
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '8'))
+MAX_BATCH_WAIT_MS = float(os.getenv('MAX_BATCH_WAIT_MS', '5'))
+
+# --- Multi-image uploads (/analyze/batch, /analyze/stream) ---
+MAX_UPLOAD_FILES = int(os.getenv('MAX_UPLOAD_FILES', '50'))
+MAX_UPLOAD_BYTES = int(float(os.getenv('MAX_UPLOAD_MB', '100')) * 1024 * 1024)
+# /analyze/stream reads and dispatches parts as they arrive (only images in flight are held in
+# memory), so it takes far larger imports.
+STREAM_MAX_FILES = int(os.getenv('STREAM_MAX_FILES', '2000'))
+STREAM_MAX_BYTES = int(float(os.getenv('STREAM_MAX_MB', '2048')) * 1024 * 1024)
+
+# --- Result cache (api_server.py) ---
+# Results keyed by hash(image bytes + model/vocabulary version). RESULT_CACHE_SIZE=0 disables;
+# RESULT_CACHE_DB adds a SQLite tier that survives restarts, capped at RESULT_CACHE_DB_MAX_ITEMS
+# rows (expired rows, then the oldest, are evicted periodically).
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '2048'))
+RESULT_CACHE_TTL_S = float(os.getenv('RESULT_CACHE_TTL_S', '86400'))
+RESULT_CACHE_DB = os.getenv('RESULT_CACHE_DB', '')
+RESULT_CACHE_DB_MAX_ITEMS = int(os.getenv('RESULT_CACHE_DB_MAX_ITEMS', '100000'))
+
+# --- Wardrobe index (/similar) ---
+# Per-user image embeddings: an .npz snapshot plus an append-only .log per user, shared by
+# serve.py workers. Exact search below INDEX_IVF_THRESHOLD items, approximate (IVF, scanning
+# INDEX_NPROBE cells) above it. See vector_index.py.
+INDEX_DIR = os.getenv('INDEX_DIR', 'data/wardrobe_index')
+INDEX_IVF_THRESHOLD = int(os.getenv('INDEX_IVF_THRESHOLD', '50000'))
+INDEX_NPROBE = int(os.getenv('INDEX_NPROBE', '8'))
+# Users whose index is kept in memory per process; idle ones are reloaded from disk when needed.
+INDEX_CACHE_USERS = int(os.getenv('INDEX_CACHE_USERS', '1024'))
+
+# --- Free-text search (/search) ---
+# LRU of query text embeddings (the text tower is loaded on the first query).
+QUERY_CACHE_SIZE = int(os.getenv('QUERY_CACHE_SIZE', '1024'))
+# PRELOAD_TEXT_MODEL=1 loads the text tower + tokenizer at startup instead: no slow first query,
+# and with serve.py the workers share the parent's copy instead of each loading their own.
+PRELOAD_TEXT_MODEL = os.getenv('PRELOAD_TEXT_MODEL', '').lower() in ('1', 'true', 'yes')
+
+# --- Hot-reloadable vocabulary (api_server.py) ---
+# VOCAB_FILE: JSON in ATTRIBUTE_CANDIDATES form, used instead of the list below when present
+# and re-read whenever it changes. POST /admin/vocabulary (header X-Admin-Token) writes it.
+VOCAB_FILE = os.getenv('VOCAB_FILE', '')
+VOCAB_WATCH_INTERVAL = float(os.getenv('VOCAB_WATCH_INTERVAL', '5'))
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
+# --- ONNX Runtime session tuning ---
+# ORT_PRESET: latency | throughput | low-memory (see inference.SESSION_PRESETS);
+# `python bench_ort_presets.py` measures all of them on this machine.
+# The ORT_* variables below override single settings of the preset ('' = preset value).
+ORT_PRESET = os.getenv('ORT_PRESET', 'latency')
+
+def _env_int(name):
+    value = os.getenv(name, '')
+    return int(value) if value else None
+
+def _env_flag(name):
+    value = os.getenv(name, '')
+    return value.lower() in ('1', 'true', 'yes') if value else None
+
+ORT_SESSION_OVERRIDES = {
+    "inter_op_threads": _env_int('ORT_INTER_OP_THREADS'),
+    "execution_mode": os.getenv('ORT_EXECUTION_MODE') or None,              # sequential | parallel
+    "graph_optimization": os.getenv('ORT_GRAPH_OPTIMIZATION') or None,      # disable | basic | extended | all
+    "mem_arena": _env_flag('ORT_MEM_ARENA'),
+    "mem_pattern": _env_flag('ORT_MEM_PATTERN'),
+    "allow_spinning": _env_flag('ORT_ALLOW_SPINNING'),
+    "prepacking": _env_flag('ORT_PREPACKING'),
+}
+
+# --- Threading (api_server.py) ---
+# Decode/preprocess and model calls run on bounded thread pools, off the event loop.
+# INFERENCE_THREADS batches may run at once, each with ORT_INTRA_OP_THREADS ORT threads,
+# so by default the model uses exactly the cores the container is allowed to run on.
+# The throughput preset runs one batch per 2 cores instead of one batch on all of them.
+CPU_COUNT = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+INFERENCE_THREADS = int(os.getenv(
+    'INFERENCE_THREADS', str(max(1, CPU_COUNT // 2) if ORT_PRESET == 'throughput' else 1)
+))
+ORT_INTRA_OP_THREADS = int(os.getenv('ORT_INTRA_OP_THREADS', str(max(1, CPU_COUNT // INFERENCE_THREADS))))
+PREPROCESS_THREADS = int(os.getenv('PREPROCESS_THREADS', str(min(4, CPU_COUNT))))
+
+# --- Pre-fork serving (serve.py) ---
+# Worker processes sharing one copy of the model; per-worker RSS/PSS is logged periodically.
+WEB_WORKERS = int(os.getenv('WEB_WORKERS', str(CPU_COUNT)))
+MEMORY_REPORT_INTERVAL = float(os.getenv('MEMORY_REPORT_INTERVAL', '60'))
+# Workers flush /metrics snapshots here so any worker can answer a scrape for all of
+# them (serve.py uses a temporary directory when unset; set it for `uvicorn --workers`)
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
 # --- CLIP Constants ---
 CLIP_MEAN = [0.48145466, 0.4578275, 0.40821073]
 CLIP_STD  = [0.26862954, 0.26130258, 0.27577711]
@@ -4,39 +4,107 @@ import mindspore.dataset.vision as vision
 import numpy as np
 import config
 
-def create_batch_pipeline(image_paths_list):
+class ImageFileSource:
+    """
+    Random-access source (index -> encoded bytes), so GeneratorDataset can read
+    with several workers. Unreadable files yield an empty array, which the
+    decode step then flags as bad.
+    """
+    def __init__(self, image_paths_list):
+        self.paths = list(image_paths_list)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        try:
+            data = np.fromfile(self.paths[index], dtype=np.uint8)
+        except OSError:
+            data = np.empty(0, dtype=np.uint8)
+        return data, np.int64(index)
+
+def decode_and_resize(data):
+    """
+    Decode + shorter-side resize as one Python op: a bad file becomes a blank
+    image with ok=False instead of an exception that stops the iterator, and
+    only the resized image (not the full-size decode) crosses process boundaries.
+    """
+    try:
+        image = vision.Resize(config.INPUT_SIZE)(vision.Decode()(data))
+        return image, np.bool_(True)
+    except Exception:
+        return np.zeros((config.INPUT_SIZE, config.INPUT_SIZE, 3), dtype=np.uint8), np.bool_(False)
+
+def create_batch_pipeline(image_paths_list, batch_size=1, num_parallel_workers=None,
+                          python_multiprocessing=False):
     """
     Creates a MindSpore pipeline for a LIST of images.
+    Columns: "image" (B, 3, 224, 224) float32, "index" (B,) position in the list,
+    "ok" (B,) False for files that could not be read/decoded (use iter_batches
+    to drop and report them).
+    - num_parallel_workers: readers and map workers (None = MindSpore default;
+      MindSpore rejects values above os.cpu_count()).
+    - python_multiprocessing: run the decode op in processes instead of threads.
     """
     if not image_paths_list:
         raise ValueError("Image path list is empty!")
+    # MindSpore compares num_parallel_workers with ints: only pass it when set
+    workers = {} if num_parallel_workers is None else {"num_parallel_workers": num_parallel_workers}
 
-    # 1. Create a Generator that yields images one by one from the list
-    def multi_image_generator():
-        for path in image_paths_list:
-            # Read file as binary
-            yield (np.fromfile(path, dtype=np.uint8),)
-
-    # 2. Create Dataset
+    # 1. Dataset over the list (random access, read in parallel)
     # shuffle=False is CRITICAL to keep the output order matching the input list
     dataset = ds.GeneratorDataset(
-        source=multi_image_generator, 
-        column_names=["image"], 
-        shuffle=False 
+        source=ImageFileSource(image_paths_list),
+        column_names=["image", "index"],
+        shuffle=False,
+        **workers
+    )
+
+    # 2. Decode + Resize (Python op, fault tolerant)
+    dataset = dataset.map(
+        operations=decode_and_resize,
+        input_columns=["image"],
+        output_columns=["image", "ok"],
+        python_multiprocessing=python_multiprocessing,
+        **workers
     )
 
-    # 3. Define Transforms
+    # 3. Remaining transforms (C++ ops)
     transforms_list = [
-        vision.Decode(),                    
-        vision.Resize(config.INPUT_SIZE),   
         vision.CenterCrop(config.INPUT_SIZE),
-        vision.Rescale(1.0 / 255.0, 0.0),   
+        vision.Rescale(1.0 / 255.0, 0.0),
         vision.Normalize(mean=config.CLIP_MEAN, std=config.CLIP_STD, is_hwc=True),
-        vision.HWC2CHW()                    
+        vision.HWC2CHW()
     ]
 
     # 4. Apply Map & Batch
-    dataset = dataset.map(operations=transforms_list, input_columns=["image"])
-    dataset = dataset.batch(1) 
-    
-    return dataset
\ No newline at end of file
+    dataset = dataset.map(operations=transforms_list, input_columns=["image"], **workers)
+    dataset = dataset.batch(batch_size, **workers)
+
+    return dataset
+
+def iter_batches(dataset, image_paths_list, prefetch_size=None):
+    """
+    Yields (paths, images, bad_paths) per batch: images (N, 3, 224, 224) for
+    the files that decoded, and the paths of those that did not.
+    prefetch_size: rows buffered per op. MindSpore only has a global setting, read
+    when the iterator is built; it is restored right after, so other pipelines in
+    the process keep their own value.
+    """
+    if prefetch_size is None:
+        iterator = dataset.create_dict_iterator(output_numpy=True)
+    else:
+        previous = ds.config.get_prefetch_size()
+        ds.config.set_prefetch_size(prefetch_size)
+        try:
+            iterator = dataset.create_dict_iterator(output_numpy=True)
+        finally:
+            ds.config.set_prefetch_size(previous)
+    for batch in iterator:
+        ok = batch["ok"].astype(bool)
+        index = batch["index"]
+        yield (
+            [image_paths_list[i] for i in index[ok]],
+            batch["image"][ok],
+            [image_paths_list[i] for i in index[~ok]]
+        )
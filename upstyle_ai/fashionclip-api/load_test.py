@@ -0,0 +1,312 @@
+# load_test.py
+"""
+Concurrent load test for /analyze.
+
+Starts api_server.py locally on a free port (uvicorn, or serve.py with
+--serve-workers N) - with --stub against the random-weight model from
+`onnx_tools.py stub`, so no real weights are needed - or targets a running
+server with --url. Two ways to drive it:
+
+- closed loop: --concurrency clients, each sends its next request as soon as
+  the previous one returned (measures capacity at a fixed parallelism)
+- open loop:   requests start at --rate per second (Poisson arrivals) no matter
+  how fast the server answers; latency counts from the scheduled start, so
+  queueing delay is included instead of hidden
+
+Reports throughput, p50/p95/p99 latency and error rate (overall and per image
+kind, see synthetic_images.py) and saves everything as JSON; --compare prints
+the change against an earlier run.
+
+    python onnx_tools.py stub
+    python load_test.py --stub --mode closed --concurrency 16 --duration 30
+    python load_test.py --stub --mode open --rate 40 --mix photo=3,phone=1,corrupt=0.1 \\
+        --compare loadtest/<earlier>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from collections import Counter
+from datetime import datetime, timezone
+import numpy as np
+import onnx_tools
+from synthetic_images import ImageMix
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# --- Local server ---
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get_json(url, timeout=5):
+    with urllib.request.urlopen(url, timeout=timeout) as resp:
+        return json.loads(resp.read())
+
+
+def start_server(args, log_path):
+    """Launches the API in a subprocess and waits until /health answers."""
+    port = free_port()
+    env = dict(os.environ)
+    if args.stub:
+        env.update(onnx_tools.stub_env(args.stub_dir))
+        if not os.path.exists(os.path.join(HERE, onnx_tools.stub_paths(args.stub_dir)[0])):
+            subprocess.run([sys.executable, "onnx_tools.py", "stub", "--out", args.stub_dir], cwd=HERE, check=True)
+    if not args.result_cache:
+        env["RESULT_CACHE_SIZE"] = "0"  # Every request runs the model
+
+    if args.serve_workers:
+        cmd = [sys.executable, "serve.py", "--workers", str(args.serve_workers), "--host", "127.0.0.1",
+               "--port", str(port)]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "api_server:app", "--host", "127.0.0.1", "--port", str(port)]
+
+    log = open(log_path, "w")
+    proc = subprocess.Popen(cmd, cwd=HERE, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"❌ Server exited with code {proc.returncode}, see {log_path}")
+        try:
+            get_json(url + "/health", timeout=1)
+            return proc, url
+        except Exception:
+            time.sleep(0.25)
+    proc.terminate()
+    raise SystemExit(f"❌ Server did not become healthy within {args.startup_timeout}s, see {log_path}")
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+# --- Load generation ---
+
+class Recorder:
+    def __init__(self):
+        self.samples = []  # (kind, latency_s, status) - status is an HTTP code or an error name
+        self.recording = False
+
+    def add(self, kind, latency, status):
+        if self.recording:
+            self.samples.append((kind, latency, status))
+
+
+async def post_image(session, url, mix, unique, timeout):
+    """One /analyze call. Returns (kind, status)."""
+    import aiohttp
+
+    kind, data, content_type = mix.pick()
+    if unique:
+        # Trailing bytes after the image end are ignored by decoders but defeat the result cache
+        data = data + os.urandom(16)
+    form = aiohttp.FormData()
+    form.add_field("file", data, filename=f"{kind}.img", content_type=content_type)
+    try:
+        async with session.post(url + "/analyze", data=form, timeout=timeout) as resp:
+            await resp.read()
+            return kind, resp.status
+    except asyncio.TimeoutError:
+        return kind, "timeout"
+    except Exception as e:
+        return kind, type(e).__name__
+
+
+async def closed_loop(session, url, mix, args, recorder, stop_at, timeout):
+    async def client():
+        while time.perf_counter() < stop_at:
+            t = time.perf_counter()
+            kind, status = await post_image(session, url, mix, args.unique, timeout)
+            recorder.add(kind, time.perf_counter() - t, status)
+
+    await asyncio.gather(*(client() for _ in range(args.concurrency)))
+
+
+async def open_loop(session, url, mix, args, recorder, stop_at, timeout, rng):
+    in_flight = set()
+
+    async def request(scheduled):
+        kind, status = await post_image(session, url, mix, args.unique, timeout)
+        recorder.add(kind, time.perf_counter() - scheduled, status)
+
+    scheduled = time.perf_counter()
+    while True:
+        scheduled += rng.expovariate(args.rate)
+        if scheduled >= stop_at:
+            break
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        if len(in_flight) >= args.max_in_flight:
+            # The client itself is saturated; count it instead of silently slowing the arrival rate
+            recorder.add("-", 0.0, "client_overload")
+            continue
+        task = asyncio.create_task(request(scheduled))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    if in_flight:
+        await asyncio.gather(*in_flight)
+
+
+async def run_load(url, mix, args):
+    import aiohttp
+
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=max(args.concurrency, args.max_in_flight))
+    elapsed = 0.0
+    async with aiohttp.ClientSession(connector=connector) as session:
+        for phase, seconds in (("warmup", args.warmup), ("measure", args.duration)):
+            if seconds <= 0:
+                continue
+            recorder.recording = phase == "measure"
+            start = time.perf_counter()
+            stop_at = start + seconds
+            if args.mode == "closed":
+                await closed_loop(session, url, mix, args, recorder, stop_at, timeout)
+            else:
+                await open_loop(session, url, mix, args, recorder, stop_at, timeout, rng)
+            elapsed = time.perf_counter() - start
+    return recorder.samples, elapsed
+
+
+# --- Report ---
+
+def summarize(samples, elapsed):
+    ok = [lat * 1000.0 for _, lat, status in samples if status == 200]
+    statuses = Counter(str(status) for _, _, status in samples)
+    summary = {
+        "requests": len(samples),
+        "succeeded": len(ok),
+        "errors": len(samples) - len(ok),
+        "error_rate": (len(samples) - len(ok)) / len(samples) if samples else 0.0,
+        "throughput_rps": len(ok) / elapsed if elapsed else 0.0,
+        "status_codes": dict(sorted(statuses.items())),
+    }
+    if ok:
+        summary["latency_ms"] = {
+            "mean": float(np.mean(ok)),
+            "p50": float(np.percentile(ok, 50)),
+            "p95": float(np.percentile(ok, 95)),
+            "p99": float(np.percentile(ok, 99)),
+            "max": float(np.max(ok)),
+        }
+    return summary
+
+
+def print_summary(name, s):
+    lat = s.get("latency_ms")
+    lat_cols = f"{lat['p50']:>9.1f}{lat['p95']:>9.1f}{lat['p99']:>9.1f}" if lat else f"{'-':>9}{'-':>9}{'-':>9}"
+    print(f"{name:<10}{s['requests']:>8}{s['throughput_rps']:>9.1f}{lat_cols}{s['error_rate']:>9.1%}")
+
+
+def compare(previous_path, result):
+    with open(previous_path, encoding="utf-8") as f:
+        prev = json.load(f)["overall"]
+    cur = result["overall"]
+    print(f"\n📊 vs {previous_path}")
+    rows = [("throughput req/s", prev["throughput_rps"], cur["throughput_rps"])]
+    for p in ("p50", "p95", "p99"):
+        if "latency_ms" in prev and "latency_ms" in cur:
+            rows.append((f"{p} ms", prev["latency_ms"][p], cur["latency_ms"][p]))
+    rows.append(("error rate", prev["error_rate"], cur["error_rate"]))
+    for name, old, new in rows:
+        change = f"{(new - old) / old:+.1%}" if old else "-"
+        print(f"   {name:<18}{old:>10.3f} -> {new:>10.3f}  ({change})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test /analyze on a local or remote API.")
+    target = parser.add_argument_group("target")
+    target.add_argument("--url", help="Running server to test (default: start one locally)")
+    target.add_argument("--stub", action="store_true", help="Local server uses the stand-in model")
+    target.add_argument("--stub-dir", default=onnx_tools.STUB_DIR)
+    target.add_argument("--serve-workers", type=int, default=0, help="Start serve.py with N workers instead of uvicorn")
+    target.add_argument("--result-cache", action="store_true", help="Keep the local server's result cache on")
+    target.add_argument("--startup-timeout", type=float, default=120)
+
+    load = parser.add_argument_group("load")
+    load.add_argument("--mode", choices=["closed", "open"], default="closed")
+    load.add_argument("--concurrency", type=int, default=8, help="Closed loop: parallel clients")
+    load.add_argument("--rate", type=float, default=10.0, help="Open loop: requests per second")
+    load.add_argument("--max-in-flight", type=int, default=512, help="Open loop: client-side cap")
+    load.add_argument("--duration", type=float, default=30.0, help="Measured seconds")
+    load.add_argument("--warmup", type=float, default=5.0, help="Unmeasured seconds before the run")
+    load.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout (s)")
+    load.add_argument("--mix", default="photo=3,phone=1,thumb=1", help="Synthetic image mix, e.g. photo=3,corrupt=0.1")
+    load.add_argument("--images", help="Folder of real images instead of --mix")
+    load.add_argument("--unique", action="store_true", help="Make every upload unique (defeats result caches)")
+    load.add_argument("--seed", type=int, default=0)
+
+    parser.add_argument("--out", help="Result JSON (default: loadtest/<time>-<mode>.json)")
+    parser.add_argument("--compare", help="Earlier result JSON to compare with")
+    args = parser.parse_args()
+    if args.duration <= 0:
+        parser.error("--duration must be positive")
+
+    mix = ImageMix.from_folder(args.images, args.seed) if args.images else ImageMix.synthetic(args.mix, seed=args.seed)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    out = args.out or os.path.join("loadtest", f"{stamp}-{args.mode}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+
+    proc = None
+    url = args.url.rstrip("/") if args.url else None
+    if url is None:
+        log_path = os.path.splitext(out)[0] + ".server.log"
+        print(f"🚀 Starting local server ({'stub model' if args.stub else 'configured model'}), log: {log_path}")
+        proc, url = start_server(args, log_path)
+
+    try:
+        load_desc = f"{args.concurrency} clients" if args.mode == "closed" else f"{args.rate:g} req/s"
+        print(f"🔥 {args.mode} loop, {load_desc}, {args.duration:g}s (+{args.warmup:g}s warm-up) -> {url}")
+        samples, elapsed = asyncio.run(run_load(url, mix, args))
+        try:
+            server = get_json(url + "/health")
+        except Exception:
+            server = None
+    finally:
+        if proc is not None:
+            stop_server(proc)
+
+    kinds = sorted({kind for kind, _, _ in samples})
+    result = {
+        "timestamp": stamp,
+        "target": args.url or ("local stub" if args.stub else "local"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "elapsed_s": elapsed,
+        "overall": summarize(samples, elapsed),
+        "per_kind": {k: summarize([s for s in samples if s[0] == k], elapsed) for k in kinds},
+        "server": {key: server.get(key) for key in ("batching", "threads", "ort_session")} if server else None,
+    }
+
+    print(f"\n{'':<10}{'requests':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>9}")
+    print_summary("all", result["overall"])
+    for kind, s in result["per_kind"].items():
+        print_summary(kind, s)
+    if result["server"] and result["server"].get("batching"):
+        print(f"\n📦 Server avg batch size: {result['server']['batching']['avg_batch_size']}")
+
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"\n💾 Saved {out}")
+
+    if args.compare:
+        compare(args.compare, result)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,80 +1,213 @@
 # main.py
-import time
-import os
+"""
+FashionCLIP batch analyzer.
+
+Walks image folders (or a manifest of paths), decodes images on a thread pool
+while the previous batch is on the model, runs batched inference and streams
+results to a sink (see sinks.py: JSONL, per-image JSON, or columnar npy /
+Parquet parts). Paths are appended to a checkpoint in the output folder once
+the sink has made them durable, so an interrupted run picks up where it stopped.
+Images that fail are listed in errors.jsonl (rewritten every run) and are not
+checkpointed, so the next run retries them.
+
+    python main.py                                  # config.SINGLE_IMAGE_PATH
+    python main.py ../clothes_data/imgs --out ../clothes_data/metadata
+    python main.py --manifest paths.txt --format json --batch-size 32
+    python main.py ../clothes_data/imgs --format npy --row-group-size 8192
+"""
+import argparse
 import json
+import os
+import time
 import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import config
-from data_pipeline import create_batch_pipeline
+from preprocessing import preprocess_image
 from inference import AttributePredictor
+from vocabulary import model_digest
+from sinks import SINKS, open_sink
+
+CHECKPOINT_NAME = "checkpoint.txt"
+ERRORS_NAME = "errors.jsonl"
 
 # Helper to check extensions
 def is_image_file(filename):
     return filename.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.webp'))
 
+def collect_paths(inputs, manifest=None):
+    """Image paths from files, folders (recursive, sorted) and a manifest (one path per line)."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                paths.extend(os.path.join(root, f) for f in sorted(files) if is_image_file(f))
+        else:
+            paths.append(item)
+    if manifest:
+        with open(manifest, encoding='utf-8') as f:
+            paths.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+    return list(dict.fromkeys(paths))  # Drop duplicates, keep order
+
+class Checkpoint:
+    """Append-only list of finished paths (written after the sink has flushed them)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.done = {line.rstrip('\n') for line in f}
+        self._f = open(path, 'a', encoding='utf-8')
+
+    def mark(self, paths):
+        if not paths:
+            return
+        self._f.writelines(p + "\n" for p in paths)
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self):
+        self._f.close()
+
+def load_image(path):
+    with open(path, 'rb') as f:
+        return preprocess_image(f.read())
+
+def decoded_batches(paths, batch_size, workers, prefetch=2):
+    """
+    Yields (ok_paths, images, failures) per batch of paths. Up to `prefetch`
+    batches are decoding on the pool while the caller runs the model.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for start in range(0, len(paths), batch_size):
+            chunk = paths[start:start + batch_size]
+            pending.append([(p, pool.submit(load_image, p)) for p in chunk])
+            if len(pending) > prefetch:
+                yield collect(pending.popleft())
+        while pending:
+            yield collect(pending.popleft())
+
+def collect(futures):
+    ok_paths, images, failures = [], [], []
+    for path, future in futures:
+        try:
+            images.append(future.result())
+            ok_paths.append(path)
+        except Exception as e:
+            failures.append((path, str(e)))
+    return ok_paths, images, failures
+
+def format_eta(seconds):
+    h, rem = divmod(int(seconds), 3600)
+    m, s = divmod(rem, 60)
+    return f"{h}:{m:02d}:{s:02d}"
+
 def main():
-    print(f"⚔️  FashionCLIP Single File Analyzer")
-    print(f"   📸 Source: {config.SINGLE_IMAGE_PATH}")
-    print(f"   📂 Output: {config.OUTPUT_DIR}")
-    
-    # 1. Validate Input and Setup Output Directory
-    if not os.path.exists(config.SINGLE_IMAGE_PATH) or not is_image_file(config.SINGLE_IMAGE_PATH):
-        print(f"❌ Error: Source image not found or is not a valid image file.")
+    parser = argparse.ArgumentParser(description="FashionCLIP batch analyzer.")
+    parser.add_argument("inputs", nargs="*", help="Image files and/or folders (default: config.SINGLE_IMAGE_PATH)")
+    parser.add_argument("--manifest", help="Text file with one image path per line")
+    parser.add_argument("--out", help="Output folder (default: config.OUTPUT_DIR)")
+    parser.add_argument("--format", choices=sorted(SINKS), default="jsonl")
+    parser.add_argument("--row-group-size", type=int, default=4096, help="Rows per part (npy / parquet)")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1), help="Decode threads")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and overwrite the output")
+    args = parser.parse_args()
+
+    out_dir = args.out or config.OUTPUT_DIR
+    inputs = args.inputs or ([] if args.manifest else [config.SINGLE_IMAGE_PATH])
+    paths = collect_paths(inputs, args.manifest)
+
+    print("⚔️  FashionCLIP Batch Analyzer")
+    print(f"   📸 Source: {len(paths)} images")
+    print(f"   📂 Output: {out_dir} ({args.format})")
+    if not paths:
+        print("❌ Error: No images found.")
         return
 
-    # Create output directory if it doesn't exist
-    if not os.path.exists(config.OUTPUT_DIR):
-        os.makedirs(config.OUTPUT_DIR)
-        print(f"   ✅ Created output directory: {config.OUTPUT_DIR}")
+    os.makedirs(out_dir, exist_ok=True)
+    checkpoint_path = os.path.join(out_dir, CHECKPOINT_NAME)
+    if args.restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    checkpoint = Checkpoint(checkpoint_path)
+    todo = [p for p in paths if p not in checkpoint.done]
+    if len(todo) < len(paths):
+        print(f"   ⏩ Resuming: {len(paths) - len(todo)} already done")
+    if not todo:
+        print("\n✨ Nothing to do.")
+        checkpoint.close()
+        return
 
-    # 2. Init Model (Load once)
-    predictor = AttributePredictor(config.ONNX_MODEL_PATH, config.HF_MODEL_ID)
-    predictor.precompute_all_attributes(config.ATTRIBUTE_CANDIDATES)
+    # Init Model (Load once)
+    predictor = AttributePredictor(
+        config.ONNX_MODEL_PATH, config.HF_MODEL_ID,
+        vision_model_path=config.VISION_MODEL_PATH,
+        text_model_path=config.TEXT_MODEL_PATH,
+        optimized_model_dir=config.ORT_OPTIMIZED_DIR or None
+    )
+    predictor.precompute_all_attributes(config.ATTRIBUTE_CANDIDATES, cache_path=config.VOCAB_CACHE_PATH)
+    vocab = predictor.vocab
 
-    # 3. Init Pipeline for a single image
-    # The pipeline function expects a list of paths
-    pipeline = create_batch_pipeline([config.SINGLE_IMAGE_PATH])
-    iterator = pipeline.create_dict_iterator(output_numpy=True)
+    sink = open_sink(
+        args.format, out_dir, vocab, resume=not args.restart, row_group_size=args.row_group_size,
+        embedding_model=model_digest(predictor.vision_model_path)[:16]
+    )
+    # Failures are not checkpointed and get retried, so this run's list replaces the last one
+    errors = open(os.path.join(out_dir, ERRORS_NAME), 'w', encoding='utf-8')
 
-    # 4. Process the single image
     print("\n🔮 Starting Inference...")
     start_time = time.time()
-    
-    filename = os.path.basename(config.SINGLE_IMAGE_PATH)
+    done = failed = 0
+    last_report = 0.0
+    uncommitted = []  # Written to the sink but not yet durable
     try:
-        # Get the single item from the iterator
-        data = next(iter(iterator))
-        image_np = data['image'] # Shape (1, 3, 224, 224)
-        
-        # --- Inference ---
-        img_vector = predictor.get_image_embedding(image_np)
-        raw_attributes = predictor.classify_all(img_vector)
-        
-        # --- Formatting (Maintains original structure) ---
-        record = {
-            "id": str(uuid.uuid4()),
-            "filename": filename
-        }
-        
-        for key, (label, score) in raw_attributes.items():
-            record[key] = label
-
-        # --- Save Individual JSON ---
-        base_name = os.path.splitext(filename)[0]
-        json_filename = f"{base_name}.json"
-        output_path = os.path.join(config.OUTPUT_DIR, json_filename)
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(record, f, indent=4)
-        
-        print(f"   ✅ Saved: {output_path}")
-        
-    except Exception as e:
-        print(f"   ❌ Error processing {filename}: {e}")
+        for ok_paths, images, failures in decoded_batches(todo, args.batch_size, args.workers):
+            if images:
+                embeds = predictor.get_image_embeddings(np.concatenate(images, axis=0))
+                best, confidence = predictor.classify_indices(embeds, vocab)
+                labels = vocab.labels[best]
+                records = []
+                for path, row in zip(ok_paths, labels):
+                    # --- Formatting (Maintains original structure) ---
+                    record = {"id": str(uuid.uuid4()), "filename": os.path.basename(path), "path": path}
+                    record.update(zip(vocab.names, row))
+                    records.append(record)
+                uncommitted.extend(ok_paths)
+                if sink.write(records, embeds, confidence):
+                    checkpoint.mark(uncommitted)
+                    uncommitted = []
+
+            for path, error in failures:
+                print(f"   ❌ Error processing {path}: {error}")
+                errors.write(json.dumps({"path": path, "error": error}) + "\n")
+            errors.flush()
+
+            done += len(ok_paths)
+            failed += len(failures)
+
+            elapsed = time.time() - start_time
+            finished = done + failed
+            if elapsed - last_report >= 5.0 or finished == len(todo):
+                last_report = elapsed
+                rate = finished / elapsed
+                eta = (len(todo) - finished) / rate if rate else 0.0
+                print(f"   📊 {finished}/{len(todo)}  {rate:.1f} img/s  ETA {format_eta(eta)}")
+    except KeyboardInterrupt:
+        print("\n⏸️  Interrupted; run again to resume.")
+    finally:
+        sink.close()
+        checkpoint.mark(uncommitted)
+        errors.close()
+        checkpoint.close()
 
     end_time = time.time()
 
-    print(f"\n✨ Done! Processed 1 image.")
-    print(f"📊 Total Time: {end_time - start_time:.2f}s")
+    print(f"\n✨ Done! Processed {done} images ({failed} failed).")
+    print(f"📊 Total Time: {end_time - start_time:.2f}s ({done / max(end_time - start_time, 1e-9):.1f} img/s)")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,278 @@
+# metrics.py
+"""
+Minimal in-process Prometheus metrics for api_server.py (`GET /metrics`).
+
+Counters, gauges and histograms with a fixed set of label values, rendered
+in the Prometheus text exposition format (0.0.4). An observation is a bisect
+plus a few additions under a lock, so the metrics can stay on in production.
+
+Every process keeps its own metrics and every series carries a 'pid' label.
+With several workers (serve.py, or WEB_WORKERS > 1) a scrape through the
+shared socket lands on whichever worker accepts it, so on its own /metrics
+would only show that one worker. Registry.share(directory) fixes this: each
+worker flushes a snapshot of its metrics to <directory>/<pid>.json every few
+seconds, and a scrape renders its own live values plus the other workers'
+snapshots (up to one flush interval old). serve.py sets this up; aggregate
+across workers in the query, e.g. sum without (pid) (...).
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds: 0.5 ms .. 10 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {labels}")
+        return tuple(str(v) for v in labels)
+
+    def items(self):
+        """(label values + pid, value) pairs of this process."""
+        with self._lock:
+            items = [(key, self._copy(value)) for key, value in sorted(self._values.items())]
+        # pid added here: values set before serve.py forks belong to every worker
+        pid = str(os.getpid())
+        return [(key + (pid,), value) for key, value in items]
+
+    def render(self, items=None):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        names = self.labelnames + ("pid",)
+        lines.extend(self._render_items(names, self.items() if items is None else items))
+        return lines
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+    def _render_items(self, names, items):
+        return [f"{self.name}{_format_labels(names, key)} {_format_value(v)}" for key, v in items]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts + overflow, sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][i] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    @staticmethod
+    def _copy(value):
+        return [list(value[0]), value[1]]
+
+    def _render_items(self, names, items):
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = (("le", _format_value(float(bound))),)
+                lines.append(f"{self.name}_bucket{_format_labels(names, key, le)} {cumulative}")
+            labels = _format_labels(names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.directory = None
+
+    def share(self, directory):
+        """Renders the snapshots other worker processes flush into `directory` as well."""
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+    def flush(self):
+        """Writes this process's metrics to <directory>/<pid>.json (atomic replace)."""
+        if self.directory is None:
+            return
+        snapshot = {metric.name: metric.items() for metric in self.metrics}
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(snapshot, f)
+        os.replace(path + ".tmp", path)
+
+    def _other_workers(self):
+        """{metric name: items} from the other processes' snapshots."""
+        merged = {}
+        own = f"{os.getpid()}.json"
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".json") or name == own:
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                # Worker exited and serve.py removed its snapshot
+                continue
+            for metric, items in snapshot.items():
+                merged.setdefault(metric, []).extend((tuple(key), value) for key, value in items)
+        return merged
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self):
+        """Text exposition; reads the other workers' snapshots when shared (blocking I/O)."""
+        others = self._other_workers() if self.directory is not None else {}
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render(metric.items() + others.get(metric.name, [])))
+        return "\n".join(lines) + "\n"
+
+
+# --- API metrics ---
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "fashionclip_stage_seconds",
+    "Time per request-path stage: read, decode, preprocess, embedding, classify, serialize. "
+    "embedding/classify are per model batch.",
+    ("stage",)
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "fashionclip_request_seconds", "End-to-end HTTP request latency.", ("endpoint",)
+)
+REQUESTS = REGISTRY.counter(
+    "fashionclip_requests_total", "HTTP requests by endpoint and status code.", ("endpoint", "status")
+)
+IN_FLIGHT = REGISTRY.gauge(
+    "fashionclip_requests_in_flight", "HTTP requests being handled.", ("endpoint",)
+)
+IMAGES = REGISTRY.counter(
+    "fashionclip_images_total", "Analyzed images by outcome (inferred, cached, error).", ("outcome",)
+)
+BATCH_SIZE = REGISTRY.histogram(
+    "fashionclip_batch_size", "Images per model call.", buckets=BATCH_SIZE_BUCKETS
+)
+BATCHES_IN_FLIGHT = REGISTRY.gauge(
+    "fashionclip_batches_in_flight", "Model calls currently running."
+)
+BATCH_QUEUE = REGISTRY.gauge(
+    "fashionclip_batch_queue_length", "Images waiting in the micro-batcher (at scrape time)."
+)
+MODEL_LOAD_SECONDS = REGISTRY.gauge(
+    "fashionclip_model_load_seconds", "Startup time of the model, by phase (vocabulary, total).", ("phase",)
+)
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware: request counter, latency histogram and in-flight gauge per
+    endpoint. Paths not in `endpoints` are counted as 'other', so scanners and
+    typos cannot create unbounded label values. Streaming responses are timed
+    until their last chunk is sent.
+    """
+    def __init__(self, app, endpoints):
+        self.app = app
+        self.endpoints = frozenset(endpoints)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        endpoint = scope["path"] if scope["path"] in self.endpoints else "other"
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        IN_FLIGHT.inc(endpoint)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            IN_FLIGHT.dec(endpoint)
+            REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint)
+            REQUESTS.inc(endpoint, status)
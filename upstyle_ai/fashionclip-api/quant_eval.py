@@ -0,0 +1,192 @@
+# quant_eval.py
+"""
+Regression harness for quantized model variants.
+
+Runs a local image folder through the fp32 reference and each variant (every
+variant in its own process, so load time and peak RSS are measured cleanly),
+then reports per-attribute top-1 agreement with fp32, confidence drift and
+latency/RSS, to decide whether a variant is safe to ship.
+
+    python onnx_tools.py quantize --variant int8
+    python quant_eval.py --images ../clothes_data/imgs --variants int8 fp16
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+
+
+def list_images(folder, limit=None):
+    paths = sorted(
+        os.path.join(folder, f) for f in os.listdir(folder)
+        if f.lower().endswith(IMAGE_EXTS)
+    )
+    return paths[:limit] if limit else paths
+
+
+def run_variant(variant, image_paths, out_path):
+    """Child process: load one variant, classify every image, dump results to out_path."""
+    os.environ["MODEL_VARIANT"] = variant
+    import config
+    from preprocessing import preprocess_image
+    from inference import AttributePredictor
+
+    t0 = time.perf_counter()
+    predictor = AttributePredictor(
+        config.ONNX_MODEL_PATH, config.HF_MODEL_ID,
+        vision_model_path=config.VISION_MODEL_PATH,
+        text_model_path=config.TEXT_MODEL_PATH
+    )
+    predictor.precompute_all_attributes(config.ATTRIBUTE_CANDIDATES, cache_path=config.VOCAB_CACHE_PATH)
+    load_s = time.perf_counter() - t0
+
+    images = []
+    for path in image_paths:
+        with open(path, 'rb') as f:
+            images.append(preprocess_image(f.read()))
+
+    # Warm-up run so the first-inference allocation is not counted
+    predictor.get_image_embedding(images[0])
+
+    best, conf, latencies = [], [], []
+    for image_np in images:
+        t = time.perf_counter()
+        b, c = predictor.classify_indices(predictor.get_image_embedding(image_np))
+        latencies.append(time.perf_counter() - t)
+        best.append(b[0])
+        conf.append(c[0])
+
+    np.savez(
+        out_path,
+        names=np.array(predictor.vocab.names),
+        labels=predictor.vocab.labels.astype(str),
+        best=np.array(best),
+        conf=np.array(conf, dtype=np.float32),
+        latency=np.array(latencies),
+        load_s=np.array(load_s),
+        # ru_maxrss is KiB on Linux
+        peak_rss_mb=np.array(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0),
+    )
+
+
+def collect(variant, image_paths, workdir):
+    out_path = os.path.join(workdir, f"{variant}.npz")
+    list_path = os.path.join(workdir, "images.json")
+    with open(list_path, "w") as f:
+        json.dump(image_paths, f)
+
+    print(f"🔮 Running {variant}...")
+    subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", variant, "--image-list", list_path, "--out", out_path],
+        check=True
+    )
+    with np.load(out_path, allow_pickle=False) as data:
+        return {k: data[k] for k in data.files}
+
+
+def compare(ref, res):
+    """Per-attribute top-1 agreement and confidence drift of res vs the fp32 reference."""
+    if list(ref["names"]) != list(res["names"]) or list(ref["labels"]) != list(res["labels"]):
+        raise SystemExit("❌ Variants were run with different vocabularies")
+
+    agree = ref["best"] == res["best"]
+    drift = np.abs(ref["conf"] - res["conf"])
+    per_attr = {
+        str(name): {
+            "agreement": float(agree[:, i].mean()),
+            "mean_conf_drift": float(drift[:, i].mean()),
+            "max_conf_drift": float(drift[:, i].max()),
+        }
+        for i, name in enumerate(ref["names"])
+    }
+    return {
+        "agreement": float(agree.mean()),
+        "all_attributes_agree": float(agree.all(axis=1).mean()),
+        "mean_conf_drift": float(drift.mean()),
+        "per_attribute": per_attr,
+    }
+
+
+def perf(res):
+    lat = res["latency"] * 1000.0
+    return {
+        "load_s": float(res["load_s"]),
+        "latency_ms_mean": float(lat.mean()),
+        "latency_ms_p50": float(np.percentile(lat, 50)),
+        "latency_ms_p95": float(np.percentile(lat, 95)),
+        "peak_rss_mb": float(res["peak_rss_mb"]),
+    }
+
+
+def print_report(report):
+    print("\n" + "=" * 72)
+    print(" " * 22 + "QUANTIZATION REPORT")
+    print("=" * 72)
+    print(f"{'variant':<10}{'load s':>9}{'mean ms':>10}{'p95 ms':>9}{'RSS MB':>10}{'top-1 agree':>14}{'drift':>9}")
+    for variant, r in report["variants"].items():
+        p = r["perf"]
+        agree = f"{r['agreement']:.1%}" if "agreement" in r else "ref"
+        drift = f"{r['mean_conf_drift']:.3f}" if "mean_conf_drift" in r else "-"
+        print(f"{variant:<10}{p['load_s']:>9.2f}{p['latency_ms_mean']:>10.1f}{p['latency_ms_p95']:>9.1f}"
+              f"{p['peak_rss_mb']:>10.0f}{agree:>14}{drift:>9}")
+
+    for variant, r in report["variants"].items():
+        if "per_attribute" not in r:
+            continue
+        print(f"\n--- {variant}: per-attribute agreement with fp32 (worst first) ---")
+        rows = sorted(r["per_attribute"].items(), key=lambda kv: kv[1]["agreement"])
+        for name, a in rows:
+            print(f"   {name:<22} {a['agreement']:>7.1%}   drift {a['mean_conf_drift']:.3f} (max {a['max_conf_drift']:.3f})")
+    print("=" * 72)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare quantized variants against fp32.")
+    parser.add_argument("--images", help="Folder of test images")
+    parser.add_argument("--variants", nargs="+", default=["int8"])
+    parser.add_argument("--limit", type=int, default=None, help="Use only the first N images")
+    parser.add_argument("--report", default=None, help="Write the full report as JSON")
+    # Internal: child process mode
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--image-list", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        with open(args.image_list) as f:
+            run_variant(args.worker, json.load(f), args.out)
+        return
+
+    if not args.images:
+        parser.error("--images is required")
+    image_paths = list_images(args.images, args.limit)
+    if not image_paths:
+        raise SystemExit(f"❌ No images found in {args.images}")
+    print(f"📸 {len(image_paths)} images from {args.images}")
+
+    report = {"images": len(image_paths), "variants": {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        ref = collect("fp32", image_paths, workdir)
+        report["variants"]["fp32"] = {"perf": perf(ref)}
+        for variant in args.variants:
+            if variant == "fp32":
+                continue
+            res = collect(variant, image_paths, workdir)
+            report["variants"][variant] = {"perf": perf(res), **compare(ref, res)}
+
+    print_report(report)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"📝 Report saved: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
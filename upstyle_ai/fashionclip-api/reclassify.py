@@ -0,0 +1,100 @@
+# reclassify.py
+"""
+Re-labels a previous batch run after ATTRIBUTE_CANDIDATES changed, without
+running the vision model again: the stored image embeddings (main.py
+--format npy / parquet) are scored against the current text matrix, one
+matmul per chunk.
+
+    python main.py ../clothes_data/imgs --out runs/v1 --format npy
+    # ... edit config.ATTRIBUTE_CANDIDATES ...
+    python reclassify.py runs/v1 --out runs/v2
+"""
+import argparse
+import os
+import time
+import numpy as np
+import config
+from inference import AttributePredictor
+from sinks import SINKS, open_sink, read_parts
+from vocabulary import model_digest
+
+BASE_FIELDS = ("id", "path", "filename")
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-classify stored embeddings with the current vocabulary.")
+    parser.add_argument("src", help="Output folder of an npy/parquet run")
+    parser.add_argument("--out", required=True, help="Output folder for the new labels")
+    parser.add_argument("--format", choices=sorted(SINKS), default="npy")
+    parser.add_argument("--chunk-size", type=int, default=65536)
+    parser.add_argument("--row-group-size", type=int, default=65536)
+    parser.add_argument("--force", action="store_true", help="Allow embeddings from a different vision model")
+    args = parser.parse_args()
+
+    if os.path.abspath(args.src) == os.path.abspath(args.out):
+        raise SystemExit("❌ --out must differ from the source run")
+    parts = read_parts(args.src)
+
+    # The vision model is never loaded (split models); with a current vocabulary cache
+    # neither is the text model
+    predictor = AttributePredictor(
+        config.ONNX_MODEL_PATH, config.HF_MODEL_ID,
+        vision_model_path=config.VISION_MODEL_PATH,
+        text_model_path=config.TEXT_MODEL_PATH,
+        load_vision=False
+    )
+    predictor.precompute_all_attributes(config.ATTRIBUTE_CANDIDATES, cache_path=config.VOCAB_CACHE_PATH)
+    vocab = predictor.vocab
+    current_model = model_digest(predictor.vision_model_path)[:16]
+
+    sink = open_sink(args.format, args.out, vocab, resume=False, row_group_size=args.row_group_size,
+                     embedding_model=current_model)
+
+    print(f"\n🔁 Re-classifying {args.src} -> {args.out} (vocabulary {vocab.version})")
+    start_time = time.time()
+    total = 0
+    changed = {}  # attribute -> rows whose label changed (attributes present in both runs)
+    try:
+        for part in parts:
+            schema = part["schema"]
+            stored_model = schema.get("embedding_model")
+            if stored_model and stored_model != current_model and not args.force:
+                raise SystemExit(
+                    f"❌ Embeddings come from vision model {stored_model}, current is {current_model} "
+                    f"(re-run main.py, or --force)"
+                )
+            old_labels = {
+                attr["name"]: np.array(attr["labels"], dtype=object)[part["labels"][:, i]]
+                for i, attr in enumerate(schema["attributes"])
+            }
+
+            embeddings = part["embeddings"]
+            for lo in range(0, len(embeddings), args.chunk_size):
+                chunk = np.asarray(embeddings[lo:lo + args.chunk_size], dtype=np.float32)
+                best, confidence = predictor.classify_indices(chunk, vocab)
+                labels = vocab.labels[best]
+
+                records = []
+                for record, row in zip(part["records"][lo:lo + len(chunk)], labels):
+                    new = {k: record[k] for k in BASE_FIELDS}
+                    new.update(zip(vocab.names, row))
+                    records.append(new)
+                sink.write(records, chunk, confidence)
+
+                for i, name in enumerate(vocab.names):
+                    if name in old_labels:
+                        diff = int((old_labels[name][lo:lo + len(chunk)] != labels[:, i]).sum())
+                        changed[name] = changed.get(name, 0) + diff
+                total += len(chunk)
+    finally:
+        sink.close()
+
+    elapsed = time.time() - start_time
+    print(f"\n✨ Done! {total} items in {elapsed:.2f}s ({total / max(elapsed, 1e-9):.0f} items/s)")
+    new_attrs = [name for name in vocab.names if name not in changed]
+    for name, n in changed.items():
+        print(f"   {name:<22} {n:>8} changed ({n / max(total, 1):.1%})")
+    for name in new_attrs:
+        print(f"   {name:<22} (new attribute)")
+
+if __name__ == "__main__":
+    main()
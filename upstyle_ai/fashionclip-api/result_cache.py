@@ -0,0 +1,184 @@
+# result_cache.py
+"""
+Content-addressed cache of /analyze results.
+
+Keys are SHA-256(model/vocabulary version + image bytes), so re-uploads of the
+same photo skip inference, and any change to the model, the preprocessing or
+ATTRIBUTE_CANDIDATES produces new keys (old entries simply age out).
+
+Tier 1 is an in-process LRU bounded by item count and TTL. Tier 2 is an optional
+SQLite file that survives restarts and can be shared by workers on one host;
+every evict_every writes, expired rows are deleted and the table is trimmed to
+sqlite_max_items (oldest first).
+
+QueryEmbeddingCache is a plain LRU of /search query text embeddings.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+class ResultCache:
+    def __init__(self, max_items=2048, ttl_s=86400.0, sqlite_path=None,
+                 sqlite_max_items=100000, evict_every=256):
+        self.max_items = max(1, int(max_items))
+        self.ttl_s = float(ttl_s)
+        self.sqlite_max_items = max(1, int(sqlite_max_items))
+        self.evict_every = max(1, int(evict_every))
+        self._puts = 0
+        self._items = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+        self._db = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, created REAL, attributes TEXT, embedding BLOB)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_created ON results (created)")
+            self._evict(time.time())
+
+        # --- Stats ---
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(image_bytes, version):
+        h = hashlib.sha256(version.encode())
+        h.update(image_bytes)
+        return h.hexdigest()
+
+    def lookup(self, image_bytes, version):
+        """Hashes the image and returns (key, value or None)."""
+        key = self.make_key(image_bytes, version)
+        return key, self.get(key)
+
+    def get(self, key):
+        """Returns {'embedding': (512,) float32, 'attributes': {attr: (label, conf)}} or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._items[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT created, attributes, embedding FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[0] + self.ttl_s > now:
+                    value = {
+                        "attributes": {k: tuple(v) for k, v in json.loads(row[1]).items()},
+                        "embedding": np.frombuffer(row[2], dtype=np.float32),
+                    }
+                    self._remember(key, value, row[0] + self.ttl_s)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+                if row is not None:
+                    self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+
+            self.misses += 1
+            return None
+
+    def put(self, key, embedding, raw_attributes):
+        value = {
+            "attributes": {k: (label, float(conf)) for k, (label, conf) in raw_attributes.items()},
+            "embedding": np.asarray(embedding, dtype=np.float32).reshape(-1),
+        }
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now + self.ttl_s)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, created, attributes, embedding) VALUES (?, ?, ?, ?)",
+                    (key, now, json.dumps(value["attributes"]), value["embedding"].tobytes())
+                )
+                self._puts += 1
+                if self._puts % self.evict_every == 0:
+                    self._evict(now)
+
+    def _evict(self, now):
+        """Deletes expired rows, then the oldest rows beyond sqlite_max_items."""
+        self._db.execute("DELETE FROM results WHERE created <= ?", (now - self.ttl_s,))
+        self._db.execute(
+            "DELETE FROM results WHERE key IN ("
+            "SELECT key FROM results ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.sqlite_max_items,)
+        )
+
+    def _remember(self, key, value, expires_at):
+        self._items[key] = (expires_at, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "items": len(self._items),
+            "max_items": self.max_items,
+            "ttl_s": self.ttl_s,
+            "sqlite": self._db is not None,
+            "sqlite_max_items": self.sqlite_max_items if self._db is not None else None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class QueryEmbeddingCache:
+    def __init__(self, max_items=1024):
+        self.max_items = max(1, int(max_items))
+        self._items = OrderedDict()  # normalized query text -> (512,) float32
+        self._lock = threading.Lock()
+
+        # --- Stats ---
+        self.hits = 0
+        self.misses = 0
+        self.encode_ms_total = 0.0
+
+    @staticmethod
+    def normalize(text):
+        return " ".join(text.lower().split())
+
+    def get(self, text):
+        with self._lock:
+            vec = self._items.get(text)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(text)
+            self.hits += 1
+            return vec
+
+    def put(self, text, vec, encode_ms):
+        """Stores a freshly encoded query; encode_ms feeds the cold-latency stat."""
+        with self._lock:
+            self._items[text] = vec
+            self._items.move_to_end(text)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+            self.encode_ms_total += encode_ms
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "items": len(self._items),
+            "max_items": self.max_items,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "cold_encode_ms_avg": round(self.encode_ms_total / self.misses, 2) if self.misses else None,
+        }
@@ -0,0 +1,183 @@
+# serve.py
+"""
+Pre-fork multi-worker server for api_server.py.
+
+`uvicorn --workers N` loads the ONNX weights, the text matrix and the processor
+N times. Here the parent loads them once, binds the listening socket and forks
+N workers that inherit the model copy-on-write, so the weights are counted once
+in PSS no matter how many workers run.
+
+    python serve.py --workers 4 --port 8080
+
+Forked ONNX Runtime sessions cannot use the parent's intra-op thread pool (the
+threads do not survive fork), so every worker runs ORT single-threaded and N
+workers use N cores. The parent logs per-worker RSS/PSS/USS every
+MEMORY_REPORT_INTERVAL seconds.
+
+Workers flush their /metrics snapshots to METRICS_DIR (a temporary directory
+unless set), so a scrape answered by any worker covers all of them; the parent
+removes the snapshot of a worker that exits.
+"""
+import argparse
+import gc
+import logging
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+# Per-worker threading must be fixed before config.py is imported
+if os.environ.get("ORT_INTRA_OP_THREADS", "1") != "1":
+    print("⚠️  serve.py forces ORT_INTRA_OP_THREADS=1 (ORT thread pools are not fork-safe)")
+os.environ["ORT_INTRA_OP_THREADS"] = "1"
+os.environ.setdefault("INFERENCE_THREADS", "1")
+os.environ.setdefault("PREPROCESS_THREADS", "1")
+
+import config
+import api_server
+
+logger = logging.getLogger("serve")
+
+
+def bind_socket(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock):
+    """Child process: serve the already-loaded app on the shared socket."""
+    import uvicorn
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    server = uvicorn.Server(uvicorn.Config(api_server.app, log_level="info"))
+    try:
+        server.run(sockets=[sock])
+    finally:
+        os._exit(0)
+
+
+def spawn(sock):
+    pid = os.fork()
+    if pid == 0:
+        run_worker(sock)
+    return pid
+
+
+def drop_metrics(pid):
+    """Removes an exited worker's /metrics snapshot."""
+    try:
+        os.remove(os.path.join(config.METRICS_DIR, f"{pid}.json"))
+    except FileNotFoundError:
+        pass
+
+
+def memory_report(pids):
+    """Logs RSS/PSS/USS per worker; PSS is the fair share of pages shared after fork."""
+    try:
+        import psutil
+    except ImportError:
+        return
+
+    rows = []
+    for label, pid in [("parent", os.getpid())] + [(f"worker {i}", p) for i, p in enumerate(pids)]:
+        try:
+            mem = psutil.Process(pid).memory_full_info()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+        rows.append((label, pid, mem.rss, getattr(mem, "pss", 0), getattr(mem, "uss", 0)))
+
+    logger.info("🧠 Memory (MB)      pid        RSS        PSS        USS")
+    for label, pid, rss, pss, uss in rows:
+        logger.info(f"   {label:<12} {pid:>7} {rss / 1e6:>10.1f} {pss / 1e6:>10.1f} {uss / 1e6:>10.1f}")
+    workers = rows[1:]
+    if workers:
+        logger.info(
+            f"   total RSS {sum(r[2] for r in rows) / 1e6:.1f} MB vs "
+            f"total PSS {sum(r[3] for r in rows) / 1e6:.1f} MB (actual footprint)"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fork FashionCLIP API server.")
+    parser.add_argument("--workers", type=int, default=config.WEB_WORKERS)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8080)))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    # 1. Load the model ONCE, then bind
+    api_server.init_predictor()
+    sock = bind_socket(args.host, args.port)
+
+    # Shared /metrics snapshots; stale ones from an earlier run are removed
+    own_metrics_dir = not config.METRICS_DIR
+    if own_metrics_dir:
+        config.METRICS_DIR = tempfile.mkdtemp(prefix="fashionclip-metrics-")
+    os.makedirs(config.METRICS_DIR, exist_ok=True)
+    for name in os.listdir(config.METRICS_DIR):
+        if name.endswith(".json") and name[:-len(".json")].isdigit():
+            os.remove(os.path.join(config.METRICS_DIR, name))
+
+    # Keep the loaded objects out of the GC's reach so the children do not
+    # touch (and thereby copy) their pages
+    gc.collect()
+    gc.freeze()
+
+    # 2. Fork workers
+    workers = [spawn(sock) for _ in range(args.workers)]
+    logger.info(f"🚀 {args.workers} workers on {args.host}:{args.port} (pids {workers})")
+
+    stopping = False
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    # 3. Supervise: respawn crashed workers, report memory
+    next_report = time.time() + min(10, config.MEMORY_REPORT_INTERVAL)
+    while workers:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+
+        if pid:
+            drop_metrics(pid)
+            i = workers.index(pid)
+            if stopping:
+                workers.pop(i)
+                continue
+            logger.warning(f"⚠️  Worker {pid} exited ({status}), respawning")
+            workers[i] = spawn(sock)
+            continue
+
+        if time.time() >= next_report and not stopping:
+            memory_report(workers)
+            next_report = time.time() + config.MEMORY_REPORT_INTERVAL
+        time.sleep(0.5)
+
+    sock.close()
+    if own_metrics_dir:
+        shutil.rmtree(config.METRICS_DIR, ignore_errors=True)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
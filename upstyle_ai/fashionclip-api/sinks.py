@@ -0,0 +1,247 @@
+# sinks.py
+"""
+Output sinks for batch runs (main.py).
+
+A sink gets one batch at a time: write(records, embeddings, confidences) with
+records = [{"id", "path", "filename", attribute: label, ...}], embeddings (B, 512)
+and confidences (B, num_attributes) in vocabulary order. write() returns True
+once everything received so far is durable on disk; main.py only checkpoints
+paths after that. close() writes whatever is still buffered.
+With resume=True a sink appends to the previous run's output.
+
+Formats:
+- json:    one indented JSON file per image (the original main.py output)
+- jsonl:   results.jsonl, one line per image
+- npy:     columnar parts of row_group_size rows: part-NNNNN.jsonl (records)
+           plus .labels.npy (N, A) int16 label index per attribute,
+           .confidences.npy (N, A) float32 and .embeddings.npy (N, 512) float32.
+           Label names per attribute are in schema.json.
+- parquet: one part-NNNNN.parquet per row group (needs pyarrow): a dictionary
+           string column per attribute, <attribute>_confidence and embedding.
+
+read_parts() loads npy or parquet output back (reclassify.py).
+"""
+import abc
+import glob
+import json
+import os
+import numpy as np
+
+SCHEMA_NAME = "schema.json"
+
+
+class JsonDirSink:
+    def __init__(self, out_dir, vocab, resume=True, row_group_size=None, embedding_model=None):
+        self.out_dir = out_dir
+
+    def write(self, records, embeddings, confidences):
+        for record in records:
+            base_name = os.path.splitext(record["filename"])[0]
+            with open(os.path.join(self.out_dir, f"{base_name}.json"), 'w', encoding='utf-8') as f:
+                json.dump(record, f, indent=4)
+        return True
+
+    def close(self):
+        pass
+
+
+class JsonlSink:
+    def __init__(self, out_dir, vocab, resume=True, row_group_size=None, embedding_model=None):
+        self.path = os.path.join(out_dir, "results.jsonl")
+        self._f = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+
+    def write(self, records, embeddings, confidences):
+        self._f.writelines(json.dumps(record) + "\n" for record in records)
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        return True
+
+    def close(self):
+        self._f.close()
+
+
+def write_durable(path, write_fn, mode='wb'):
+    """Writes via a temp file + fsync + rename, so a part is either complete or absent."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, mode) as f:
+        write_fn(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class PartSink(abc.ABC):
+    """Buffers rows and writes them out as numbered parts of row_group_size rows."""
+    part_ext = None
+
+    def __init__(self, out_dir, vocab, resume=True, row_group_size=4096, embedding_model=None):
+        self.out_dir = out_dir
+        self.vocab = vocab
+        self.row_group_size = row_group_size
+        self.schema = {
+            # Digest of the vision model that produced the embeddings
+            "embedding_model": embedding_model,
+            "vocab_version": vocab.version,
+            "embedding_dim": int(vocab.matrix.shape[1]),
+            "attributes": [
+                {"name": name, "labels": vocab.labels[vocab.offsets[i]:vocab.offsets[i + 1]].tolist()}
+                for i, name in enumerate(vocab.names)
+            ],
+        }
+        # label -> index within its attribute
+        self._label_index = [
+            {label: j for j, label in enumerate(attr["labels"])} for attr in self.schema["attributes"]
+        ]
+
+        existing = sorted(glob.glob(os.path.join(out_dir, f"part-*{self.part_ext}")))
+        schema_path = os.path.join(out_dir, SCHEMA_NAME)
+        if not resume:
+            for path in glob.glob(os.path.join(out_dir, "part-*")):
+                os.remove(path)
+            existing = []
+        elif existing and os.path.exists(schema_path):
+            with open(schema_path, encoding='utf-8') as f:
+                if json.load(f) != self.schema:
+                    raise ValueError(f"{out_dir} was written with another vocabulary; use --restart or a new --out")
+        write_durable(schema_path, lambda f: json.dump(self.schema, f, indent=2), mode='w')
+
+        self._next_part = len(existing)
+        self._records, self._embeds, self._confs = [], [], []
+
+    def write(self, records, embeddings, confidences):
+        self._records.extend(records)
+        self._embeds.append(np.asarray(embeddings, dtype=np.float32))
+        self._confs.append(np.asarray(confidences, dtype=np.float32))
+        while len(self._records) >= self.row_group_size:
+            self._flush_part(self.row_group_size)
+        return not self._records
+
+    def close(self):
+        if self._records:
+            self._flush_part(len(self._records))
+
+    def _flush_part(self, n):
+        records, self._records = self._records[:n], self._records[n:]
+        embeds = np.concatenate(self._embeds)
+        confs = np.concatenate(self._confs)
+        self._embeds, self._confs = [embeds[n:]], [confs[n:]]
+        labels = np.array([
+            [index[record[attr["name"]]] for index, attr in zip(self._label_index, self.schema["attributes"])]
+            for record in records
+        ], dtype=np.int16).reshape(len(records), -1)
+
+        prefix = os.path.join(self.out_dir, f"part-{self._next_part:05d}")
+        self._write_part(prefix, records, labels, confs[:n], embeds[:n])
+        self._next_part += 1
+
+    @abc.abstractmethod
+    def _write_part(self, prefix, records, labels, confidences, embeddings):
+        """Writes one part; prefix is the part's path without extension."""
+
+
+class NpySink(PartSink):
+    # The .jsonl is written last: a part counts only once it exists
+    part_ext = ".jsonl"
+
+    def _write_part(self, prefix, records, labels, confidences, embeddings):
+        write_durable(prefix + ".labels.npy", lambda f: np.save(f, labels))
+        write_durable(prefix + ".confidences.npy", lambda f: np.save(f, confidences))
+        write_durable(prefix + ".embeddings.npy", lambda f: np.save(f, embeddings))
+        write_durable(
+            prefix + ".jsonl",
+            lambda f: f.writelines(json.dumps(record) + "\n" for record in records),
+            mode='w'
+        )
+
+
+class ParquetSink(PartSink):
+    part_ext = ".parquet"
+
+    def __init__(self, *args, **kwargs):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise RuntimeError("--format parquet needs pyarrow (pip install pyarrow)") from e
+        self.pa, self.pq = pyarrow, pyarrow.parquet
+        super().__init__(*args, **kwargs)
+
+    def _write_part(self, prefix, records, labels, confidences, embeddings):
+        pa = self.pa
+        columns = {
+            "id": pa.array([r["id"] for r in records]),
+            "path": pa.array([r["path"] for r in records]),
+            "filename": pa.array([r["filename"] for r in records]),
+        }
+        for i, attr in enumerate(self.schema["attributes"]):
+            columns[attr["name"]] = pa.DictionaryArray.from_arrays(
+                pa.array(labels[:, i].astype(np.int32)), pa.array(attr["labels"])
+            )
+            columns[f"{attr['name']}_confidence"] = pa.array(confidences[:, i])
+        columns["embedding"] = pa.FixedSizeListArray.from_arrays(
+            pa.array(embeddings.reshape(-1)), embeddings.shape[1]
+        )
+        table = pa.table(columns).replace_schema_metadata({SCHEMA_NAME: json.dumps(self.schema)})
+        write_durable(prefix + ".parquet", lambda f: self.pq.write_table(table, f))
+
+
+SINKS = {"json": JsonDirSink, "jsonl": JsonlSink, "npy": NpySink, "parquet": ParquetSink}
+
+
+def open_sink(fmt, out_dir, vocab, resume=True, row_group_size=4096, embedding_model=None):
+    os.makedirs(out_dir, exist_ok=True)
+    return SINKS[fmt](out_dir, vocab, resume=resume, row_group_size=row_group_size,
+                      embedding_model=embedding_model)
+
+
+def read_npy_parts(out_dir, mmap=True):
+    """
+    Yields one dict per complete npy part: 'records' (list of dicts), 'labels',
+    'confidences', 'embeddings' (memory-mapped by default), plus the schema
+    (attribute names/labels) as 'schema'.
+    """
+    with open(os.path.join(out_dir, SCHEMA_NAME), encoding='utf-8') as f:
+        schema = json.load(f)
+    mmap_mode = 'r' if mmap else None
+    for jsonl_path in sorted(glob.glob(os.path.join(out_dir, "part-*.jsonl"))):
+        prefix = jsonl_path[:-len(".jsonl")]
+        with open(jsonl_path, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        yield {
+            "schema": schema,
+            "records": records,
+            "labels": np.load(prefix + ".labels.npy", mmap_mode=mmap_mode),
+            "confidences": np.load(prefix + ".confidences.npy", mmap_mode=mmap_mode),
+            "embeddings": np.load(prefix + ".embeddings.npy", mmap_mode=mmap_mode),
+        }
+
+
+def read_parquet_parts(out_dir):
+    """Same dicts as read_npy_parts, from parquet parts."""
+    import pyarrow.parquet as pq
+
+    for path in sorted(glob.glob(os.path.join(out_dir, "part-*.parquet"))):
+        table = pq.read_table(path)
+        schema = json.loads(table.schema.metadata[SCHEMA_NAME.encode()])
+        names = [attr["name"] for attr in schema["attributes"]]
+        embeddings = table.column("embedding").combine_chunks()
+        yield {
+            "schema": schema,
+            "records": table.select(["id", "path", "filename"] + names).to_pylist(),
+            "labels": np.stack([
+                table.column(name).combine_chunks().indices.to_numpy() for name in names
+            ], axis=1).astype(np.int16),
+            "confidences": np.stack([
+                table.column(f"{name}_confidence").to_numpy() for name in names
+            ], axis=1),
+            "embeddings": embeddings.flatten().to_numpy().reshape(len(table), embeddings.type.list_size),
+        }
+
+
+def read_parts(out_dir):
+    """Parts of an npy or parquet run (the formats that keep embeddings)."""
+    if glob.glob(os.path.join(out_dir, "part-*.parquet")):
+        return read_parquet_parts(out_dir)
+    if glob.glob(os.path.join(out_dir, "part-*.jsonl")):
+        return read_npy_parts(out_dir)
+    raise ValueError(f"No npy/parquet parts in {out_dir} (json/jsonl output has no embeddings)")
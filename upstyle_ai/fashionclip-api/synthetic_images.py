@@ -0,0 +1,100 @@
+# synthetic_images.py
+"""
+Generated test images for load_test.py and bench_suite.py, so neither needs a
+folder of real photos. Each kind mimics a class of real upload:
+
+    thumb    320x320 JPEG        (already-resized app upload)
+    photo    1280x960 JPEG       (typical web image)
+    phone    4032x3024 JPEG      (12 MP camera original)
+    png      800x800 PNG         (screenshot / cut-out product shot)
+    corrupt  truncated JPEG      (exercises the error path)
+
+A mix is written "photo=3,phone=1": kind=weight, comma separated.
+"""
+import io
+import os
+import random
+import numpy as np
+from PIL import Image
+
+IMAGE_KINDS = {
+    "thumb": (320, 320, "JPEG"),
+    "photo": (1280, 960, "JPEG"),
+    "phone": (4032, 3024, "JPEG"),
+    "png": (800, 800, "PNG"),
+    "corrupt": (1280, 960, "JPEG"),
+}
+CONTENT_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png"}
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+
+
+def synthetic_image(width, height, fmt="JPEG", seed=0):
+    """Smooth random colour field plus noise: compresses roughly like a photo."""
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, (max(1, height // 64), max(1, width // 64), 3), dtype=np.uint8)
+    img = Image.fromarray(coarse).resize((width, height), Image.BICUBIC)
+    noisy = np.asarray(img, dtype=np.int16) + rng.integers(-12, 13, (height, width, 3), dtype=np.int16)
+    img = Image.fromarray(np.clip(noisy, 0, 255).astype(np.uint8))
+    buf = io.BytesIO()
+    if fmt == "JPEG":
+        img.save(buf, format=fmt, quality=90)
+    else:
+        img.save(buf, format=fmt)
+    return buf.getvalue()
+
+
+def make_image(kind, seed=0):
+    """(bytes, content_type) for one image of the given kind."""
+    width, height, fmt = IMAGE_KINDS[kind]
+    data = synthetic_image(width, height, fmt, seed)
+    if kind == "corrupt":
+        data = data[:len(data) // 3]
+    return data, CONTENT_TYPES[fmt]
+
+
+def parse_mix(spec):
+    """'photo=3,phone=1' -> {'photo': 3.0, 'phone': 1.0}. A kind without '=' has weight 1."""
+    mix = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        kind, _, weight = part.partition("=")
+        if kind not in IMAGE_KINDS:
+            raise ValueError(f"Unknown image kind {kind!r} (choose from {', '.join(IMAGE_KINDS)})")
+        mix[kind] = float(weight) if weight else 1.0
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError(f"Empty image mix: {spec!r}")
+    return mix
+
+
+class ImageMix:
+    """Draws (kind, bytes, content_type) by weight from a few pre-generated images per kind."""
+
+    def __init__(self, images, weights, seed=0):
+        """images: {kind: [(bytes, content_type), ...]}; weights: {kind: weight}."""
+        self.images = images
+        self.kinds = list(weights)
+        self.weights = [weights[k] for k in self.kinds]
+        self._rng = random.Random(seed)
+
+    @classmethod
+    def synthetic(cls, spec, variants=4, seed=0):
+        weights = parse_mix(spec)
+        images = {kind: [make_image(kind, seed + i) for i in range(variants)] for kind in weights}
+        return cls(images, weights, seed)
+
+    @classmethod
+    def from_folder(cls, folder, seed=0):
+        """Every image in folder, all one kind ('file')."""
+        images = []
+        for name in sorted(os.listdir(folder)):
+            ext = os.path.splitext(name)[1].lower()
+            if ext in IMAGE_EXTS:
+                with open(os.path.join(folder, name), "rb") as f:
+                    images.append((f.read(), "image/" + ext.lstrip(".").replace("jpg", "jpeg")))
+        if not images:
+            raise ValueError(f"No images found in {folder}")
+        return cls({"file": images}, {"file": 1.0}, seed)
+
+    def pick(self):
+        kind = self._rng.choices(self.kinds, self.weights)[0]
+        data, content_type = self._rng.choice(self.images[kind])
+        return kind, data, content_type
@@ -0,0 +1,130 @@
+# upload_stream.py
+"""
+Incremental multipart/form-data reading for /analyze/stream.
+
+FastAPI's File(...) parameters parse (and spool) the whole body before the
+endpoint runs. iter_parts instead yields each part as soon as its last byte
+has arrived, so the caller can dispatch it, or stop reading the body while
+its pipeline is full, and only the parts in flight are held in memory.
+
+BodyStreamingResponse is a StreamingResponse that may read the request body
+while the response is being sent (Starlette's own listens for a disconnect
+on receive(), which would swallow body chunks on ASGI < 2.4 servers).
+"""
+from fastapi.responses import StreamingResponse
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+
+class UploadError(ValueError):
+    """Malformed multipart body or a limit exceeded."""
+
+
+class Part:
+    """One multipart part. filename is None for plain form fields."""
+
+    def __init__(self):
+        self.name = None
+        self.filename = None
+        self.content_type = None
+        self.data = bytearray()
+
+    @property
+    def is_file(self):
+        return self.filename is not None
+
+    def text(self):
+        return self.data.decode("utf-8", errors="replace")
+
+
+async def iter_parts(content_type, stream, max_files, max_bytes, max_field_bytes=64 * 1024):
+    """
+    Yields Part objects in body order from an async iterator of body chunks.
+    Raises UploadError on a malformed body, more than max_files files, more
+    than max_bytes in total, or a form field larger than max_field_bytes.
+    """
+    _, params = parse_options_header(content_type or "")
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise UploadError("Missing multipart boundary")
+
+    done = []
+    state = {"part": None, "header": b"", "value": b"", "headers": {}, "files": 0, "bytes": 0}
+
+    def on_part_begin():
+        state["part"], state["headers"] = Part(), {}
+
+    def on_header_field(data, start, end):
+        state["header"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header"].lower()] = state["value"]
+        state["header"] = state["value"] = b""
+
+    def on_headers_finished():
+        part = state["part"]
+        _, options = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        if b"name" not in options:
+            raise UploadError('Part without a Content-Disposition "name"')
+        part.name = options[b"name"].decode("utf-8", errors="replace")
+        if b"filename" in options:
+            part.filename = options[b"filename"].decode("utf-8", errors="replace")
+            part.content_type = state["headers"].get(b"content-type", b"").decode("latin-1")
+            state["files"] += 1
+            if state["files"] > max_files:
+                raise UploadError(f"Too many files (max {max_files})")
+
+    def on_part_data(data, start, end):
+        part = state["part"]
+        state["bytes"] += end - start
+        if state["bytes"] > max_bytes:
+            raise UploadError(f"Upload too large (max {max_bytes // (1024 * 1024)} MB in total)")
+        if not part.is_file and len(part.data) + end - start > max_field_bytes:
+            raise UploadError(f"Form field '{part.name}' too large")
+        part.data += data[start:end]
+
+    def on_part_end():
+        done.append(state["part"])
+        state["part"] = None
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+    async for chunk in stream:
+        try:
+            parser.write(chunk)
+        except Exception as e:
+            # Parts completed earlier in this chunk are still delivered
+            while done:
+                yield done.pop(0)
+            if isinstance(e, UploadError):
+                raise
+            raise UploadError(f"Malformed multipart body: {e}") from e
+        while done:
+            yield done.pop(0)
+    parser.finalize()
+    while done:
+        yield done.pop(0)
+
+
+class BodyStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose body iterator reads the request body itself. A client
+    disconnect surfaces as ClientDisconnect in the reader or OSError on send,
+    both of which end the iterator.
+    """
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            return
+        if self.background is not None:
+            await self.background()
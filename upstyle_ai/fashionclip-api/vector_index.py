@@ -0,0 +1,481 @@
+# vector_index.py
+"""
+Nearest-neighbour search over normalized 512-d FashionCLIP image embeddings
+(cosine similarity = dot product).
+
+- ExactIndex: brute-force NumPy matmul + argpartition. Right for closets.
+- IVFIndex:   inverted file (spherical k-means cells); a query scans only the
+              nprobe closest cells. For large catalogs.
+- WardrobeIndex: one user's items (ids + vectors + metadata). Uses the exact
+              index until ivf_threshold items, then an IVF index built in the
+              background over the items present at build time; newer items are
+              scanned exactly until the collection has doubled and the IVF index
+              is rebuilt. Searches never wait for a build.
+- IndexStore: per-user WardrobeIndex objects persisted as an .npz snapshot plus
+              an append-only .log of later adds, compacted into the snapshot in
+              the background once the log is half the snapshot's size. At most
+              max_users indexes stay in memory; idle users are evicted (LRU)
+              and rebuilt from snapshot + log on their next request.
+
+An add appends one line to the log (O(1), not a rewrite of the index) under an
+flock on the log file. Every process replays new log lines (and reloads a newer
+snapshot) before each read or write, so serve.py workers sharing INDEX_DIR see
+each other's items instead of overwriting them.
+"""
+import base64
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+
+def top_k(scores, k):
+    """Indices of the k largest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+class ExactIndex:
+    def __init__(self, dim=512):
+        self._data = np.empty((0, dim), dtype=np.float32)
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def vectors(self):
+        return self._data[:self._n]
+
+    def add(self, vectors):
+        """Appends (M, dim) vectors with amortized O(1) growth. Returns the first new row."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self._data.shape[1])
+        start = self._n
+        needed = self._n + len(vectors)
+        if needed > len(self._data):
+            grown = np.empty((max(needed, 2 * len(self._data), 64), self._data.shape[1]), dtype=np.float32)
+            grown[:self._n] = self._data[:self._n]
+            self._data = grown
+        self._data[start:needed] = vectors
+        self._n = needed
+        return start
+
+    def set(self, row, vector):
+        self._data[row] = vector
+
+    def search(self, query, k, start=0, chunk=262144):
+        """Top-k rows (>= start) by dot product. Scores are computed in chunks."""
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        rows, scores = [], []
+        for lo in range(start, self._n, chunk):
+            hi = min(lo + chunk, self._n)
+            s = self._data[lo:hi] @ query
+            best = top_k(s, k)
+            rows.append(best + lo)
+            scores.append(s[best])
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows, scores = np.concatenate(rows), np.concatenate(scores)
+        best = top_k(scores, k)
+        return rows[best], scores[best]
+
+
+def spherical_kmeans(vectors, n_clusters, iters=10, seed=0, chunk=65536):
+    """K-means on the unit sphere (assignment by max dot product)."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iters):
+        assign = assign_cells(vectors, centroids, chunk)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=n_clusters)
+        empty = counts == 0
+        # Re-seed empty cells with random points
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.maximum(norms, 1e-12)
+    return centroids.astype(np.float32)
+
+
+def assign_cells(vectors, centroids, chunk=65536):
+    out = np.empty(len(vectors), dtype=np.int64)
+    for lo in range(0, len(vectors), chunk):
+        out[lo:lo + chunk] = np.argmax(vectors[lo:lo + chunk] @ centroids.T, axis=1)
+    return out
+
+
+class IVFIndex:
+    def __init__(self, vectors, n_cells=None, nprobe=8, train_size=65536, iters=10, seed=0):
+        """
+        Builds cells over vectors (N, dim). Rows are stored grouped by cell so a probe
+        scans one contiguous block per cell.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n = len(vectors)
+        self.n_cells = max(1, min(n, n_cells or int(np.sqrt(n))))
+        self.nprobe = nprobe
+
+        rng = np.random.default_rng(seed)
+        sample = vectors if n <= train_size else vectors[rng.choice(n, train_size, replace=False)]
+        self.centroids = spherical_kmeans(sample, self.n_cells, iters=iters, seed=seed)
+
+        assign = assign_cells(vectors, self.centroids)
+        order = np.argsort(assign, kind="stable")
+        self.rows = order
+        self.vectors = vectors[order]
+        self.offsets = np.searchsorted(assign[order], np.arange(self.n_cells + 1))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def search(self, query, k, nprobe=None):
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        cells = top_k(self.centroids @ query, nprobe or self.nprobe)
+        blocks = [np.arange(self.offsets[c], self.offsets[c + 1]) for c in cells]
+        cand = np.concatenate(blocks) if blocks else np.empty(0, dtype=np.int64)
+        scores = self.vectors[cand] @ query
+        best = top_k(scores, k)
+        return self.rows[cand[best]], scores[best]
+
+
+class WardrobeIndex:
+    def __init__(self, dim=512, ivf_threshold=50000, nprobe=8):
+        self.dim = dim
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.ids = []
+        self.meta = []
+        self._rows = {}
+        self._exact = ExactIndex(dim)
+        self._ivf = None
+        self._ivf_building = False
+        self._replaced = 0  # Bumped on every in-place replace: invalidates IVF builds in flight
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, item_id):
+        return item_id in self._rows
+
+    def add(self, item_id, vector, meta=None):
+        """Adds or replaces one item."""
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        with self._lock:
+            row = self._rows.get(item_id)
+            if row is None:
+                self._rows[item_id] = self._exact.add(vector)
+                self.ids.append(item_id)
+                self.meta.append(meta or {})
+            else:
+                self._exact.set(row, vector)
+                self.meta[row] = meta or {}
+                self._replaced += 1
+                if self._ivf is not None and row < len(self._ivf):
+                    self._ivf = None  # Moved an indexed vector: search exactly until rebuilt
+
+    def vector(self, item_id):
+        with self._lock:
+            return self._exact.vectors[self._rows[item_id]].copy()
+
+    def claim_ivf_build(self):
+        """
+        True if an IVF (re)build is due and no other build is running; the caller
+        must then run build_ivf(), typically on a background thread.
+        """
+        with self._lock:
+            n = len(self._exact)
+            if self._ivf_building or n < self.ivf_threshold:
+                return False
+            if self._ivf is not None and n < 2 * len(self._ivf):
+                return False
+            self._ivf_building = True
+            return True
+
+    def build_ivf(self):
+        """
+        Builds the IVF index over a copy of the current vectors without holding the
+        lock (searches keep using the previous index or the exact scan meanwhile).
+        The result is dropped if an indexed vector was replaced during the build.
+        """
+        try:
+            with self._lock:
+                vectors = self._exact.vectors.copy()
+                replaced = self._replaced
+            ivf = IVFIndex(vectors, nprobe=self.nprobe)
+            with self._lock:
+                if replaced == self._replaced:
+                    self._ivf = ivf
+        finally:
+            with self._lock:
+                self._ivf_building = False
+
+    def _matching_rows(self, filters):
+        """Rows whose stored attribute labels match every {attribute: label} in filters."""
+        return np.array([
+            row for row, meta in enumerate(self.meta)
+            if all(meta.get("attributes", {}).get(name) == label for name, label in filters.items())
+        ], dtype=np.int64)
+
+    def search(self, query, k=10, exclude=None, nprobe=None, filters=None):
+        """
+        Returns [(item_id, score, meta), ...] best first. With filters, only items
+        whose labels match are ranked (always exactly: the filtered set is small).
+        """
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        with self._lock:
+            want = k + (1 if exclude is not None else 0)
+            if filters:
+                rows = self._matching_rows(filters)
+                scores = self._exact.vectors[rows] @ query
+                best = top_k(scores, want)
+                rows, scores = rows[best], scores[best]
+            elif self._ivf is None:
+                rows, scores = self._exact.search(query, want)
+            else:
+                rows, scores = self._ivf.search(query, want, nprobe)
+                # Items added since the IVF build are scanned exactly
+                tail_rows, tail_scores = self._exact.search(query, want, start=len(self._ivf))
+                rows, scores = np.concatenate([rows, tail_rows]), np.concatenate([scores, tail_scores])
+                best = top_k(scores, want)
+                rows, scores = rows[best], scores[best]
+
+            results = [
+                (self.ids[r], float(s), self.meta[r])
+                for r, s in zip(rows, scores) if self.ids[r] != exclude
+            ]
+            return results[:k]
+
+    def save(self, path):
+        """
+        Writes the index to path atomically. Saves of one index are serialized and
+        each writes its own temp file, so concurrent adds never interleave or
+        replace a half-written file; searches only wait for the snapshot copy.
+        """
+        with self._save_lock:
+            with self._lock:
+                ids = np.array(self.ids, dtype=str)
+                vectors = self._exact.vectors.copy()
+                meta = json.dumps(self.meta)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp.npz")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    np.savez(f, ids=ids, vectors=vectors, meta=np.array(meta))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        index = cls(**kwargs)
+        with np.load(path, allow_pickle=False) as data:
+            index._exact.add(data["vectors"])
+            index.ids = data["ids"].tolist()
+            index.meta = json.loads(str(data["meta"]))
+        index._rows = {item_id: i for i, item_id in enumerate(index.ids)}
+        return index
+
+
+class IndexStore:
+    def __init__(self, directory, compact_min=1024, max_users=1024, lock_stripes=64, **index_kwargs):
+        """
+        compact_min: log records below which a user's log is never compacted
+        (compaction runs once the log holds max(compact_min, items / 2) records).
+        max_users: indexes kept in memory; the least recently used beyond it are dropped.
+        """
+        self.directory = directory
+        self.compact_min = compact_min
+        self.max_users = max(1, int(max_users))
+        self.index_kwargs = index_kwargs
+        self._indexes = OrderedDict()  # LRU order, most recent last
+        self._stamps = {}   # user_id -> (inode, mtime_ns, size) of the snapshot loaded
+        self._offsets = {}  # user_id -> log bytes replayed
+        self._records = {}  # user_id -> log records replayed (compaction trigger)
+        # Striped per-user locks: bounded however many users are seen
+        self._user_locks = [threading.Lock() for _ in range(max(1, lock_stripes))]
+        self._compacting = set()
+        self._lock = threading.Lock()
+        # IVF builds and compactions: off the request path, one at a time
+        self._background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-store")
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, user_id, ext=".npz"):
+        # Hashed so arbitrary user ids can never escape the directory
+        return os.path.join(self.directory, hashlib.sha1(user_id.encode()).hexdigest() + ext)
+
+    def _user_lock(self, user_id):
+        return self._user_locks[hash(user_id) % len(self._user_locks)]
+
+    def _forget(self, user_id):
+        """Drops the in-memory state of a user (caller holds the user's lock)."""
+        with self._lock:
+            self._indexes.pop(user_id, None)
+        self._stamps.pop(user_id, None)
+        self._offsets.pop(user_id, None)
+        self._records.pop(user_id, None)
+
+    def _evict_idle(self):
+        """
+        Drops least recently used indexes beyond max_users. Safe at any time: disk
+        holds everything (snapshot + log). Users being read, written or compacted
+        right now are skipped.
+        """
+        with self._lock:
+            excess = len(self._indexes) - self.max_users
+            candidates = [u for u in self._indexes if u not in self._compacting] if excess > 0 else []
+        for user_id in candidates:
+            if excess <= 0:
+                break
+            lock = self._user_lock(user_id)
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                self._forget(user_id)
+                excess -= 1
+            finally:
+                lock.release()
+
+    def _open_log(self, user_id, lock_type):
+        """The user's log opened for appending, flock'ed (shared or exclusive) across processes."""
+        fd = os.open(self._path(user_id, ".log"), os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, lock_type)
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    def _refresh(self, user_id, fd, create):
+        """
+        Brings the in-memory index up to date with disk: reloads the snapshot if
+        another process replaced it, then replays log lines not seen yet. A torn
+        last line (writer died mid-append) is left for add() to truncate.
+        """
+        path = self._path(user_id)
+        try:
+            st = os.stat(path)
+            stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            stamp = None
+        index = self._indexes.get(user_id)
+        if index is None or stamp != self._stamps.get(user_id):
+            if stamp is not None:
+                index = WardrobeIndex.load(path, **self.index_kwargs)
+            elif index is None:
+                index = WardrobeIndex(**self.index_kwargs)
+            self._stamps[user_id] = stamp
+            self._offsets[user_id] = 0
+            self._records[user_id] = 0
+
+        offset = self._offsets[user_id]
+        size = os.fstat(fd).st_size
+        if size > offset:
+            data = os.pread(fd, size - offset, offset)
+            complete = data[:data.rfind(b"\n") + 1]
+            for line in complete.splitlines():
+                try:
+                    record = json.loads(line)
+                    vector = np.frombuffer(base64.b64decode(record["v"]), dtype=np.float32)
+                    index.add(record["id"], vector, record.get("meta"))
+                except (ValueError, KeyError):
+                    continue  # Corrupt record: skip rather than lose the rest of the log
+                self._records[user_id] += 1
+            self._offsets[user_id] = offset + len(complete)
+
+        if not (len(index) or stamp is not None or create):
+            self._forget(user_id)  # Unknown user: keep no state
+            return None
+        with self._lock:
+            self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+        return index
+
+    def get(self, user_id, create=False):
+        """The user's WardrobeIndex, brought up to date with disk; None if unknown."""
+        if (not create and user_id not in self._indexes
+                and not os.path.exists(self._path(user_id))
+                and not os.path.exists(self._path(user_id, ".log"))):
+            return None
+        with self._user_lock(user_id):
+            fd = self._open_log(user_id, fcntl.LOCK_SH)
+            try:
+                index = self._refresh(user_id, fd, create)
+            finally:
+                os.close(fd)
+        if index is not None and index.claim_ivf_build():
+            self._background.submit(index.build_ivf)
+        self._evict_idle()
+        return index
+
+    def add(self, user_id, item_id, vector, meta=None):
+        """Adds an item and appends it to the user's log (the snapshot is compacted later)."""
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        line = json.dumps({
+            "id": item_id, "meta": meta or {}, "v": base64.b64encode(vector.tobytes()).decode("ascii")
+        }).encode() + b"\n"
+        with self._user_lock(user_id):
+            fd = self._open_log(user_id, fcntl.LOCK_EX)
+            try:
+                index = self._refresh(user_id, fd, create=True)
+                if os.fstat(fd).st_size > self._offsets[user_id]:
+                    os.ftruncate(fd, self._offsets[user_id])  # Drop a torn last line
+                os.write(fd, line)
+                index.add(item_id, vector, meta)
+                self._offsets[user_id] += len(line)
+                self._records[user_id] += 1
+                compact = self._records[user_id] >= max(self.compact_min, len(index) // 2)
+            finally:
+                os.close(fd)
+        if compact:
+            self._schedule_compaction(user_id)
+        self._evict_idle()
+
+    def _schedule_compaction(self, user_id):
+        with self._lock:
+            if user_id in self._compacting:
+                return
+            self._compacting.add(user_id)
+        self._background.submit(self._compact, user_id)
+
+    def _compact(self, user_id):
+        """Writes the snapshot with every logged item, then empties the log."""
+        try:
+            with self._user_lock(user_id):
+                fd = self._open_log(user_id, fcntl.LOCK_EX)
+                try:
+                    index = self._refresh(user_id, fd, create=True)
+                    path = self._path(user_id)
+                    index.save(path)
+                    # A crash here only replays the log over a snapshot that already holds it
+                    os.ftruncate(fd, 0)
+                    st = os.stat(path)
+                    self._stamps[user_id] = (st.st_ino, st.st_mtime_ns, st.st_size)
+                    self._offsets[user_id] = 0
+                    self._records[user_id] = 0
+                finally:
+                    os.close(fd)
+        finally:
+            with self._lock:
+                self._compacting.discard(user_id)
+
+    def stats(self):
+        """Counts of the indexes in memory (never waits on a load or a disk write)."""
+        with self._lock:  # Only ever held for dict updates, never for I/O
+            indexes = list(self._indexes.values())
+        return {
+            "users_loaded": len(indexes), "max_users": self.max_users,
+            "items_loaded": sum(map(len, indexes))
+        }
@@ -0,0 +1,210 @@
+# vocabulary.py
+"""
+Persistent cache for the attribute prompt embeddings.
+
+Encoding every prompt in ATTRIBUTE_CANDIDATES through ONNX dominates cold start,
+so the vectors are stored once per unique prompt in an .npz next to the model.
+The file is keyed by an encoder hash (model file + PROMPT_TEMPLATE) and is
+ignored as soon as either changes. Editing the candidate lists only encodes the
+prompts that are not in the file yet.
+
+Build ahead of time (e.g. in the Docker image):
+    python vocabulary.py
+"""
+import argparse
+import hashlib
+import json
+import os
+from collections import OrderedDict
+import numpy as np
+import config
+
+# Bump when the layout of the .npz changes
+CACHE_FORMAT = 2
+
+
+def unique_prompts(attribute_dict, template=None):
+    """
+    Returns every prompt in attribute_dict exactly once, in first-seen order.
+    Labels shared by several attributes (e.g. "off-shoulder") are encoded once.
+    """
+    template = template or config.PROMPT_TEMPLATE
+    seen = {}
+    for candidates in attribute_dict.values():
+        for c in candidates:
+            seen.setdefault(template.format(c), None)
+    return list(seen)
+
+
+def model_digest(model_path):
+    """
+    SHA-256 of the model file. The digest is memoised in '<model>.sha256' together
+    with the file size and mtime so multi-hundred-MB models are only hashed once.
+    """
+    stat = os.stat(model_path)
+    stamp = f"{stat.st_size}:{stat.st_mtime_ns}"
+    memo_path = model_path + ".sha256"
+
+    try:
+        with open(memo_path, "r", encoding="utf-8") as f:
+            memo_stamp, memo_digest = f.read().split()
+        if memo_stamp == stamp:
+            return memo_digest
+    except (OSError, ValueError):
+        pass
+
+    h = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+
+    try:
+        with open(memo_path, "w", encoding="utf-8") as f:
+            f.write(f"{stamp} {digest}\n")
+    except OSError:
+        pass  # Read-only filesystem (e.g. Cloud Run) - just re-hash next time
+    return digest
+
+
+def encoder_version(model_path, template=None):
+    """Short hash identifying a (model, template) pair: same prompt -> same vector."""
+    template = template or config.PROMPT_TEMPLATE
+    h = hashlib.sha256()
+    h.update(f"format={CACHE_FORMAT}\n".encode())
+    h.update(model_digest(model_path).encode())
+    h.update(template.encode())
+    return h.hexdigest()[:16]
+
+
+def vocabulary_version(model_path, attribute_dict, template=None):
+    """Short hash identifying a (model, template, candidates) combination."""
+    template = template or config.PROMPT_TEMPLATE
+    h = hashlib.sha256()
+    h.update(f"format={CACHE_FORMAT}\n".encode())
+    h.update(model_digest(model_path).encode())
+    h.update(template.encode())
+    h.update(json.dumps(list(attribute_dict.items()), ensure_ascii=False).encode())
+    return h.hexdigest()[:16]
+
+
+def load_prompt_embeddings(cache_path, encoder):
+    """Returns {prompt: (512,) vector} from cache_path, or None if missing or from another encoder."""
+    if not cache_path or not os.path.exists(cache_path):
+        return None
+    try:
+        with np.load(cache_path, allow_pickle=False) as data:
+            if "encoder" not in data.files or str(data["encoder"]) != encoder:
+                print(f"♻️  Vocabulary cache is stale: {cache_path}")
+                return None
+            prompts = data["prompts"].tolist()
+            embeds = data["embeds"].astype(np.float32)
+    except Exception as e:
+        print(f"⚠️  Could not read vocabulary cache {cache_path}: {e}")
+        return None
+    return dict(zip(prompts, embeds))
+
+
+def save_prompt_embeddings(cache_path, encoder, prompt_embeds):
+    """Atomically writes {prompt: vector} to cache_path. Returns True on success."""
+    prompts = list(prompt_embeds)
+    embeds = np.vstack([prompt_embeds[p] for p in prompts]).astype(np.float32)
+    tmp_path = cache_path + ".tmp.npz"
+    try:
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        np.savez(tmp_path, encoder=np.array(encoder), prompts=np.array(prompts), embeds=embeds)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"⚠️  Could not write vocabulary cache {cache_path}: {e}")
+        return False
+    return True
+
+
+class AttributeVocabulary:
+    """
+    Fused, read-only view of the attribute text vectors.
+    All candidates are concatenated into one (total_prompts, 512) matrix; attribute i
+    owns columns offsets[i]:offsets[i+1] and labels holds the label of every column.
+    """
+
+    def __init__(self, attribute_dict, prompt_embeds, version, template=None):
+        template = template or config.PROMPT_TEMPLATE
+        names, labels, rows, offsets = [], [], [], [0]
+        for category, candidates in attribute_dict.items():
+            if not candidates: continue
+            names.append(category)
+            labels.extend(candidates)
+            rows.extend(prompt_embeds[template.format(c)] for c in candidates)
+            offsets.append(len(labels))
+
+        self.names = names
+        self.labels = np.array(labels, dtype=object)
+        self.matrix = np.ascontiguousarray(np.vstack(rows), dtype=np.float32)
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.starts = self.offsets[:-1]
+        self.version = version
+        self.prompt_embeds = prompt_embeds
+
+    def __len__(self):
+        return len(self.names)
+
+    def candidates(self, name):
+        """Labels of one attribute, in column order."""
+        i = self.names.index(name)
+        return self.labels[self.offsets[i]:self.offsets[i + 1]]
+
+
+def parse_attribute_dict(obj):
+    """
+    Validates a vocabulary definition in ATTRIBUTE_CANDIDATES form
+    ({attribute: [label, ...]}, e.g. parsed JSON). 'category' is required (the
+    API reports it for every image). Raises ValueError.
+    """
+    if not isinstance(obj, dict) or not obj:
+        raise ValueError("Vocabulary must be a non-empty object of {attribute: [labels]}")
+    if "category" not in obj:
+        raise ValueError("Vocabulary must define the 'category' attribute")
+    attribute_dict = OrderedDict()
+    for name, labels in obj.items():
+        if not isinstance(labels, list) or not labels:
+            raise ValueError(f"Attribute '{name}' needs a non-empty list of labels")
+        if not all(isinstance(label, str) and label.strip() for label in labels):
+            raise ValueError(f"Attribute '{name}' has an empty or non-string label")
+        if len(set(labels)) != len(labels):
+            raise ValueError(f"Attribute '{name}' has duplicate labels")
+        attribute_dict[name] = list(labels)
+    return attribute_dict
+
+
+def load_attribute_file(path):
+    """Vocabulary definition from a JSON file (see parse_attribute_dict)."""
+    with open(path, encoding="utf-8") as f:
+        return parse_attribute_dict(json.load(f))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-build the attribute text-embedding cache.")
+    parser.add_argument("--model", default=config.ONNX_MODEL_PATH, help="ONNX model path")
+    parser.add_argument("--out", default=config.VOCAB_CACHE_PATH, help="Output .npz path")
+    parser.add_argument("--force", action="store_true", help="Re-encode even if the cache is current")
+    args = parser.parse_args()
+
+    if args.force and os.path.exists(args.out):
+        os.remove(args.out)
+
+    from inference import AttributePredictor
+
+    predictor = AttributePredictor(
+        args.model, config.HF_MODEL_ID,
+        vision_model_path=config.VISION_MODEL_PATH,
+        text_model_path=config.TEXT_MODEL_PATH,
+        optimized_model_dir=config.ORT_OPTIMIZED_DIR or None
+    )
+    predictor.precompute_all_attributes(config.ATTRIBUTE_CANDIDATES, cache_path=args.out)
+    # Also leaves the optimized graphs and model digests on disk for the next start
+    predictor.wait_until_loaded()
+    print(f"✅ Vocabulary {predictor.vocab_version} -> {args.out} (results version {predictor.result_version})")
+
+
+if __name__ == "__main__":
+    main()
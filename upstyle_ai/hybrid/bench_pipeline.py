@@ -0,0 +1,67 @@
+# bench_pipeline.py
+"""
+images/sec of data_pipeline.create_batch_pipeline for a grid of worker counts,
+with thread and process (python_multiprocessing) decoding. Worker counts above
+os.cpu_count() are skipped (MindSpore rejects them).
+
+    python bench_pipeline.py ../clothes_data/imgs --workers 1 2 4 8 --batch-size 16
+"""
+import argparse
+import os
+import time
+from data_pipeline import create_batch_pipeline, iter_batches
+
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+
+
+def run(paths, batch_size, workers, multiprocessing, prefetch):
+    dataset = create_batch_pipeline(
+        paths, batch_size=batch_size, num_parallel_workers=workers,
+        python_multiprocessing=multiprocessing
+    )
+    t = time.perf_counter()
+    n, bad = 0, []
+    for ok_paths, _, bad_paths in iter_batches(dataset, paths, prefetch_size=prefetch):
+        n += len(ok_paths)
+        bad.extend(bad_paths)
+    return n / (time.perf_counter() - t), bad
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the MindSpore image pipeline.")
+    parser.add_argument("images", help="Folder of test images")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--prefetch", type=int, default=None)
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    paths = sorted(
+        os.path.join(args.images, f) for f in os.listdir(args.images)
+        if f.lower().endswith(IMAGE_EXTS)
+    )[:args.limit]
+    if not paths:
+        raise SystemExit(f"❌ No images found in {args.images}")
+    print(f"📸 {len(paths)} images, batch {args.batch_size}, {os.cpu_count()} CPUs")
+
+    cpus = os.cpu_count() or 1
+    skipped = [w for w in args.workers if w > cpus]
+    if skipped:
+        print(f"   ⏭️  Skipping workers {skipped}: more than the {cpus} CPUs")
+    workers_grid = [w for w in args.workers if w <= cpus]
+    if not workers_grid:
+        raise SystemExit(f"❌ No worker count <= {cpus} to benchmark")
+
+    bad = []
+    print(f"\n{'workers':>8}{'threads img/s':>16}{'processes img/s':>18}")
+    for workers in workers_grid:
+        thread_rate, bad = run(paths, args.batch_size, workers, False, args.prefetch)
+        process_rate, _ = run(paths, args.batch_size, workers, True, args.prefetch)
+        print(f"{workers:>8}{thread_rate:>16.1f}{process_rate:>18.1f}")
+
+    for path in bad:
+        print(f"   ⚠️  Skipped (could not decode): {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,35 @@ SINGLE_IMAGE_PATH = "/home/noor/A/projects/Upstyle/upstyle_ai/clothes_data/imgs/
 # Output: Directory to save the resulting JSON metadata
 OUTPUT_DIR = "/home/noor/A/projects/Upstyle/upstyle_ai/clothes_data/metadata"
 
-ONNX_MODEL_PATH = "/home/noor/A/projects/Upstyle/upstyle_ai/models/fashionclip.simplified.onnx"
+# --- Model Variant ---
+# "fp32" (default) or a quantized copy made by `python onnx_tools.py quantize`
+# ("int8", "fp16"). The tag is inserted before the extension of every model path.
+MODEL_VARIANT = os.getenv('MODEL_VARIANT', 'fp32')
+
+def variant_path(path, variant=None):
+    """models/x.onnx -> models/x.int8.onnx (unchanged for fp32)."""
+    variant = variant or MODEL_VARIANT
+    if variant == 'fp32':
+        return path
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{variant}{ext}"
+
+ONNX_MODEL_PATH_FP32 = "/home/noor/A/projects/Upstyle/upstyle_ai/models/fashionclip.simplified.onnx"
+# Optional vision-only / text-only halves (`python onnx_tools.py split`).
+# Used instead of the combined graph whenever both files exist.
+VISION_MODEL_PATH_FP32 = ONNX_MODEL_PATH_FP32.replace(".onnx", ".vision.onnx")
+TEXT_MODEL_PATH_FP32 = ONNX_MODEL_PATH_FP32.replace(".onnx", ".text.onnx")
+
+ONNX_MODEL_PATH = variant_path(ONNX_MODEL_PATH_FP32)
+VISION_MODEL_PATH = variant_path(VISION_MODEL_PATH_FP32)
+TEXT_MODEL_PATH = variant_path(TEXT_MODEL_PATH_FP32)
+
+# Prebuilt attribute text vectors (see vocabulary.py), one file per variant.
+# Rebuilt automatically if stale.
+VOCAB_CACHE_PATH = variant_path(os.path.join(os.path.dirname(ONNX_MODEL_PATH_FP32), "text_embeds.npz"))
+
+# ORT-optimized copies of the graphs (see inference.py), reused on later runs. '' disables.
+ORT_OPTIMIZED_DIR = os.getenv('ORT_OPTIMIZED_DIR', os.path.join(os.path.dirname(ONNX_MODEL_PATH_FP32), "ort_cache"))
 HF_MODEL_ID = "patrickjohncyh/fashion-clip"
 
 # --- CLIP Constants ---
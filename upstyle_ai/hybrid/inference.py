@@ -1,85 +1,399 @@
 # inference.py
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import onnxruntime as ort
 import numpy as np
-from transformers import CLIPProcessor
 import config
+import vocabulary
+
+# ONNX Runtime session presets. intra_op_threads=None means ORT's default (one
+# thread per core); callers running several sessions at once pass their share.
+# The CLIP towers are a single chain of ops, so the parallel executor and
+# inter-op threads only add overhead; they stay available as overrides.
+SESSION_PRESETS = {
+    # One request at a time as fast as possible: idle threads spin for the next op
+    "latency": {
+        "intra_op_threads": None, "inter_op_threads": 1, "execution_mode": "sequential",
+        "graph_optimization": "all", "mem_arena": True, "mem_pattern": True,
+        "allow_spinning": True, "prepacking": True,
+    },
+    # Several batches at once on few threads each (config.INFERENCE_THREADS):
+    # spinning threads would steal cores from the other batches and decoding
+    "throughput": {
+        "intra_op_threads": None, "inter_op_threads": 1, "execution_mode": "sequential",
+        "graph_optimization": "all", "mem_arena": True, "mem_pattern": True,
+        "allow_spinning": False, "prepacking": True,
+    },
+    # Small containers: no arena / memory-pattern pre-allocation, no pre-packed weight copies
+    "low-memory": {
+        "intra_op_threads": None, "inter_op_threads": 1, "execution_mode": "sequential",
+        "graph_optimization": "all", "mem_arena": False, "mem_pattern": False,
+        "allow_spinning": False, "prepacking": False,
+    },
+}
+
+EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def session_settings(preset="latency", **overrides):
+    """SESSION_PRESETS[preset] with the non-None overrides applied."""
+    if preset not in SESSION_PRESETS:
+        raise ValueError(f"Unknown ORT preset {preset!r} (choose from {', '.join(SESSION_PRESETS)})")
+    settings = dict(SESSION_PRESETS[preset])
+    for key, value in overrides.items():
+        if key not in settings:
+            raise ValueError(f"Unknown ORT session setting {key!r}")
+        if value is not None:
+            settings[key] = value
+    if settings["execution_mode"] not in EXECUTION_MODES:
+        raise ValueError(f"execution_mode must be one of {', '.join(EXECUTION_MODES)}")
+    if settings["graph_optimization"] not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(f"graph_optimization must be one of {', '.join(GRAPH_OPTIMIZATION_LEVELS)}")
+    settings["preset"] = preset
+    return settings
 
 class AttributePredictor:
-    def __init__(self, model_path, processor_id):
-        # Set generic log level to 3 (Error) to reduce spam
-        opts = ort.SessionOptions()
-        opts.log_severity_level = 3 
+    def __init__(self, model_path, processor_id, vision_model_path=None, text_model_path=None,
+                 intra_op_threads=None, optimized_model_dir=None, background_load=True,
+                 session_preset="latency", session_overrides=None, load_vision=True):
+        """
+        With vision_model_path/text_model_path (see `onnx_tools.py split`) each tower
+        gets its own session and the text tower is only loaded if a prompt actually
+        has to be encoded, i.e. when the vocabulary cache is missing or stale.
+        Otherwise the combined graph at model_path is used with dummy inputs.
+        intra_op_threads caps ORT's per-session thread pool (None = ORT default).
+        session_preset / session_overrides: see SESSION_PRESETS and session_settings().
+        optimized_model_dir: ORT-optimized copies of the graphs are saved there and
+        loaded on later starts, skipping graph optimization (None = off).
+        background_load: the vision session is created on a thread, so the vocabulary
+        can load meanwhile; the first use of vision_session waits for it.
+        load_vision=False: for tools that only classify stored embeddings; the vision
+        session is not created up front (nor in the background) and only loads if
+        something uses it, e.g. prompt encoding with the combined graph.
+        """
+        overrides = dict(session_overrides or {})
+        if intra_op_threads:
+            overrides["intra_op_threads"] = intra_op_threads
+        self.session_settings = session_settings(session_preset, **overrides)
+        self.optimized_model_dir = optimized_model_dir
+        
+        self.split = bool(vision_model_path and text_model_path
+                          and os.path.exists(vision_model_path) and os.path.exists(text_model_path))
+        
+        if self.split:
+            self.vision_model_path = vision_model_path
+            self.text_model_path = text_model_path
+        else:
+            self.vision_model_path = model_path
+            self.text_model_path = model_path
+        self._vision_session = None
+        self._text_session = None  # Split mode: loaded on first prompt encoding
+        self._text_lock = threading.Lock()  # Concurrent first queries load it once
+        self._vision_digest = None
+        self._image_batching = None
         
-        print("🧠 Loading ONNX Model...")
-        self.session = ort.InferenceSession(model_path, sess_options=opts, providers=['CPUExecutionProvider'])
-        self.processor = CLIPProcessor.from_pretrained(processor_id)
+        self._vision_future = None  # Also stays None with load_vision=False
+        if load_vision and background_load:
+            loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-load")
+            self._vision_future = loader.submit(self._load_vision)
+            loader.shutdown(wait=False)
+        elif load_vision:
+            self._vision_session = self._load_vision()
+        
+        self.processor_id = processor_id
+        self._tokenizer = None  # Only needed for text, loaded on demand
+        self._tokenizer_lock = threading.Lock()
         
         # Dummy inputs for safe mode
         self.dummy_pixels = np.zeros((1, 3, 224, 224), dtype=np.float32)
         self.dummy_text_ids = np.zeros((1, 77), dtype=np.int64)
         self.dummy_text_mask = np.ones((1, 77), dtype=np.int64)
         
-        self.attribute_embeds_map = {}
+        self.model_path = model_path
+        self.vocab = None
 
-    def precompute_all_attributes(self, attribute_dict):
+    def _session_options(self):
+        # Set generic log level to 3 (Error) to reduce spam
+        opts = ort.SessionOptions()
+        opts.log_severity_level = 3
+        s = self.session_settings
+        opts.intra_op_num_threads = s["intra_op_threads"] or 0
+        opts.inter_op_num_threads = s["inter_op_threads"] or 0
+        opts.execution_mode = EXECUTION_MODES[s["execution_mode"]]
+        opts.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[s["graph_optimization"]]
+        opts.enable_cpu_mem_arena = s["mem_arena"]
+        opts.enable_mem_pattern = s["mem_pattern"]
+        spinning = "1" if s["allow_spinning"] else "0"
+        opts.add_session_config_entry("session.intra_op.allow_spinning", spinning)
+        opts.add_session_config_entry("session.inter_op.allow_spinning", spinning)
+        if not s["prepacking"]:
+            opts.add_session_config_entry("session.disable_prepacking", "1")
+        return opts
+
+    def _optimized_path(self, path):
+        """Cache file for path, keyed by its size/mtime and the ORT version."""
+        stat = os.stat(path)
+        stem = os.path.splitext(os.path.basename(path))[0]
+        return os.path.join(
+            self.optimized_model_dir, f"{stem}.{stat.st_size}-{stat.st_mtime_ns}.ort{ort.__version__}.onnx"
+        )
+
+    def _remove_stale_optimized(self, path, keep):
+        """Drops optimized copies of earlier versions of path (other size/mtime/ORT)."""
+        stem = os.path.splitext(os.path.basename(path))[0]
+        pattern = re.compile(re.escape(stem) + r"\.\d+-\d+\.ort[^/]*\.onnx$")
+        for name in os.listdir(self.optimized_model_dir):
+            stale = os.path.join(self.optimized_model_dir, name)
+            if pattern.match(name) and stale != keep:
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+    def _create_session(self, path):
+        providers = ['CPUExecutionProvider']
+        if not self.optimized_model_dir:
+            return ort.InferenceSession(path, sess_options=self._session_options(), providers=providers)
+        
+        opt_path = self._optimized_path(path)
+        if not os.path.exists(opt_path):
+            # Saved at EXTENDED level: ALL adds CPU-specific layout changes, which are
+            # not portable (image built on one machine, served on another) and are
+            # cheap to re-apply when the saved graph is loaded.
+            try:
+                os.makedirs(self.optimized_model_dir, exist_ok=True)
+                opts = self._session_options()
+                opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+                opts.optimized_model_filepath = opt_path + ".tmp"
+                ort.InferenceSession(path, sess_options=opts, providers=providers)
+                os.replace(opt_path + ".tmp", opt_path)
+                print(f"💾 Saved optimized graph: {opt_path}")
+                self._remove_stale_optimized(path, opt_path)
+            except Exception as e:
+                print(f"⚠️  Could not save optimized graph ({e}); loading {path}")
+                return ort.InferenceSession(path, sess_options=self._session_options(), providers=providers)
+        return ort.InferenceSession(opt_path, sess_options=self._session_options(), providers=providers)
+
+    def _load_vision(self):
+        print("🧠 Loading ONNX Vision Model..." if self.split else "🧠 Loading ONNX Model...")
+        session = self._create_session(self.vision_model_path)
+        # Needed for result_version; hashing overlaps the vocabulary load too
+        self._vision_digest = vocabulary.model_digest(self.vision_model_path)
+        return session
+
+    def wait_until_loaded(self):
+        """Blocks until the background vision load (if any) has finished."""
+        if self._vision_future is None:
+            return self._vision_session
+        return self.vision_session
+
+    @property
+    def vision_session(self):
+        if self._vision_session is None:
+            if self._vision_future is None:
+                self._vision_session = self._load_vision()  # load_vision=False: on first use
+            else:
+                self._vision_session = self._vision_future.result()
+        return self._vision_session
+
+    @property
+    def image_batching(self):
+        # Exports with a symbolic batch axis (`onnx_tools.py dynamic-batch`) take
+        # N items per session.run; fixed batch=1 exports fall back to a loop.
+        if self._image_batching is None:
+            self._image_batching = self._has_dynamic_batch(self.vision_session, "pixel_values")
+        return self._image_batching
+
+    @staticmethod
+    def _has_dynamic_batch(session, input_name):
+        for i in session.get_inputs():
+            if i.name == input_name:
+                return not isinstance(i.shape[0], int)
+        return False
+
+    @property
+    def text_batching(self):
+        return self._has_dynamic_batch(self.text_session, "input_ids")
+
+    @property
+    def text_session(self):
+        if not self.split:
+            return self.vision_session  # Combined graph
+        if self._text_session is None:
+            with self._text_lock:
+                if self._text_session is None:
+                    print("🧠 Loading ONNX Text Model...")
+                    self._text_session = self._create_session(self.text_model_path)
+        return self._text_session
+
+    @property
+    def tokenizer(self):
         """
-        Loops through attributes and strictly processes text ONE BY ONE.
-        This prevents the 'Shape Mismatch' error.
+        texts -> (input_ids, attention_mask). Uses the bundled vocab.json/merges.txt
+        next to the text model (`onnx_tools.py tokenizer`) when present; otherwise
+        falls back to transformers.CLIPProcessor (slow import, may hit the network).
         """
-        print("📝 Pre-computing text vectors (Safe Loop Mode)...")
-        
-        for category, candidates in attribute_dict.items():
-            if not candidates: continue
-            
-            # Apply Template
-            texts = [config.PROMPT_TEMPLATE.format(c) for c in candidates]
-            
-            # Strict Loop to satisfy ONNX fixed batch size
-            embeds_list = []
-            for t in texts:
-                inputs = self.processor(text=[t], return_tensors="np", padding="max_length", max_length=77)
+        if self._tokenizer is None:
+            with self._tokenizer_lock:
+                if self._tokenizer is None:
+                    import clip_tokenizer  # Not needed at all when the vocabulary cache is current
+                    tokenizer_dir = os.path.dirname(os.path.abspath(self.text_model_path))
+                    if clip_tokenizer.has_tokenizer_files(tokenizer_dir):
+                        self._tokenizer = clip_tokenizer.CLIPTokenizer.from_dir(tokenizer_dir)
+                    else:
+                        from transformers import CLIPProcessor
+                        print("⚠️  No bundled tokenizer files, loading CLIPProcessor (run `onnx_tools.py tokenizer`)")
+                        processor = CLIPProcessor.from_pretrained(self.processor_id)
                 
-                ort_inputs = {
-                    "pixel_values": self.dummy_pixels,
-                    "input_ids": inputs["input_ids"].astype(np.int64),
-                    "attention_mask": inputs["attention_mask"].astype(np.int64)
-                }
-                # Run single text
-                out = self.session.run(["text_embeds"], ort_inputs)[0]
-                embeds_list.append(out)
-            
-            # Stack into (N, 512) matrix
-            self.attribute_embeds_map[category] = np.vstack(embeds_list)
+                        def tokenize(texts):
+                            inputs = processor(text=texts, return_tensors="np", padding="max_length",
+                                               truncation=True, max_length=77)
+                            return inputs["input_ids"].astype(np.int64), inputs["attention_mask"].astype(np.int64)
+                        self._tokenizer = tokenize
+        return self._tokenizer
+
+    def _run_text(self, input_ids, attention_mask):
+        ort_inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if not self.split:
+            ort_inputs["pixel_values"] = self.dummy_pixels
+        return self.text_session.run(["text_embeds"], ort_inputs)[0]
+
+    def _run_image(self, pixel_values):
+        ort_inputs = {"pixel_values": pixel_values}
+        if not self.split:
+            ort_inputs["input_ids"] = self.dummy_text_ids
+            ort_inputs["attention_mask"] = self.dummy_text_mask
+        return self.vision_session.run(["image_embeds"], ort_inputs)[0]
+
+    def encode_prompts(self, prompts, batch_size=64):
+        """
+        Encodes prompts batch_size at a time, or strictly ONE BY ONE if the model has
+        a fixed batch of 1 (prevents the 'Shape Mismatch' error).
+        Returns {prompt: (512,) vector}.
+        """
+        prompts = list(prompts)
+        if not self.text_batching:
+            batch_size = 1
+        
+        prompt_embeds = {}
+        for start in range(0, len(prompts), batch_size):
+            chunk = prompts[start:start + batch_size]
+            input_ids, attention_mask = self.tokenizer(chunk)
+            embeds = self._run_text(input_ids, attention_mask)
+            prompt_embeds.update(zip(chunk, embeds))
+        return prompt_embeds
+
+    def precompute_all_attributes(self, attribute_dict, cache_path=None):
+        """
+        Builds the fused attribute vocabulary (see vocabulary.AttributeVocabulary).
+        Prompt vectors come from the current vocabulary and the cache at cache_path
+        (same model/template); only prompts found in neither are encoded (Safe Loop
+        Mode if unbatched) and the cache is rewritten.
+        The new vocabulary replaces self.vocab in one assignment, so calls already
+        running finish on the old one. Returns the number of prompts encoded.
+        """
+        version = vocabulary.vocabulary_version(self.text_model_path, attribute_dict)
+        encoder = vocabulary.encoder_version(self.text_model_path)
+        known = dict(self.vocab.prompt_embeds) if self.vocab else {}
+        cached = vocabulary.load_prompt_embeddings(cache_path, encoder)
+        if cached:
+            print(f"⚡ Loaded text vectors from cache ({len(cached)} prompts)")
+            known.update(cached)
+        
+        prompts = vocabulary.unique_prompts(attribute_dict)
+        missing = [p for p in prompts if p not in known]
+        if missing:
+            mode = "Batched" if self.text_batching else "Safe Loop Mode"
+            print(f"📝 Pre-computing {len(missing)} text vectors ({mode})...")
+            known.update(self.encode_prompts(missing))
+            if cache_path:
+                vocabulary.save_prompt_embeddings(cache_path, encoder, known)
+        
+        prompt_embeds = {p: known[p] for p in prompts}
+        self.vocab = vocabulary.AttributeVocabulary(attribute_dict, prompt_embeds, version)
+        return len(missing)
+
+    @property
+    def vocab_version(self):
+        return self.vocab.version if self.vocab else None
+
+    @property
+    def result_version(self):
+        """
+        Changes whenever classify results for the same pixels can change:
+        vision weights or the vocabulary (text model, template, candidates).
+        """
+        if self._vision_digest is None:
+            self._vision_digest = vocabulary.model_digest(self.vision_model_path)
+        return f"{self._vision_digest[:16]}-{self.vocab_version}"
+
+    @property
+    def attribute_embeds_map(self):
+        """Per-attribute (N, 512) views into the fused text matrix."""
+        v = self.vocab
+        return {name: v.matrix[v.offsets[i]:v.offsets[i + 1]] for i, name in enumerate(v.names)}
+
+    def get_image_embeddings(self, image_batch):
+        """
+        (B, 3, 224, 224) -> (B, 512) normalized embeddings.
+        A single session.run when the model has a dynamic batch axis.
+        """
+        image_batch = np.ascontiguousarray(image_batch, dtype=np.float32)
+        if self.image_batching or len(image_batch) == 1:
+            return self._run_image(image_batch)
+        return np.vstack([self._run_image(image_batch[i:i + 1]) for i in range(len(image_batch))])
 
     def get_image_embedding(self, image_np):
-        ort_inputs = {
-            "pixel_values": image_np.astype(np.float32),
-            "input_ids": self.dummy_text_ids,
-            "attention_mask": self.dummy_text_mask
-        }
-        return self.session.run(["image_embeds"], ort_inputs)[0]
+        return self.get_image_embeddings(image_np)
 
-    def classify_all(self, img_embeds):
-        results = {}
+    def classify_indices(self, img_embeds, vocab=None):
+        """
+        Scores a (B, 512) batch against every attribute at once.
+        Returns (best, confidence), both (B, num_attributes): best holds the winning
+        column of the fused text matrix (index into vocab.labels).
+        """
+        vocab = vocab or self.vocab  # One consistent snapshot for the whole call
+        img_embeds = np.asarray(img_embeds, dtype=np.float32).reshape(-1, vocab.matrix.shape[1])
+        
+        # 1. Cosine Similarity (Dot Product) for all prompts + scaling
+        # Shapes: (B, 512) @ (T, 512).T -> (B, T)
+        logits = img_embeds @ vocab.matrix.T
+        logits *= np.float32(config.LOGIT_SCALE)
+        
+        # 2. Segmented softmax: subtract each attribute's max for stability
+        seg_max = np.maximum.reduceat(logits, vocab.starts, axis=1)
+        counts = np.diff(vocab.offsets)
+        logits -= np.repeat(seg_max, counts, axis=1)
+        exp_logits = np.exp(logits)
+        seg_sum = np.add.reduceat(exp_logits, vocab.starts, axis=1)
         
-        for category, text_matrix in self.attribute_embeds_map.items():
-            # 1. Cosine Similarity (Dot Product)
-            # Shapes: (1, 512) @ (N, 512).T -> (1, N)
-            raw_logits = img_embeds @ text_matrix.T
-            
-            # 2. !!! APPLY SCALING !!! (The missing link)
-            scaled_logits = raw_logits * config.LOGIT_SCALE
-            
-            # 3. Softmax
-            exp_logits = np.exp(scaled_logits - np.max(scaled_logits)) # Subtract max for stability
-            probs = exp_logits / np.sum(exp_logits, axis=1, keepdims=True)
-            probs = probs[0]
-            
-            # 4. Result
-            best_idx = np.argmax(probs)
-            confidence = probs[best_idx]
-            label = config.ATTRIBUTE_CANDIDATES[category][best_idx]
-            
-            results[category] = (label, confidence)
-            
-        return results
\ No newline at end of file
+        # 3. Argmax = first column whose shifted logit is 0; its prob is exp(0) / sum
+        cols = np.where(logits == 0, np.arange(logits.shape[1]), logits.shape[1])
+        best = np.minimum.reduceat(cols, vocab.starts, axis=1)
+        confidence = (1.0 / seg_sum).astype(np.float32)
+        return best, confidence
+
+    def classify_batch(self, img_embeds):
+        """(B, 512) -> list of B {attribute: (label, confidence)} dicts."""
+        vocab = self.vocab
+        best, confidence = self.classify_indices(img_embeds, vocab)
+        labels = vocab.labels[best]
+        return [
+            dict(zip(vocab.names, zip(labels[b], confidence[b])))
+            for b in range(len(best))
+        ]
+
+    def classify_all(self, img_embeds):
+        return self.classify_batch(img_embeds)[0]
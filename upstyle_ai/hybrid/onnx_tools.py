@@ -0,0 +1,446 @@
+# onnx_tools.py
+"""
+Offline surgery on the exported FashionCLIP ONNX graph.
+Needs the `onnx` package, which is NOT part of the API image - run these on a
+dev machine and ship the resulting files in models/.
+
+    python onnx_tools.py split          # -> vision-only and text-only sub-models
+    python onnx_tools.py dynamic-batch  # patch the fixed batch=1 export to a dynamic batch axis
+    python onnx_tools.py export         # re-export from HF_MODEL_ID with dynamic batch (needs torch)
+    python onnx_tools.py quantize       # int8 / fp16 copies, selected with MODEL_VARIANT
+    python onnx_tools.py tokenizer      # bundle vocab.json/merges.txt for clip_tokenizer.py (needs transformers)
+    python onnx_tools.py stub           # tiny random-weight stand-in model for load tests / benchmarks
+"""
+import argparse
+import os
+import numpy as np
+import config
+
+
+def split_model(model_path, vision_path, text_path):
+    """
+    Extracts the image tower (pixel_values -> image_embeds) and the text tower
+    (input_ids, attention_mask -> text_embeds) into two standalone models, so
+    neither has to be fed dummy inputs for the other.
+    """
+    import onnx.utils
+
+    print(f"✂️  Splitting {model_path}")
+    onnx.utils.extract_model(model_path, vision_path, ["pixel_values"], ["image_embeds"])
+    print(f"   ✅ Vision: {vision_path} ({os.path.getsize(vision_path) / 1e6:.1f} MB)")
+    onnx.utils.extract_model(model_path, text_path, ["input_ids", "attention_mask"], ["text_embeds"])
+    print(f"   ✅ Text:   {text_path} ({os.path.getsize(text_path) / 1e6:.1f} MB)")
+
+
+def verify_split(model_path, vision_path, text_path, atol=1e-4):
+    """Runs the combined and split models on the same random input and compares outputs."""
+    import onnxruntime as ort
+
+    rng = np.random.default_rng(0)
+    pixels = rng.standard_normal((1, 3, config.INPUT_SIZE, config.INPUT_SIZE)).astype(np.float32)
+    ids = rng.integers(1, 49000, size=(1, 77), dtype=np.int64)
+    mask = np.ones((1, 77), dtype=np.int64)
+
+    providers = ['CPUExecutionProvider']
+    combined = ort.InferenceSession(model_path, providers=providers)
+    image_ref, text_ref = combined.run(
+        ["image_embeds", "text_embeds"],
+        {"pixel_values": pixels, "input_ids": ids, "attention_mask": mask}
+    )
+    del combined
+
+    image_out = ort.InferenceSession(vision_path, providers=providers).run(
+        ["image_embeds"], {"pixel_values": pixels})[0]
+    text_out = ort.InferenceSession(text_path, providers=providers).run(
+        ["text_embeds"], {"input_ids": ids, "attention_mask": mask})[0]
+
+    image_err = float(np.abs(image_out - image_ref).max())
+    text_err = float(np.abs(text_out - text_ref).max())
+    print(f"🔍 Max abs diff: image={image_err:.2e} text={text_err:.2e}")
+    if image_err > atol or text_err > atol:
+        raise SystemExit("❌ Split models do not match the combined model")
+
+
+# Symbolic batch dimension per graph input/output. The towers get separate names so
+# a combined graph can still be fed e.g. 8 images with a single dummy prompt.
+BATCH_DIMS = {
+    "pixel_values": "image_batch",
+    "image_embeds": "image_batch",
+    "input_ids": "text_batch",
+    "attention_mask": "text_batch",
+    "text_embeds": "text_batch",
+}
+
+
+def make_batch_dynamic(model_path, out_path):
+    """
+    Rewrites a batch=1 export so dim 0 of the inputs/outputs is symbolic.
+    The simplifier folded reshape targets into constants with a literal leading 1;
+    those are changed to 0 ("copy dim 0 from the input") so the batch flows through.
+    Anything else pinned to batch 1 is caught by verify_dynamic_batch.
+    """
+    import onnx
+    from onnx import numpy_helper
+
+    print(f"🔧 Patching batch axis: {model_path}")
+    model = onnx.load(model_path)
+    graph = model.graph
+
+    for value in list(graph.input) + list(graph.output):
+        if value.name in BATCH_DIMS:
+            dim = value.type.tensor_type.shape.dim[0]
+            dim.ClearField("dim_value")
+            dim.dim_param = BATCH_DIMS[value.name]
+
+    # Inferred intermediate shapes would pin the batch back to 1
+    del graph.value_info[:]
+
+    consumers = {}
+    for node in graph.node:
+        for name in node.input:
+            consumers.setdefault(name, []).append(node)
+
+    shape_tensors = {init.name: init for init in graph.initializer}
+    for node in graph.node:
+        if node.op_type == "Constant":
+            for attr in node.attribute:
+                if attr.name == "value":
+                    shape_tensors[node.output[0]] = attr.t
+
+    patched = 0
+    for node in graph.node:
+        if node.op_type != "Reshape" or node.input[1] not in shape_tensors:
+            continue
+        if any(a.name == "allowzero" and a.i == 1 for a in node.attribute):
+            continue
+        # Only touch shape constants that feed nothing but Reshape nodes
+        if any(c.op_type != "Reshape" for c in consumers[node.input[1]]):
+            continue
+
+        tensor = shape_tensors[node.input[1]]
+        shape = numpy_helper.to_array(tensor).copy()
+        if shape.ndim == 1 and len(shape) > 1 and shape[0] == 1:
+            shape[0] = 0
+            tensor.CopyFrom(numpy_helper.from_array(shape, tensor.name))
+            patched += 1
+
+    onnx.save(model, out_path)
+    print(f"   ✅ Saved {out_path} ({patched} reshape targets patched)")
+
+
+def export_from_hf(model_id, out_path, opset=17):
+    """Re-exports text_embeds/image_embeds from the HF checkpoint with dynamic batch axes."""
+    import torch
+    from transformers import CLIPModel
+
+    class EmbeddingHeads(torch.nn.Module):
+        def __init__(self, clip):
+            super().__init__()
+            self.clip = clip
+
+        def forward(self, input_ids, pixel_values, attention_mask):
+            out = self.clip(input_ids=input_ids, pixel_values=pixel_values, attention_mask=attention_mask)
+            return out.text_embeds, out.image_embeds
+
+    print(f"📦 Exporting {model_id} -> {out_path}")
+    model = EmbeddingHeads(CLIPModel.from_pretrained(model_id)).eval()
+    dummy = (
+        torch.zeros((1, 77), dtype=torch.long),
+        torch.zeros((1, 3, config.INPUT_SIZE, config.INPUT_SIZE), dtype=torch.float32),
+        torch.ones((1, 77), dtype=torch.long),
+    )
+    names_in = ["input_ids", "pixel_values", "attention_mask"]
+    names_out = ["text_embeds", "image_embeds"]
+    torch.onnx.export(
+        model, dummy, out_path,
+        input_names=names_in,
+        output_names=names_out,
+        dynamic_axes={name: {0: BATCH_DIMS[name]} for name in names_in + names_out},
+        opset_version=opset,
+    )
+    print(f"   ✅ Saved {out_path}")
+
+
+def verify_dynamic_batch(model_path, batch_size=4, atol=1e-4):
+    """
+    Runs batch_size items through one session.run and compares every row against
+    the single-item result. Returns True if all towers in the model agree.
+    """
+    import onnxruntime as ort
+
+    session = ort.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+    input_names = {i.name for i in session.get_inputs()}
+    rng = np.random.default_rng(0)
+
+    def feeds(n_images, n_texts):
+        f = {}
+        if "pixel_values" in input_names:
+            f["pixel_values"] = rng.standard_normal(
+                (n_images, 3, config.INPUT_SIZE, config.INPUT_SIZE)).astype(np.float32)
+        if "input_ids" in input_names:
+            f["input_ids"] = rng.integers(1, 49000, size=(n_texts, 77), dtype=np.int64)
+            f["attention_mask"] = np.ones((n_texts, 77), dtype=np.int64)
+        return f
+
+    ok = True
+    towers = [("image_embeds", "pixel_values", ["pixel_values"]),
+              ("text_embeds", "input_ids", ["input_ids", "attention_mask"])]
+    for output, probe, batched_inputs in towers:
+        if probe not in input_names:
+            continue
+        f = feeds(batch_size, 1) if probe == "pixel_values" else feeds(1, batch_size)
+        try:
+            batched = session.run([output], f)[0]
+        except Exception as e:
+            print(f"   ❌ {output}: batched run failed: {e}")
+            ok = False
+            continue
+
+        singles = []
+        for i in range(batch_size):
+            single = dict(f)
+            for name in batched_inputs:
+                single[name] = f[name][i:i + 1]
+            singles.append(session.run([output], single)[0])
+        err = float(np.abs(batched - np.vstack(singles)).max())
+        print(f"   🔍 {output}: batch={batch_size} max abs diff vs single-item = {err:.2e}")
+        ok = ok and err <= atol
+    return ok
+
+
+def quantize_model(model_path, out_path, variant):
+    """
+    int8: dynamic (weight-only int8, activations quantized at runtime) MatMul/Gemm.
+          The patch-embedding Conv stays fp32, ConvInteger is slow on most CPUs.
+    fp16: weights and compute in fp16 with fp32 inputs/outputs (needs
+          onnxconverter-common). Mostly useful for GPU; CPU kernels often upcast.
+    """
+    print(f"🗜️  {variant}: {model_path} -> {out_path}")
+    if variant == "int8":
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(
+            model_path, out_path,
+            op_types_to_quantize=["MatMul", "Gemm"],
+            weight_type=QuantType.QInt8,
+        )
+    elif variant == "fp16":
+        import onnx
+        from onnxconverter_common import float16
+        model = float16.convert_float_to_float16(onnx.load(model_path), keep_io_types=True)
+        onnx.save(model, out_path)
+    else:
+        raise ValueError(f"Unknown variant: {variant}")
+    print(f"   ✅ {os.path.getsize(model_path) / 1e6:.1f} MB -> {os.path.getsize(out_path) / 1e6:.1f} MB")
+
+
+def save_tokenizer(model_id, out_dir):
+    """Writes the HF tokenizer files (vocab.json, merges.txt, special_tokens_map.json, ...) to out_dir."""
+    from transformers import CLIPTokenizer
+    print(f"🔤 Tokenizer: {model_id} -> {out_dir}")
+    CLIPTokenizer.from_pretrained(model_id).save_pretrained(out_dir)
+
+
+def verify_tokenizer(model_id, tokenizer_dir):
+    """clip_tokenizer must give CLIPProcessor's input_ids/attention_mask on every vocabulary prompt."""
+    from transformers import CLIPProcessor
+    import clip_tokenizer
+    import vocabulary
+
+    processor = CLIPProcessor.from_pretrained(model_id)
+    ours = clip_tokenizer.CLIPTokenizer.from_dir(tokenizer_dir)
+    texts = vocabulary.unique_prompts(config.ATTRIBUTE_CANDIDATES) + [
+        "find my black leather jacket", "Denim / Indigo", "3/4 sleeve", "T-Shirt  with   LOGO!!",
+        "it's a y2k crop-top", "café au lait", "",
+    ]
+    ref = processor(text=texts, return_tensors="np", padding="max_length", max_length=77)
+    ids, mask = ours(texts)
+    bad = [
+        t for i, t in enumerate(texts)
+        if not (np.array_equal(ids[i], ref["input_ids"][i]) and np.array_equal(mask[i], ref["attention_mask"][i]))
+    ]
+    for t in bad[:10]:
+        print(f"   ❌ Mismatch: {t!r}")
+    print(f"   {'✅' if not bad else '❌'} {len(texts) - len(bad)}/{len(texts)} texts tokenize identically")
+    return not bad
+
+
+STUB_DIR = "models/stub"
+STUB_NAME = "fashionclip.stub"
+
+
+def stub_paths(out_dir=STUB_DIR):
+    """(combined, vision, text) model paths of the stand-in model in out_dir."""
+    base = os.path.join(out_dir, STUB_NAME)
+    return base + ".onnx", base + ".vision.onnx", base + ".text.onnx"
+
+
+def stub_env(out_dir=STUB_DIR):
+    """Environment that points config.py (models, caches, indexes) at the stand-in model in out_dir."""
+    combined, vision, text = stub_paths(out_dir)
+    return {
+        "MODEL_VARIANT": "fp32",
+        "ONNX_MODEL_PATH": combined,
+        "VISION_MODEL_PATH": vision,
+        "TEXT_MODEL_PATH": text,
+        "VOCAB_CACHE_PATH": os.path.join(out_dir, "text_embeds.npz"),
+        "ORT_OPTIMIZED_DIR": os.path.join(out_dir, "ort_cache"),
+        "INDEX_DIR": os.path.join(out_dir, "wardrobe_index"),
+        "VOCAB_FILE": "",
+    }
+
+
+def build_stub_model(out_dir=STUB_DIR, width=64, seed=0, embed_dim=512, opset=17):
+    """
+    Random-weight stand-in for the FashionCLIP export, for load tests and
+    benchmarks on machines without the real weights (no HF download either).
+    Same inputs/outputs as the real graph, with dynamic batch axes:
+    - vision: 32x32 patch conv -> ReLU -> mean pool -> projection -> L2 norm
+    - text:   token embedding -> masked mean pool -> projection -> L2 norm
+    Writes the combined model, its .vision/.text halves and tokenizer files
+    (CLIP's byte-level base vocabulary, no merges) for clip_tokenizer.py.
+    Numbers are meaningless; shapes, dtypes and the code paths are the real ones.
+    """
+    import json
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+    from clip_tokenizer import BOS, EOS, bytes_to_unicode
+
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Tokenizer: every byte as a token, alone and word-final, like the start of CLIP's vocab
+    chars = list(bytes_to_unicode().values())
+    vocab = {token: i for i, token in enumerate(chars + [c + "</w>" for c in chars] + [BOS, EOS])}
+    with open(os.path.join(out_dir, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f, ensure_ascii=False)
+    with open(os.path.join(out_dir, "merges.txt"), "w", encoding="utf-8") as f:
+        f.write("#version: 0.2\n")
+    with open(os.path.join(out_dir, "special_tokens_map.json"), "w", encoding="utf-8") as f:
+        json.dump({"bos_token": BOS, "eos_token": EOS, "pad_token": EOS}, f)
+
+    def weight(name, shape, scale=0.05):
+        return numpy_helper.from_array((rng.standard_normal(shape) * scale).astype(np.float32), name)
+
+    def value(name, elem_type, shape):
+        return helper.make_tensor_value_info(name, elem_type, [BATCH_DIMS[name]] + shape)
+
+    vision_nodes = [
+        helper.make_node("Conv", ["pixel_values", "patch_w", "patch_b"], ["patches"], strides=[32, 32]),
+        helper.make_node("Relu", ["patches"], ["patches_act"]),
+        helper.make_node("ReduceMean", ["patches_act"], ["image_pooled"], axes=[2, 3], keepdims=0),
+        helper.make_node("MatMul", ["image_pooled", "image_proj"], ["image_projected"]),
+        helper.make_node("LpNormalization", ["image_projected"], ["image_embeds"], axis=-1, p=2),
+    ]
+    vision_weights = [
+        weight("patch_w", [width, 3, 32, 32], 0.01), weight("patch_b", [width]),
+        weight("image_proj", [width, embed_dim]),
+    ]
+    text_nodes = [
+        helper.make_node("Gather", ["token_embedding", "input_ids"], ["tokens"]),
+        helper.make_node("Cast", ["attention_mask"], ["mask"], to=TensorProto.FLOAT),
+        helper.make_node("Unsqueeze", ["mask", "last_axis"], ["mask_3d"]),
+        helper.make_node("Mul", ["tokens", "mask_3d"], ["masked"]),
+        helper.make_node("ReduceSum", ["masked", "seq_axis"], ["token_sum"], keepdims=0),
+        helper.make_node("ReduceSum", ["mask_3d", "seq_axis"], ["token_count"], keepdims=0),
+        helper.make_node("Div", ["token_sum", "token_count"], ["text_pooled"]),
+        helper.make_node("MatMul", ["text_pooled", "text_proj"], ["text_projected"]),
+        helper.make_node("LpNormalization", ["text_projected"], ["text_embeds"], axis=-1, p=2),
+    ]
+    text_weights = [
+        weight("token_embedding", [len(vocab), width], 1.0),
+        weight("text_proj", [width, embed_dim]),
+        numpy_helper.from_array(np.array([-1], dtype=np.int64), "last_axis"),
+        numpy_helper.from_array(np.array([1], dtype=np.int64), "seq_axis"),
+    ]
+
+    pixel_in = value("pixel_values", TensorProto.FLOAT, [3, config.INPUT_SIZE, config.INPUT_SIZE])
+    ids_in = value("input_ids", TensorProto.INT64, [77])
+    mask_in = value("attention_mask", TensorProto.INT64, [77])
+    image_out = value("image_embeds", TensorProto.FLOAT, [embed_dim])
+    text_out = value("text_embeds", TensorProto.FLOAT, [embed_dim])
+
+    graphs = {
+        # Input order of the real export
+        stub_paths(out_dir)[0]: (vision_nodes + text_nodes, [ids_in, pixel_in, mask_in],
+                                 [text_out, image_out], vision_weights + text_weights),
+        stub_paths(out_dir)[1]: (vision_nodes, [pixel_in], [image_out], vision_weights),
+        stub_paths(out_dir)[2]: (text_nodes, [ids_in, mask_in], [text_out], text_weights),
+    }
+    for path, (nodes, inputs, outputs, weights) in graphs.items():
+        graph = helper.make_graph(nodes, os.path.basename(path), inputs, outputs, initializer=weights)
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", opset)])
+        model.ir_version = 8  # Loadable by older onnxruntime builds too
+        onnx.checker.check_model(model)
+        onnx.save(model, path)
+        print(f"   ✅ {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FashionCLIP ONNX model tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_split = sub.add_parser("split", help="Split into vision-only and text-only models")
+    p_split.add_argument("--model", default=config.ONNX_MODEL_PATH)
+    p_split.add_argument("--vision-out", default=config.VISION_MODEL_PATH)
+    p_split.add_argument("--text-out", default=config.TEXT_MODEL_PATH)
+    p_split.add_argument("--no-verify", action="store_true", help="Skip the numerical check")
+
+    p_dyn = sub.add_parser("dynamic-batch", help="Patch a batch=1 model to a dynamic batch axis")
+    p_dyn.add_argument("--model", default=config.ONNX_MODEL_PATH)
+    p_dyn.add_argument("--out", default=None, help="Output path (default: overwrite --model)")
+
+    p_export = sub.add_parser("export", help="Re-export from HF with a dynamic batch axis")
+    p_export.add_argument("--model-id", default=config.HF_MODEL_ID)
+    p_export.add_argument("--out", default=config.ONNX_MODEL_PATH)
+
+    p_quant = sub.add_parser("quantize", help="Write int8/fp16 copies of the fp32 model(s)")
+    p_quant.add_argument("--variant", choices=["int8", "fp16"], default="int8")
+    p_quant.add_argument("--model", action="append", default=None,
+                         help="fp32 model(s) to convert (default: combined + split halves that exist)")
+
+    p_tok = sub.add_parser("tokenizer", help="Bundle the CLIP tokenizer files next to the model")
+    p_tok.add_argument("--model-id", default=config.HF_MODEL_ID)
+    p_tok.add_argument("--out", default=os.path.dirname(config.TEXT_MODEL_PATH_FP32) or ".")
+
+    p_stub = sub.add_parser("stub", help="Random-weight stand-in model + tokenizer files (needs onnx)")
+    p_stub.add_argument("--out", default=STUB_DIR)
+    p_stub.add_argument("--width", type=int, default=64, help="Hidden width (compute cost) of both towers")
+    p_stub.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+
+    if args.command == "quantize":
+        sources = args.model or [
+            p for p in (config.ONNX_MODEL_PATH_FP32, config.VISION_MODEL_PATH_FP32, config.TEXT_MODEL_PATH_FP32)
+            if os.path.exists(p)
+        ]
+        for src in sources:
+            quantize_model(src, config.variant_path(src, args.variant), args.variant)
+    elif args.command == "dynamic-batch":
+        out = args.out or args.model
+        tmp = out + ".tmp"
+        make_batch_dynamic(args.model, tmp)
+        if not verify_dynamic_batch(tmp):
+            os.remove(tmp)
+            raise SystemExit("❌ Batched outputs differ from single-item outputs; "
+                             "use `onnx_tools.py export` to re-export instead")
+        os.replace(tmp, out)
+    elif args.command == "export":
+        export_from_hf(args.model_id, args.out)
+        if not verify_dynamic_batch(args.out):
+            raise SystemExit("❌ Batched outputs differ from single-item outputs")
+    elif args.command == "tokenizer":
+        save_tokenizer(args.model_id, args.out)
+        if not verify_tokenizer(args.model_id, args.out):
+            raise SystemExit("❌ clip_tokenizer.py differs from CLIPProcessor")
+    elif args.command == "stub":
+        print(f"🧪 Stand-in model -> {args.out}")
+        build_stub_model(args.out, width=args.width, seed=args.seed)
+    elif args.command == "split":
+        split_model(args.model, args.vision_out, args.text_out)
+        if not args.no_verify:
+            verify_split(args.model, args.vision_out, args.text_out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# preprocessing.py
+"""
+PIL + NumPy image preprocessing for the API, matching data_pipeline.py
+(MindSpore: Decode -> Resize(shorter side) -> CenterCrop -> Rescale -> Normalize -> HWC2CHW).
+"""
+import io
+import numpy as np
+from PIL import Image, ImageOps
+import config
+
+# Bump whenever preprocess_image output changes (part of the result cache key)
+PREPROCESS_VERSION = 2
+
+# uint8 value -> normalized float32, per channel: (v / 255 - mean) / std.
+# Normalization is then a single table lookup per pixel (no float64 temporaries).
+_NORMALIZE_LUT = (
+    (np.arange(256, dtype=np.float64)[:, None] / 255.0 - np.array(config.CLIP_MEAN))
+    / np.array(config.CLIP_STD)
+).astype(np.float32).T.copy()  # (3, 256)
+
+
+def preprocess_image(image_bytes: bytes) -> np.ndarray:
+    """
+    Encoded image bytes -> (1, 3, INPUT_SIZE, INPUT_SIZE) float32.
+    - JPEGs are decoded at a reduced scale (1/2 .. 1/8) when the shorter side
+      stays >= INPUT_SIZE, so 12 MP phone photos are never fully decoded.
+    - EXIF orientation is applied.
+    - Shorter side is resized to INPUT_SIZE and the center is cropped, like
+      the MindSpore pipeline (no aspect-ratio squash).
+    """
+    return image_to_tensor(decode_image(image_bytes))
+
+
+def decode_image(image_bytes: bytes) -> Image.Image:
+    """Encoded bytes -> upright RGB PIL image (JPEGs reduced on decode, see preprocess_image)."""
+    size = config.INPUT_SIZE
+    img = Image.open(io.BytesIO(image_bytes))
+
+    # Reduce-on-decode (no-op for non-JPEG formats)
+    img.draft('RGB', (size, size))
+    img.load()
+    img = ImageOps.exif_transpose(img)
+
+    # Convert to RGB
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return img
+
+
+def image_to_tensor(img: Image.Image) -> np.ndarray:
+    """Decoded RGB image -> (1, 3, INPUT_SIZE, INPUT_SIZE) float32 (resize, crop, normalize)."""
+    size = config.INPUT_SIZE
+
+    # Resize shorter side + center crop. Only the source region that ends up in
+    # the crop is resampled (resize `box`), the rest of the long side is skipped.
+    w, h = img.size
+    scale = size / min(w, h)
+    new_w, new_h = max(size, round(w * scale)), max(size, round(h * scale))
+    left, top = (new_w - size) // 2, (new_h - size) // 2
+    sx, sy = w / new_w, h / new_h
+    box = (left * sx, top * sy, (left + size) * sx, (top + size) * sy)
+    img = img.resize((size, size), Image.BILINEAR, box=box)
+
+    # Normalize + HWC to CHW in one float32 pass
+    hwc = np.asarray(img)
+    out = np.empty((1, 3, size, size), dtype=np.float32)
+    for c in range(3):
+        np.take(_NORMALIZE_LUT[c], hwc[:, :, c], out=out[0, c], mode='clip')
+    return out
+
+
+def preprocess_image_squash(image_bytes: bytes) -> np.ndarray:
+    """
+    Previous api_server implementation, kept as the benchmark baseline:
+    full decode, 224x224 squash (no crop), float64 normalization.
+    """
+    img = Image.open(io.BytesIO(image_bytes))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    img = img.resize((config.INPUT_SIZE, config.INPUT_SIZE), Image.BILINEAR)
+    img_np = np.array(img, dtype=np.float32)
+    img_np = img_np / 255.0
+    img_np = (img_np - np.array(config.CLIP_MEAN)) / np.array(config.CLIP_STD)
+    img_np = np.transpose(img_np, (2, 0, 1))
+    img_np = np.expand_dims(img_np, axis=0)
+    return img_np.astype(np.float32)